@@ -0,0 +1,296 @@
+import os
+import time
+import asyncio
+import ipaddress
+from collections import OrderedDict, deque
+from typing import Dict, Any, Optional
+
+# LLM calls (/chat requests and /ws/voice-agent messages)
+LLM_CLIENT_RATE = float(os.getenv("LLM_CLIENT_RATE", "1"))           # sustained calls/sec per client
+LLM_CLIENT_BURST = float(os.getenv("LLM_CLIENT_BURST", "10"))
+LLM_GLOBAL_RATE = float(os.getenv("LLM_GLOBAL_RATE", "20"))          # sustained calls/sec per worker
+LLM_GLOBAL_BURST = float(os.getenv("LLM_GLOBAL_BURST", "60"))
+LLM_MAX_CONCURRENT = int(os.getenv("LLM_ADMISSION_MAX_CONCURRENT", "32"))
+LLM_MAX_PER_CLIENT = int(os.getenv("LLM_ADMISSION_MAX_PER_CLIENT", "4"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_ADMISSION_MAX_QUEUE", "64"))
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv("LLM_ADMISSION_QUEUE_TIMEOUT_SECONDS", "5"))
+
+# Gemini Live sessions (/ws/agent); these are long-lived, so they never queue
+LIVE_CLIENT_RATE = float(os.getenv("LIVE_CLIENT_RATE", "0.05"))      # one new session per 20s per client
+LIVE_CLIENT_BURST = float(os.getenv("LIVE_CLIENT_BURST", "3"))
+LIVE_GLOBAL_RATE = float(os.getenv("LIVE_GLOBAL_RATE", "2"))
+LIVE_GLOBAL_BURST = float(os.getenv("LIVE_GLOBAL_BURST", "10"))
+LIVE_MAX_CONCURRENT = int(os.getenv("LIVE_ADMISSION_MAX_CONCURRENT", "20"))
+LIVE_MAX_PER_CLIENT = int(os.getenv("LIVE_ADMISSION_MAX_PER_CLIENT", "1"))
+
+# Per-client state is forgotten for the least recently seen clients beyond this
+ADMISSION_MAX_TRACKED_CLIENTS = int(os.getenv("ADMISSION_MAX_TRACKED_CLIENTS", "10000"))
+
+# Peers (IPs or CIDR ranges, comma-separated) allowed to name the caller for
+# us: a reverse proxy's X-Forwarded-For, or an authenticating gateway's
+# X-Client-Id. From anyone else those headers are ignored.
+ADMISSION_TRUSTED_PROXIES = os.getenv("ADMISSION_TRUSTED_PROXIES", "")
+
+# WebSocket close code for "try again later" (RFC 6455)
+WS_TRY_AGAIN_LATER = 1013
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated_at")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_take(self, amount: float = 1.0) -> float:
+        """Takes tokens if available. Returns 0.0 on success, else seconds until they would be."""
+        now = time.monotonic()
+        self._refill(now)
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return 0.0
+        if self.rate <= 0:
+            return float("inf")
+        return (amount - self.tokens) / self.rate
+
+    def give_back(self, amount: float = 1.0):
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class AdmissionRejected(Exception):
+    """
+    Raised when a request is shed. reason is one of client_rate, global_rate,
+    client_concurrency, overloaded or queue_timeout.
+    """
+
+    def __init__(self, reason: str, retry_after: float = 1.0):
+        self.reason = reason
+        self.retry_after = max(1, int(retry_after + 0.999)) if retry_after != float("inf") else 60
+        super().__init__(f"Request rejected: {reason}")
+
+
+class _Client:
+    __slots__ = ("bucket", "active")
+
+    def __init__(self, bucket: TokenBucket):
+        self.bucket = bucket
+        self.active = 0
+
+
+class Ticket:
+    """An admitted unit of work. Release it (or use `async with`) when done."""
+
+    __slots__ = ("_controller", "client_id", "_released")
+
+    def __init__(self, controller, client_id: str):
+        self._controller = controller
+        self.client_id = client_id
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._controller._release(self.client_id)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.release()
+
+
+class AdmissionController:
+    """
+    Decides whether a unit of work may start.
+
+    1. Rate: the client's token bucket, then the global one. Running out
+       fails immediately with a retry-after hint.
+    2. Concurrency: at most max_per_client running per client and
+       max_concurrent overall. Past the global limit, callers wait in a FIFO
+       queue of at most max_queue entries for up to queue_timeout seconds;
+       a full queue sheds immediately.
+
+    Everything runs on the event loop, so no locking is needed.
+    """
+
+    def __init__(self, name: str, client_rate: float, client_burst: float, global_rate: float,
+                 global_burst: float, max_concurrent: int, max_per_client: int, max_queue: int = 0,
+                 queue_timeout: float = 0.0, max_tracked_clients: int = ADMISSION_MAX_TRACKED_CLIENTS):
+        self.name = name
+        self.client_rate = client_rate
+        self.client_burst = client_burst
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.max_concurrent = max_concurrent
+        self.max_per_client = max_per_client
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_tracked_clients = max_tracked_clients
+        self._clients = OrderedDict()  # client_id -> _Client, least recently seen first
+        self._waiters = deque()  # futures of callers waiting for a slot
+        self.active = 0
+        self.admitted = 0
+        self.rejected = {}
+
+    def _client(self, client_id: str) -> _Client:
+        client = self._clients.get(client_id)
+        if client is None:
+            client = self._clients[client_id] = _Client(TokenBucket(self.client_rate, self.client_burst))
+            self._evict_idle_clients()
+        else:
+            self._clients.move_to_end(client_id)
+        return client
+
+    def _evict_idle_clients(self):
+        if len(self._clients) <= self.max_tracked_clients:
+            return
+        for client_id in list(self._clients):
+            if len(self._clients) <= self.max_tracked_clients:
+                break
+            if self._clients[client_id].active == 0:
+                del self._clients[client_id]
+
+    def _reject(self, reason: str, retry_after: float = 1.0):
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        raise AdmissionRejected(reason, retry_after)
+
+    def check_rate(self, client_id: str):
+        """Spends one token from the client and global buckets or raises AdmissionRejected."""
+        client = self._client(client_id)
+        wait = client.bucket.try_take()
+        if wait:
+            self._reject("client_rate", wait)
+        wait = self.global_bucket.try_take()
+        if wait:
+            client.bucket.give_back()
+            self._reject("global_rate", wait)
+
+    def check_capacity(self, client_id: str):
+        """Fails fast if a slot request would certainly be rejected right now."""
+        if self._client(client_id).active >= self.max_per_client:
+            self._reject("client_concurrency")
+        if self.active >= self.max_concurrent and len(self._waiters) >= self.max_queue:
+            self._reject("overloaded")
+
+    async def acquire(self, client_id: str) -> Ticket:
+        """Waits (bounded) for a concurrency slot; raises AdmissionRejected if none comes."""
+        self.check_capacity(client_id)
+        client = self._client(client_id)
+
+        if self.active >= self.max_concurrent:
+            future = asyncio.get_running_loop().create_future()
+            self._waiters.append(future)
+            try:
+                await asyncio.wait_for(future, timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                self._reject("queue_timeout", self.queue_timeout)
+            except asyncio.CancelledError:
+                # A slot handed over just as we were cancelled must be passed on
+                if future.done() and not future.cancelled():
+                    self._release(None)
+                raise
+            finally:
+                if future in self._waiters:
+                    self._waiters.remove(future)
+            # The releasing caller handed its slot to us (active was not decremented)
+        else:
+            self.active += 1
+
+        client.active += 1
+        self.admitted += 1
+        return Ticket(self, client_id)
+
+    async def admit(self, client_id: str) -> Ticket:
+        """check_rate + acquire: the usual entry point for one unit of work."""
+        self.check_rate(client_id)
+        return await self.acquire(client_id)
+
+    def _release(self, client_id: str):
+        client = self._clients.get(client_id)
+        if client is not None:
+            client.active = max(0, client.active - 1)
+
+        # Hand the slot straight to the next live waiter, if any
+        while self._waiters:
+            future = self._waiters.popleft()
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active = max(0, self.active - 1)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "max_concurrent": self.max_concurrent,
+            "queued": len(self._waiters),
+            "max_queue": self.max_queue,
+            "tracked_clients": len(self._clients),
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+        }
+
+
+def _parse_networks(spec: str):
+    networks = []
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if entry:
+            networks.append(ipaddress.ip_network(entry, strict=False))
+    return tuple(networks)
+
+
+_trusted_proxies = _parse_networks(ADMISSION_TRUSTED_PROXIES)
+
+
+def _is_trusted_proxy(host: Optional[str]) -> bool:
+    if not host or not _trusted_proxies:
+        return False
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return any(address in network for network in _trusted_proxies)
+
+
+def client_id_for(connection) -> str:
+    """
+    Identifies the caller of an HTTP request or websocket for admission.
+
+    Limits must hold against a caller that rotates whatever it controls, so
+    the key is the peer address. Only when the peer is a trusted proxy
+    (ADMISSION_TRUSTED_PROXIES) do its X-Client-Id header or client_id
+    query parameter (an identity it authenticated) and X-Forwarded-For
+    count. From X-Forwarded-For the nearest hop that is not itself a
+    trusted proxy is used; anything left of it was supplied by the client.
+    """
+    host = connection.client.host if connection.client else None
+    if not _is_trusted_proxy(host):
+        return host or "unknown"
+    client_id = connection.headers.get("x-client-id") or connection.query_params.get("client_id")
+    if client_id:
+        return "id:" + client_id[:128]
+    forwarded = connection.headers.get("x-forwarded-for")
+    if forwarded:
+        for hop in reversed([hop.strip() for hop in forwarded.split(",")]):
+            if hop and not _is_trusted_proxy(hop):
+                return hop[:64]
+    return host
+
+
+def create_llm_admission() -> AdmissionController:
+    return AdmissionController(
+        "llm", LLM_CLIENT_RATE, LLM_CLIENT_BURST, LLM_GLOBAL_RATE, LLM_GLOBAL_BURST,
+        LLM_MAX_CONCURRENT, LLM_MAX_PER_CLIENT, LLM_MAX_QUEUE, LLM_QUEUE_TIMEOUT_SECONDS,
+    )
+
+
+def create_live_admission() -> AdmissionController:
+    return AdmissionController(
+        "live", LIVE_CLIENT_RATE, LIVE_CLIENT_BURST, LIVE_GLOBAL_RATE, LIVE_GLOBAL_BURST,
+        LIVE_MAX_CONCURRENT, LIVE_MAX_PER_CLIENT,
+    )
@@ -0,0 +1,372 @@
+import os
+import re
+import time
+import threading
+from array import array
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional
+
+from bm25_index import tokenize
+from review_store import to_rating, to_timestamp
+
+# Window of the "recent" figures (trend questions can ask for other windows)
+AGGREGATES_TREND_DAYS = int(os.getenv("AGGREGATES_TREND_DAYS", "30"))
+# Topics listed in a summary
+AGGREGATES_TOP_TOPICS = int(os.getenv("AGGREGATES_TOP_TOPICS", "5"))
+
+DAY = 86400
+
+# Complaint / praise themes, matched on review tokens (see bm25_index.tokenize)
+TOPICS = {
+    "crashes": ("crash", "crashes", "crashed", "crashing", "freeze", "freezes", "freezing", "frozen", "closes"),
+    "performance": ("slow", "lag", "lags", "laggy", "loading", "hangs", "stuck", "performance"),
+    "battery": ("battery", "drain", "drains", "draining", "overheat", "overheating", "heating"),
+    "login": ("login", "log", "signin", "sign", "password", "otp", "account", "verification"),
+    "ads": ("ad", "ads", "advert", "adverts", "advertisement", "advertisements", "popup", "popups"),
+    "pricing": ("price", "pricing", "expensive", "subscription", "premium", "pay", "paid", "refund", "money"),
+    "bugs": ("bug", "bugs", "buggy", "glitch", "glitches", "error", "errors", "broken"),
+    "ui": ("ui", "design", "interface", "layout", "theme", "font", "navigation"),
+    "notifications": ("notification", "notifications", "alert", "alerts"),
+    "sync": ("sync", "syncing", "backup", "restore", "lost"),
+    "updates": ("update", "updates", "updated", "version"),
+    "support": ("support", "customer", "service", "response", "reply"),
+}
+TOPIC_NAMES = tuple(TOPICS)
+_TOPIC_BITS = {keyword: 1 << index for index, keywords in enumerate(TOPICS.values()) for keyword in keywords}
+
+# Questions a table of counts answers as well as a model would
+_RATING_QUESTION = re.compile(
+    r"\b(rating|ratings|stars?|score)\b.*\b(distribution|breakdown|split|average|mean|overall)\b"
+    r"|\b(average|mean|overall|distribution|breakdown)\b.*\b(rating|ratings|stars?|score)\b"
+    r"|\bhow many (\d )?stars?\b")
+_COMPLAINT_QUESTION = re.compile(
+    r"\b(top|main|most common|biggest|frequent|common|most mentioned)\b.*"
+    r"\b(complaints?|issues?|problems?|themes?|topics?)\b")
+_TREND_QUESTION = re.compile(
+    r"\b(trend|trending|over time|per week|weekly|(last|past) \d+ (days?|weeks?)|(last|past|this) (week|month))\b")
+# ...unless they ask for reasons or advice
+_NEEDS_MODEL = re.compile(
+    r"\b(why|explain|suggest|recommend|advice|should|improve|fix|compare|summari[sz]e|what do users say)\b"
+    r"|\bhow (can|do|could|to)\b")
+_WINDOW = re.compile(r"\b(?:last|past) (\d+) (days?|weeks?)\b|\b(?:last|past|this) (week|month)\b")
+# ...and only when nothing narrows them beyond an app or a trend window: a
+# word outside this list ("crashes", "dashboard", "2023", "android") is a
+# topic, term or date the counts can't filter on, so the model answers,
+# with the statistics in its prompt
+_STATISTICAL_WORDS = frozenset("""
+    what what's whats which how many much is are was were do does did has have had been there
+    show me give tell list get please the a an of for in on at to by per and or so far it its it's
+    this my our app app's apps all overall total number count current currently now users user
+    people customers reviewers reviews review rated
+    rating ratings star stars score scores distribution breakdown split average mean 1 2 3 4 5
+    top main most common biggest frequent frequently mentioned complaint complaints complain
+    complaining about issue issues problem problems theme themes topic topics negative report reported
+    trend trends trending over time week weeks weekly month months monthly day days daily last past
+    recent recently change changed changes changing volume going up down
+""".split())
+_WORD = re.compile(r"[a-z0-9']+")
+
+
+def _is_unscoped(text: str) -> bool:
+    # A "last N days/weeks" window is something the trend figures do filter on
+    return all(word in _STATISTICAL_WORDS for word in _WORD.findall(_WINDOW.sub(" ", text)))
+
+
+def classify_question(question: str) -> Optional[str]:
+    """
+    'ratings', 'complaints' or 'trend' for purely statistical questions
+    about a whole app (or all apps), else None.
+    """
+    text = question.lower().replace("\u2019", "'")
+    if _NEEDS_MODEL.search(text) or not _is_unscoped(text):
+        return None
+    if _TREND_QUESTION.search(text):
+        return "trend"
+    if _COMPLAINT_QUESTION.search(text):
+        return "complaints"
+    if _RATING_QUESTION.search(text):
+        return "ratings"
+    return None
+
+
+def _window_days(question: str) -> int:
+    match = _WINDOW.search(question.lower())
+    if not match:
+        return AGGREGATES_TREND_DAYS
+    if match.group(1):
+        return int(match.group(1)) * (7 if match.group(2).startswith("week") else 1)
+    return 7 if match.group(3) == "week" else 30
+
+
+def topic_mask(text: str) -> int:
+    mask = 0
+    for token in tokenize(text):
+        mask |= _TOPIC_BITS.get(token, 0)
+    return mask
+
+
+class _AppStats:
+    __slots__ = ("ratings", "days", "topics")
+
+    def __init__(self):
+        self.ratings = [0] * 6  # index 0: unrated
+        self.days = {}  # day number -> [reviews, rating sum]
+        self.topics = [[0, 0, 0] for _ in TOPIC_NAMES]  # [reviews, rating sum, 1-2★ reviews]
+
+    def apply(self, rating: int, day: int, mask: int, sign: int):
+        self.ratings[rating] += sign
+        if day >= 0:
+            counts = self.days.setdefault(day, [0, 0])
+            counts[0] += sign
+            counts[1] += sign * rating
+            if counts[0] == 0:
+                del self.days[day]
+        index = 0
+        while mask:
+            if mask & 1:
+                counts = self.topics[index]
+                counts[0] += sign
+                counts[1] += sign * rating
+                if 1 <= rating <= 2:
+                    counts[2] += sign
+            mask >>= 1
+            index += 1
+
+
+class ReviewAggregates:
+    """
+    Per-app review counts by rating, by day and by topic, kept current
+    from the review store's change feed (subscribe), so reading them costs
+    nothing per review.
+
+    Every review's contribution (app, rating, day, topics) is remembered in
+    compact columns, so an edit or delete subtracts exactly what it added.
+    """
+
+    def __init__(self, store=None):
+        self.store = store
+        self._lock = threading.RLock()
+        self._apps = {}  # app id -> _AppStats
+        self._app_names = []
+        self._app_index = {}
+        self._slot_by_id = {}
+        self._free_slots = []
+        self._slot_apps = array("I")
+        self._slot_ratings = array("b")
+        self._slot_days = array("i")
+        self._slot_topics = array("I")
+        if store is not None:
+            store.subscribe(self._on_store_change)
+
+    def __len__(self) -> int:
+        return len(self._slot_by_id)
+
+    # -- writes ---------------------------------------------------------------
+
+    def _on_store_change(self, upserted: List[Dict[str, Any]], removed: List[str]):
+        with self._lock:
+            for review_id in removed:
+                self._remove(review_id)
+            for review in upserted:
+                self._add(review["id"], review)
+
+    def add(self, review_id, review: Dict[str, Any]):
+        with self._lock:
+            self._add(str(review_id), review)
+
+    def remove(self, review_id):
+        with self._lock:
+            self._remove(str(review_id))
+
+    def _app_slot(self, app_id) -> int:
+        app_id = str(app_id or "")
+        index = self._app_index.get(app_id)
+        if index is None:
+            index = self._app_index[app_id] = len(self._app_names)
+            self._app_names.append(app_id)
+            self._apps[app_id] = _AppStats()
+        return index
+
+    def _add(self, review_id: str, review: Dict[str, Any]):
+        self._remove(review_id)
+        app = self._app_slot(review.get("appId"))
+        rating = to_rating(review.get("score"))
+        timestamp = to_timestamp(review.get("date") or review.get("updatedAt"))
+        day = int(timestamp // DAY) if timestamp > 0 else -1
+        mask = topic_mask(review.get("text") or review.get("content") or "")
+        self._apps[self._app_names[app]].apply(rating, day, mask, 1)
+
+        if self._free_slots:
+            slot = self._free_slots.pop()
+            self._slot_apps[slot] = app
+            self._slot_ratings[slot] = rating
+            self._slot_days[slot] = day
+            self._slot_topics[slot] = mask
+        else:
+            slot = len(self._slot_apps)
+            self._slot_apps.append(app)
+            self._slot_ratings.append(rating)
+            self._slot_days.append(day)
+            self._slot_topics.append(mask)
+        self._slot_by_id[review_id] = slot
+
+    def _remove(self, review_id: str):
+        slot = self._slot_by_id.pop(review_id, None)
+        if slot is None:
+            return
+        stats = self._apps[self._app_names[self._slot_apps[slot]]]
+        stats.apply(self._slot_ratings[slot], self._slot_days[slot], self._slot_topics[slot], -1)
+        self._free_slots.append(slot)
+
+    # -- reads ----------------------------------------------------------------
+
+    def _selected(self, app_id: Optional[str]) -> List[_AppStats]:
+        if app_id is None:
+            return list(self._apps.values())
+        stats = self._apps.get(str(app_id))
+        return [stats] if stats is not None else []
+
+    def summary(self, app_id: Optional[str] = None, days: int = AGGREGATES_TREND_DAYS,
+                now: Optional[float] = None, top_topics: int = AGGREGATES_TOP_TOPICS) -> Dict[str, Any]:
+        """Rating distribution, top topics and the last `days` days vs the `days` before, for one app or all."""
+        now = time.time() if now is None else now
+        today = int(now // DAY)
+        with self._lock:
+            selected = self._selected(app_id)
+            ratings = [sum(stats.ratings[rating] for stats in selected) for rating in range(6)]
+            topics = [[sum(stats.topics[index][field] for stats in selected) for field in range(3)]
+                      for index in range(len(TOPIC_NAMES))]
+            window = [0, 0, 0, 0]  # reviews, rating sum: this window, previous window
+            weeks = {}
+            for stats in selected:
+                for day, (count, rating_sum) in stats.days.items():
+                    age = today - day
+                    if 0 <= age < days:
+                        window[0] += count
+                        window[1] += rating_sum
+                        week = weeks.setdefault(age // 7, [0, 0])
+                        week[0] += count
+                        week[1] += rating_sum
+                    elif days <= age < 2 * days:
+                        window[2] += count
+                        window[3] += rating_sum
+
+        total = sum(ratings)
+        rated = total - ratings[0]
+        rating_sum = sum(rating * ratings[rating] for rating in range(1, 6))
+
+        def average(rating_sum, count):
+            return round(rating_sum / count, 2) if count else None
+
+        topic_rows = [
+            {"topic": name, "reviews": count, "share": round(count / total, 3) if total else 0.0,
+             "average_rating": average(topic_rating_sum, count), "negative": negative}
+            for name, (count, topic_rating_sum, negative) in zip(TOPIC_NAMES, topics) if count
+        ]
+        return {
+            "app_id": app_id,
+            "reviews": total,
+            "average_rating": average(rating_sum, rated),
+            "ratings": {str(rating): ratings[rating] for rating in range(1, 6)},
+            "topics": sorted(topic_rows, key=lambda row: row["reviews"], reverse=True)[:top_topics],
+            "complaints": sorted((row for row in topic_rows if row["negative"]),
+                                 key=lambda row: row["negative"], reverse=True)[:top_topics],
+            "recent": {
+                "days": days,
+                "reviews": window[0],
+                "average_rating": average(window[1], window[0]),
+                "previous_reviews": window[2],
+                "previous_average_rating": average(window[3], window[2]),
+                "weeks": [
+                    {"week_start": _date(today - age_weeks * 7 - 6), "reviews": count,
+                     "average_rating": average(week_rating_sum, count)}
+                    for age_weeks, (count, week_rating_sum) in sorted(weeks.items(), reverse=True)
+                ],
+            },
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "reviews": len(self._slot_by_id),
+                "apps": len(self._apps),
+                "slot_bytes": len(self._slot_apps) * (4 + 1 + 4 + 4),
+            }
+
+
+def _date(day: int) -> str:
+    return datetime.fromtimestamp(day * DAY, tz=timezone.utc).date().isoformat()
+
+
+def _stars(value) -> str:
+    return f"{value:.1f}★" if value is not None else "n/a"
+
+
+def format_summary(summary: Dict[str, Any]) -> str:
+    """A few compact lines of statistics for a prompt."""
+    total = summary["reviews"]
+    if not total:
+        return ""
+    distribution = ", ".join(
+        f"{rating}★ {count / total:.0%}" for rating, count in sorted(summary["ratings"].items(), reverse=True))
+    lines = [f"{total:,} reviews, average {_stars(summary['average_rating'])} ({distribution})"]
+    if summary["topics"]:
+        lines.append("Most mentioned: " + ", ".join(
+            f"{row['topic']} {row['share']:.0%} ({_stars(row['average_rating'])})" for row in summary["topics"]))
+    if summary["complaints"]:
+        lines.append("Top complaints (1-2★ reviews): " + ", ".join(
+            f"{row['topic']} {row['negative']:,}" for row in summary["complaints"]))
+    recent = summary["recent"]
+    if recent["reviews"] or recent["previous_reviews"]:
+        lines.append(
+            f"Last {recent['days']} days: {recent['reviews']:,} reviews, average {_stars(recent['average_rating'])} "
+            f"(previous {recent['days']} days: {recent['previous_reviews']:,}, "
+            f"{_stars(recent['previous_average_rating'])})")
+    return "\n".join(lines)
+
+
+def answer_directly(aggregates: ReviewAggregates, question: str, app_id: Optional[str] = None,
+                    now: Optional[float] = None) -> Optional[str]:
+    """
+    Answers rating-distribution, top-complaint and trend questions from the
+    aggregates. None for anything else (or without data): ask the model.
+    """
+    kind = classify_question(question)
+    if kind is None:
+        return None
+    summary = aggregates.summary(app_id, days=_window_days(question) if kind == "trend" else AGGREGATES_TREND_DAYS,
+                                 now=now)
+    total = summary["reviews"]
+    if not total:
+        return None
+    scope = f"app {app_id}" if app_id else "all apps"
+
+    if kind == "ratings":
+        distribution = ", ".join(
+            f"{rating}★: {count:,} ({count / total:.0%})"
+            for rating, count in sorted(summary["ratings"].items(), reverse=True))
+        return (f"Across {total:,} reviews for {scope}, the average rating is "
+                f"{_stars(summary['average_rating'])}. Distribution: {distribution}.")
+
+    if kind == "complaints":
+        if not summary["complaints"]:
+            return None
+        negative = summary["ratings"]["1"] + summary["ratings"]["2"]
+        themes = ", ".join(
+            f"{row['topic']} ({row['negative']:,} of {negative:,} 1-2★ reviews)" for row in summary["complaints"])
+        return f"The most common complaint themes for {scope} are: {themes}."
+
+    recent = summary["recent"]
+    if not recent["reviews"]:
+        return f"There are no reviews for {scope} in the last {recent['days']} days."
+    answer = (f"In the last {recent['days']} days {scope} received {recent['reviews']:,} reviews, "
+              f"average {_stars(recent['average_rating'])}")
+    if recent["previous_reviews"]:
+        answer += (f", compared with {recent['previous_reviews']:,} reviews averaging "
+                   f"{_stars(recent['previous_average_rating'])} in the {recent['days']} days before")
+    answer += "."
+    if len(recent["weeks"]) > 1:
+        answer += " By week: " + ", ".join(
+            f"{week['week_start']}: {week['reviews']:,} ({_stars(week['average_rating'])})"
+            for week in recent["weeks"]) + "."
+    return answer
@@ -0,0 +1,230 @@
+import os
+import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Callable
+
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "600"))
+# Also match near-duplicate phrasings by embedding similarity (ANSWER_CACHE_SEMANTIC=0 to disable)
+ANSWER_CACHE_SEMANTIC = os.getenv("ANSWER_CACHE_SEMANTIC", "1") == "1"
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.92"))
+# Share of retrieved reviews a similar question must have in common (Jaccard) to reuse an answer
+ANSWER_CACHE_MIN_OVERLAP = float(os.getenv("ANSWER_CACHE_MIN_OVERLAP", "0.5"))
+
+# Question embeddings remembered between get() and the put() that follows a miss
+_RECENT_EMBEDDINGS = 256
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_question(question: str) -> str:
+    """Lowercases and strips punctuation/extra whitespace so trivial variants share a key."""
+    question = _PUNCTUATION.sub(" ", question.lower())
+    return _WHITESPACE.sub(" ", question).strip()
+
+
+def review_digests(reviews: List[Dict[str, Any]]) -> frozenset:
+    """One digest per retrieved review, over its identity and content (not its retrieval score)."""
+    return frozenset(
+        hashlib.sha1(
+            f"{r.get('id', '')}\x1f{r.get('score', '')}\x1f{r.get('text', '')}\x1f{r.get('error', '')}\x1f{r.get('message', '')}"
+            .encode("utf-8")
+        ).hexdigest()
+        for r in (reviews or []) if isinstance(r, dict)
+    )
+
+
+def fingerprint_reviews(reviews: List[Dict[str, Any]]) -> str:
+    """
+    Hashes the identity and content of the retrieved reviews. Any added,
+    removed or edited review changes the fingerprint, which invalidates the
+    answers built from the old set. Retrieval scores are ignored on purpose.
+    """
+    digest = hashlib.sha1()
+    for part in sorted(review_digests(reviews)):
+        digest.update(part.encode("ascii"))
+    return digest.hexdigest()
+
+
+def answer_key(question: str, reviews: List[Dict[str, Any]], app_id: Optional[str] = None,
+               statistics: str = "") -> tuple:
+    """
+    Everything an answer depends on besides the model: the normalised
+    question, the app it was scoped to, the retrieved reviews and the
+    statistics block of the prompt. Also keys in-flight generations.
+    """
+    statistics_digest = hashlib.sha1(statistics.encode("utf-8")).hexdigest() if statistics else ""
+    return normalize_question(question), app_id or "", fingerprint_reviews(reviews), statistics_digest
+
+
+def _scope(key: tuple) -> tuple:
+    # Similar questions may share an answer only within one app and statistics block
+    _, app_id, _, statistics_digest = key
+    return app_id, statistics_digest
+
+
+def _overlap(a: frozenset, b: frozenset) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class _Entry:
+    __slots__ = ("answer", "expires_at", "embedding", "reviews")
+
+    def __init__(self, answer, expires_at, embedding, reviews):
+        self.answer = answer
+        self.expires_at = expires_at
+        self.embedding = embedding
+        self.reviews = reviews  # review_digests() of the reviews it was answered from
+
+
+class AnswerCache:
+    """
+    LRU + TTL cache of generated answers, keyed by answer_key(): the
+    normalised question, app, fingerprint of the reviews it was answered
+    from and the statistics it was given.
+
+    With an embed function, a miss on the exact key falls back to the most
+    similar cached question for the same app and statistics whose retrieved
+    reviews overlap this one's by at least min_overlap. Rephrasings rarely
+    retrieve exactly the same reviews, so an identical set is not required.
+    """
+
+    def __init__(self, max_entries: int = ANSWER_CACHE_SIZE, ttl_seconds: float = ANSWER_CACHE_TTL_SECONDS,
+                 embed: Optional[Callable[[List[str]], List[List[float]]]] = None,
+                 similarity_threshold: float = ANSWER_CACHE_SIMILARITY,
+                 min_overlap: float = ANSWER_CACHE_MIN_OVERLAP):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.embed = embed
+        self.similarity_threshold = similarity_threshold
+        self.min_overlap = min_overlap
+        self._entries = OrderedDict()  # answer_key() -> _Entry
+        self._by_scope = {}  # (app, statistics) -> set of keys, for similarity lookups
+        self._embeddings = OrderedDict()  # question -> embedding, so put() reuses get()'s
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def semantic(self) -> bool:
+        return self.embed is not None
+
+    def get(self, question: str, reviews: List[Dict[str, Any]], app_id: Optional[str] = None,
+            statistics: str = "") -> Optional[str]:
+        key = answer_key(question, reviews, app_id, statistics)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry.answer
+                self._remove(key)
+                self.expirations += 1
+
+            candidates = list(self._by_scope.get(_scope(key), ()))
+
+        if self.embed is not None and candidates:
+            answer = self._get_similar(key[0], review_digests(reviews), candidates, now)
+            if answer is not None:
+                return answer
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _get_similar(self, normalized: str, reviews: frozenset, candidates, now: float) -> Optional[str]:
+        # Overlap is a cheap set comparison; only entries that pass it are scored
+        with self._lock:
+            candidates = [key for key in candidates
+                          if key in self._entries and _overlap(reviews, self._entries[key].reviews) >= self.min_overlap]
+        if not candidates:
+            return None
+        query_vector = self._embedding(normalized)
+        best_key, best_score = None, self.similarity_threshold
+
+        with self._lock:
+            for key in candidates:
+                entry = self._entries.get(key)
+                if entry is None or entry.embedding is None or entry.expires_at <= now:
+                    continue
+                score = sum(a * b for a, b in zip(query_vector, entry.embedding))
+                if score >= best_score:
+                    best_key, best_score = key, score
+
+            if best_key is None:
+                return None
+            self._entries.move_to_end(best_key)
+            self.hits += 1
+            self.semantic_hits += 1
+            return self._entries[best_key].answer
+
+    def _embedding(self, normalized: str):
+        with self._lock:
+            vector = self._embeddings.get(normalized)
+        if vector is None:
+            vector = self.embed([normalized])[0]
+            with self._lock:
+                self._embeddings[normalized] = vector
+                while len(self._embeddings) > _RECENT_EMBEDDINGS:
+                    self._embeddings.popitem(last=False)
+        return vector
+
+    def put(self, question: str, reviews: List[Dict[str, Any]], answer: str, app_id: Optional[str] = None,
+            statistics: str = ""):
+        key = answer_key(question, reviews, app_id, statistics)
+        embedding = self._embedding(key[0]) if self.embed is not None else None
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _Entry(answer, time.monotonic() + self.ttl_seconds, embedding,
+                                        review_digests(reviews))
+            self._by_scope.setdefault(_scope(key), set()).add(key)
+
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key):
+        if self._entries.pop(key, None) is None:
+            return
+        keys = self._by_scope.get(_scope(key))
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_scope[_scope(key)]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_scope.clear()
+            self._embeddings.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "semantic": self.semantic,
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
@@ -0,0 +1,242 @@
+import os
+import time
+import asyncio
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+# PCM16 mono from the browser's AudioWorklet (client/public/audio-processor.js)
+AUDIO_INPUT_SAMPLE_RATE = int(os.getenv("AUDIO_INPUT_SAMPLE_RATE", "16000"))
+AUDIO_SAMPLE_WIDTH = 2
+# Mic audio is forwarded to Gemini in buffers of this duration
+AUDIO_BATCH_MS = int(os.getenv("AUDIO_BATCH_MS", "100"))
+# Queue bounds, in items (input items are AUDIO_BATCH_MS buffers)
+AUDIO_INPUT_QUEUE_SIZE = int(os.getenv("AUDIO_INPUT_QUEUE_SIZE", "20"))
+AUDIO_OUTPUT_QUEUE_SIZE = int(os.getenv("AUDIO_OUTPUT_QUEUE_SIZE", "64"))
+# A coalesced output item never grows past this many bytes
+AUDIO_MAX_OUTPUT_CHUNK_BYTES = int(os.getenv("AUDIO_MAX_OUTPUT_CHUNK_BYTES", "65536"))
+
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+COALESCE = "coalesce"
+
+# Smoothing factor for the queue-wait moving average
+_EWMA_ALPHA = 0.1
+
+
+def batch_bytes_for(duration_ms: int, sample_rate: int = AUDIO_INPUT_SAMPLE_RATE) -> int:
+    """Size in bytes of duration_ms of PCM16 mono audio (whole samples)."""
+    return max(AUDIO_SAMPLE_WIDTH, sample_rate * duration_ms // 1000 * AUDIO_SAMPLE_WIDTH)
+
+
+class FrameBatcher:
+    """
+    Packs small PCM frames into fixed-size buffers.
+
+    Frames are copied straight into preallocated bytearrays taken from a
+    pool; a full buffer is handed out as a memoryview and must be given back
+    with recycle() once it has been sent. Steady-state batching therefore
+    allocates nothing per frame.
+    """
+
+    def __init__(self, batch_bytes: int, pool_size: int = AUDIO_INPUT_QUEUE_SIZE + 2):
+        self.batch_bytes = batch_bytes
+        self._pool = [bytearray(batch_bytes) for _ in range(pool_size)]
+        self._current = None
+        self._filled = 0
+        self.allocated = pool_size
+
+    def _take_buffer(self) -> bytearray:
+        if self._pool:
+            return self._pool.pop()
+        # Pool exhausted (consumer is behind); grow rather than block the socket
+        self.allocated += 1
+        return bytearray(self.batch_bytes)
+
+    def push(self, frame) -> List[memoryview]:
+        """Adds a frame and returns any buffers that became full."""
+        full = []
+        source = memoryview(frame).cast("B")
+        position = 0
+        while position < len(source):
+            if self._current is None:
+                self._current = self._take_buffer()
+                self._filled = 0
+            count = min(self.batch_bytes - self._filled, len(source) - position)
+            self._current[self._filled:self._filled + count] = source[position:position + count]
+            self._filled += count
+            position += count
+            if self._filled == self.batch_bytes:
+                full.append(memoryview(self._current))
+                self._current = None
+        return full
+
+    def flush(self) -> Optional[memoryview]:
+        """Returns the partly filled buffer, if any (e.g. when the mic stops)."""
+        if self._current is None or self._filled == 0:
+            return None
+        view = memoryview(self._current)[:self._filled]
+        self._current = None
+        return view
+
+    def recycle(self, view: memoryview):
+        buffer = view.obj
+        view.release()
+        if isinstance(buffer, bytearray) and len(buffer) == self.batch_bytes:
+            self._pool.append(buffer)
+
+
+class AudioQueue:
+    """
+    Bounded asyncio queue for realtime audio that never blocks the producer.
+
+    When full, DROP_OLDEST discards the stalest item (right for live mic
+    audio), DROP_NEWEST discards the incoming one, and COALESCE appends the
+    incoming bytes to the newest queued chunk so nothing is lost while the
+    item count stays bounded. None is the end-of-stream marker and is always
+    accepted.
+    """
+
+    def __init__(self, maxsize: int, policy: str = DROP_OLDEST,
+                 on_drop: Optional[Callable[[Any], None]] = None,
+                 max_item_bytes: int = AUDIO_MAX_OUTPUT_CHUNK_BYTES):
+        self.maxsize = maxsize
+        self.policy = policy
+        self.on_drop = on_drop
+        self.max_item_bytes = max_item_bytes
+        self._items = deque()  # (item, enqueued_at)
+        self._available = asyncio.Event()
+        self.enqueued = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.max_depth = 0
+        self.wait_ms_avg = 0.0
+        self.wait_ms_max = 0.0
+
+    def qsize(self) -> int:
+        return len(self._items)
+
+    def put_nowait(self, item):
+        now = time.perf_counter()
+        if item is not None and len(self._items) >= self.maxsize:
+            if self.policy == COALESCE and self._coalesce(item):
+                return
+            if self.policy == DROP_NEWEST:
+                self._drop(item)
+                return
+            dropped, _ = self._items.popleft()
+            self._drop(dropped)
+
+        self._items.append((item, now))
+        self.enqueued += 1
+        self.max_depth = max(self.max_depth, len(self._items))
+        self._available.set()
+
+    def _coalesce(self, item) -> bool:
+        if not isinstance(item, (bytes, bytearray, memoryview)):
+            return False
+        tail, enqueued_at = self._items[-1]
+        if not isinstance(tail, (bytes, bytearray)) or len(tail) + len(item) > self.max_item_bytes:
+            return False
+        if isinstance(tail, bytes):
+            tail = bytearray(tail)
+        tail += item
+        self._items[-1] = (tail, enqueued_at)
+        self.coalesced += 1
+        return True
+
+    def _drop(self, item):
+        self.dropped += 1
+        if self.on_drop is not None and item is not None:
+            self.on_drop(item)
+
+    async def get(self):
+        while not self._items:
+            self._available.clear()
+            await self._available.wait()
+        item, enqueued_at = self._items.popleft()
+        wait_ms = (time.perf_counter() - enqueued_at) * 1000
+        self.wait_ms_avg += _EWMA_ALPHA * (wait_ms - self.wait_ms_avg)
+        self.wait_ms_max = max(self.wait_ms_max, wait_ms)
+        return item
+
+    # asyncio.Queue-compatible spelling, so producers don't care which queue they hold
+    async def put(self, item):
+        self.put_nowait(item)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "depth": len(self._items),
+            "max_depth": self.max_depth,
+            "capacity": self.maxsize,
+            "policy": self.policy,
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "wait_ms_avg": round(self.wait_ms_avg, 2),
+            "wait_ms_max": round(self.wait_ms_max, 2),
+        }
+
+
+class AudioPipeline:
+    """
+    Per-connection audio path for /ws/agent.
+
+    Client mic frames are batched into AUDIO_BATCH_MS buffers and queued for
+    Gemini (dropping the oldest audio if Gemini falls behind); Gemini audio is
+    queued for the client, coalescing chunks if the client falls behind.
+    """
+
+    def __init__(self, sample_rate: int = AUDIO_INPUT_SAMPLE_RATE, batch_ms: int = AUDIO_BATCH_MS,
+                 input_queue_size: int = AUDIO_INPUT_QUEUE_SIZE, output_queue_size: int = AUDIO_OUTPUT_QUEUE_SIZE):
+        self.sample_rate = sample_rate
+        self.batcher = FrameBatcher(batch_bytes_for(batch_ms, sample_rate), pool_size=input_queue_size + 2)
+        self.input_queue = AudioQueue(input_queue_size, DROP_OLDEST, on_drop=self.batcher.recycle)
+        self.output_queue = AudioQueue(output_queue_size, COALESCE)
+        self.started_at = time.time()
+        self.frames_in = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    @property
+    def mime_type(self) -> str:
+        return f"audio/pcm;rate={self.sample_rate}"
+
+    def feed(self, frame: bytes):
+        """Called for every binary websocket message from the client."""
+        self.frames_in += 1
+        self.bytes_in += len(frame)
+        for batch in self.batcher.push(frame):
+            self.input_queue.put_nowait(batch)
+
+    def end_input(self):
+        tail = self.batcher.flush()
+        if tail is not None:
+            self.input_queue.put_nowait(tail)
+        self.input_queue.put_nowait(None)
+
+    async def input_chunks(self):
+        """
+        Yields batched mic audio for the Gemini sender. Each buffer goes back
+        to the pool when the consumer asks for the next one, i.e. after it
+        has been sent.
+        """
+        while True:
+            chunk = await self.input_queue.get()
+            if chunk is None:
+                break
+            try:
+                yield chunk
+            finally:
+                self.batcher.recycle(chunk)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "uptime_s": round(time.time() - self.started_at, 1),
+            "frames_in": self.frames_in,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "batch_bytes": self.batcher.batch_bytes,
+            "buffers_allocated": self.batcher.allocated,
+            "input": self.input_queue.stats(),
+            "output": self.output_queue.stats(),
+        }
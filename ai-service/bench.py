@@ -0,0 +1,582 @@
+"""
+Offline load test for the AI service.
+
+Runs main.app under uvicorn in this process, with Gemini replaced by
+fake_genai and Firestore by fake_firestore (both seeded, with configurable
+latency and error injection), then drives /chat, /ws/voice-agent and
+/ws/agent at a fixed concurrency. Reports p50/p95/p99 latency, throughput,
+errors and memory, and saves everything as JSON so runs can be compared.
+
+    python bench.py                                   # all scenarios, defaults
+    python bench.py --scenarios chat --concurrency 50 --requests 1000 --llm-latency 0.5
+    python bench.py --baseline bench_results/before.json   # run, then compare
+    python bench.py --compare bench_results/before.json bench_results/after.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import threading
+import subprocess
+import contextlib
+from datetime import datetime
+
+RESULTS_DIR = os.getenv("BENCH_RESULTS_DIR", "bench_results")
+
+# Metrics where a higher value is worse / better, for --compare
+LOWER_IS_BETTER = ("p50_ms", "p95_ms", "p99_ms", "error_rate")
+HIGHER_IS_BETTER = ("throughput_per_s",)
+
+APPS = ("com.example.notes", "com.example.fitness", "com.example.bank")
+TOPICS = ("crashes", "battery drain", "login problems", "sync", "the new dashboard", "notifications",
+          "pricing", "dark mode", "performance", "customer support")
+REVIEW_TEMPLATES = (
+    "The app keeps {problem} since the last update.",
+    "Love the {feature}, but {problem} is annoying.",
+    "Great {feature}! Five stars.",
+    "Uninstalled because of {problem}.",
+    "Support fixed my {feature} issue quickly.",
+)
+PROBLEMS = ("crashing on launch", "draining my battery", "logging me out", "failing to sync", "freezing")
+FEATURES = ("dashboard", "widgets", "dark mode", "offline mode", "export")
+
+# Service limits are relaxed so the benchmark measures the service, not its shedding
+BENCH_ENV = {
+    "GOOGLE_API_KEY": "bench-fake-key",
+    "SESSION_BACKEND": "memory",
+    # The bench client names its workers with X-Client-Id / ?client_id=
+    "ADMISSION_TRUSTED_PROXIES": "127.0.0.1",
+    "LLM_CLIENT_RATE": "100000",
+    "LLM_CLIENT_BURST": "100000",
+    "LLM_GLOBAL_RATE": "100000",
+    "LLM_GLOBAL_BURST": "100000",
+    "LLM_ADMISSION_MAX_PER_CLIENT": "1000",
+    "LIVE_CLIENT_RATE": "100000",
+    "LIVE_CLIENT_BURST": "100000",
+    "LIVE_GLOBAL_RATE": "100000",
+    "LIVE_GLOBAL_BURST": "100000",
+    "LIVE_ADMISSION_MAX_CONCURRENT": "10000",
+    # Bench questions on one topic differ only in their number, which the
+    # semantic answer cache rightly treats as the same question;
+    # --unique-questions alone decides how often answers are reused
+    "ANSWER_CACHE_SEMANTIC": "0",
+}
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies_ms, errors, wall_seconds):
+    values = sorted(latencies_ms)
+    total = len(values) + errors
+    return {
+        "requests": total,
+        "ok": len(values),
+        "errors": errors,
+        "error_rate": round(errors / total, 4) if total else 0.0,
+        "p50_ms": _round(percentile(values, 0.50)),
+        "p95_ms": _round(percentile(values, 0.95)),
+        "p99_ms": _round(percentile(values, 0.99)),
+        "mean_ms": _round(sum(values) / len(values)) if values else None,
+        "max_ms": _round(values[-1]) if values else None,
+        "wall_s": round(wall_seconds, 3),
+        "throughput_per_s": round(len(values) / wall_seconds, 2) if wall_seconds > 0 else None,
+    }
+
+
+def _round(value):
+    return round(value, 2) if value is not None else None
+
+
+def rss_mb():
+    """Current resident set size, where the platform exposes it."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return round(pages * os.sysconf("SC_PAGE_SIZE") / 2 ** 20, 1)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(peak / (2 ** 20 if sys.platform == "darwin" else 2 ** 10), 1)
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def seed_reviews(db, count, seed):
+    rng = random.Random(seed)
+    reviews = db.collection("reviews")
+    for i in range(count):
+        text = rng.choice(REVIEW_TEMPLATES).format(problem=rng.choice(PROBLEMS), feature=rng.choice(FEATURES))
+        reviews.document(f"review-{i:06d}").set({
+            "appId": rng.choice(APPS),
+            "score": rng.randint(1, 5),
+            "text": text,
+            "userName": f"user{rng.randint(1, 5000)}",
+            "version": f"2.{rng.randint(0, 9)}",
+            "thumbsUp": rng.randint(0, 50),
+            "date": f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        })
+
+
+def question(index, unique):
+    n = index % unique
+    return f"What do users say about {TOPICS[n % len(TOPICS)]}? (#{n})"
+
+
+class BenchServer:
+    """main.app under uvicorn in a background thread, on a free local port."""
+
+    def __init__(self, app):
+        import uvicorn
+
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, log_level="error",
+                                                    ws_ping_interval=None))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        deadline = time.monotonic() + 30
+        while not self.server.started:
+            if not self.thread.is_alive() or time.monotonic() > deadline:
+                raise RuntimeError("Benchmark server failed to start")
+            time.sleep(0.05)
+        port = self.server.servers[0].sockets[0].getsockname()[1]
+        self.http_url = f"http://127.0.0.1:{port}"
+        self.ws_url = f"ws://127.0.0.1:{port}"
+        self.wait_ready(deadline)
+        return self
+
+    def wait_ready(self, deadline):
+        # Don't let the background warm-up count towards the first requests
+        import urllib.request
+        import urllib.error
+
+        while True:
+            try:
+                with urllib.request.urlopen(f"{self.http_url}/readyz", timeout=5):
+                    return
+            except (urllib.error.URLError, OSError):
+                if time.monotonic() > deadline:
+                    raise RuntimeError("Benchmark server never became ready")
+                time.sleep(0.05)
+
+    def __exit__(self, exc_type, exc, tb):
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+
+async def run_workers(concurrency, total, worker):
+    """Runs worker(worker_id, next_index) on `concurrency` tasks until `total` items are done."""
+    counter = iter(range(total))
+
+    def next_index():
+        return next(counter, None)
+
+    await asyncio.gather(*(worker(worker_id, next_index) for worker_id in range(concurrency)))
+
+
+async def bench_chat(server, args):
+    import httpx
+
+    latencies, errors = [], 0
+
+    async def worker(worker_id, next_index):
+        nonlocal errors
+        async with httpx.AsyncClient(base_url=server.http_url, timeout=60) as client:
+            while (index := next_index()) is not None:
+                started = time.perf_counter()
+                try:
+                    response = await client.post("/chat", json={"message": question(index, args.unique_questions)},
+                                                 headers={"X-Client-Id": f"bench-{worker_id}"})
+                    answer = response.json().get("response", "")
+                    ok = response.status_code == 200 and not answer.startswith(("Sorry", "Error"))
+                except Exception:
+                    ok = False
+                if ok:
+                    latencies.append((time.perf_counter() - started) * 1000)
+                else:
+                    errors += 1
+
+    started = time.perf_counter()
+    await run_workers(args.concurrency, args.requests, worker)
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+async def bench_voice_agent(server, args):
+    """
+    With --voice-stream, messages ask for sentence streaming and latency is
+    message-to-first-sentence; the full reply time goes into reply_p50_ms /
+    reply_p95_ms.
+    """
+    import websockets
+
+    latencies, reply_latencies, errors = [], [], 0
+
+    async def worker(worker_id, next_index):
+        nonlocal errors
+        url = f"{server.ws_url}/ws/voice-agent?client_id=bench-{worker_id}"
+        async with websockets.connect(url, max_size=None) as ws:
+            while (index := next_index()) is not None:
+                started = time.perf_counter()
+                first_ms = None
+                try:
+                    message = {"text": question(index, args.unique_questions)}
+                    if args.voice_stream:
+                        message["stream"] = True
+                    await ws.send(json.dumps(message))
+                    reply = json.loads(await ws.recv())
+                    while reply.get("type") == "sentence":
+                        if first_ms is None:
+                            first_ms = (time.perf_counter() - started) * 1000
+                        reply = json.loads(await ws.recv())
+                    ok = reply.get("type") != "error" and not reply.get("response", "").startswith("Sorry")
+                except Exception:
+                    ok = False
+                if ok:
+                    reply_ms = (time.perf_counter() - started) * 1000
+                    latencies.append(reply_ms if first_ms is None else first_ms)
+                    reply_latencies.append(reply_ms)
+                else:
+                    errors += 1
+
+    started = time.perf_counter()
+    await run_workers(args.concurrency, args.requests, worker)
+    result = summarize(latencies, errors, time.perf_counter() - started)
+    if args.voice_stream:
+        reply_latencies.sort()
+        result["reply_p50_ms"] = _round(percentile(reply_latencies, 0.50))
+        result["reply_p95_ms"] = _round(percentile(reply_latencies, 0.95))
+    return result
+
+
+async def bench_agent(server, args):
+    """
+    One operation is one live session: connect, stream args.agent_audio_ms of
+    20 ms PCM16 frames, and wait for the first reply audio. Latency is
+    connect-to-first-audio.
+    """
+    import websockets
+
+    frame = bytes(640)  # 20 ms at 16 kHz PCM16
+    frames = max(1, args.agent_audio_ms // 20)
+    latencies, errors = [], 0
+
+    async def worker(worker_id, next_index):
+        nonlocal errors
+        while (index := next_index()) is not None:
+            url = f"{server.ws_url}/ws/agent?client_id=bench-{worker_id}-{index}"
+            started = time.perf_counter()
+            try:
+                async with websockets.connect(url, max_size=None) as ws:
+                    for _ in range(frames):
+                        await ws.send(frame)
+                    reply = await asyncio.wait_for(ws.recv(), timeout=30)
+                    ok = isinstance(reply, bytes) and len(reply) > 0
+            except Exception:
+                ok = False
+            if ok:
+                latencies.append((time.perf_counter() - started) * 1000)
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    await run_workers(args.concurrency, args.agent_sessions, worker)
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+SCENARIOS = {
+    "chat": bench_chat,
+    "voice-agent": bench_voice_agent,
+    "agent": bench_agent,
+}
+
+
+def setup_service(args):
+    """Installs the fakes and imports main with benchmark settings. Returns (main, behavior, db)."""
+    for key, value in BENCH_ENV.items():
+        os.environ.setdefault(key, value)
+    # Keep the benchmark away from a real vector index and session database
+    os.environ.setdefault("CHROMA_PATH", tempfile.mkdtemp(prefix="bench-chroma-"))
+
+    import fake_genai
+    from fake_firestore import FakeFirestore
+
+    behavior = fake_genai.install(
+        latency=args.llm_latency, jitter=args.llm_jitter, sentences=args.llm_sentences, error_rate=args.llm_error_rate,
+        error_kinds=args.llm_error_kinds.split(","), live_connect_latency=args.live_connect_latency,
+        seed=args.seed,
+    )
+
+    import rag_tool
+    import main
+
+    db = FakeFirestore(seed=args.seed)
+    seed_reviews(db, args.reviews, args.seed)
+    # Latency/errors only after seeding, so they apply to the benchmark itself
+    db.latency, db.jitter, db.error_rate = args.firestore_latency, args.firestore_latency / 4, args.firestore_error_rate
+
+    tool = rag_tool.ReviewTool(db=db)
+    if args.retrieval == "firestore" and tool.store is not None:
+        tool.store.close()
+        tool.store = None
+    rag_tool.set_review_tool(tool)
+    main.get_session_manager().max_sessions = 10 ** 9
+    return main, behavior, db
+
+
+async def fetch_server_stats(server):
+    import httpx
+
+    stats = {}
+    async with httpx.AsyncClient(base_url=server.http_url, timeout=10) as client:
+        for path in ("/cache/stats", "/coalescing/stats", "/admission/stats", "/live/pool", "/logging/stats"):
+            try:
+                stats[path] = (await client.get(path)).json()
+            except Exception as e:
+                stats[path] = {"error": str(e)}
+    return stats
+
+
+def measure_logging_overhead(calls=20000):
+    """
+    Microseconds per log call paid by the caller (the event loop): print()
+    as before (to /dev/null, and flushed into a pipe as with a terminal or
+    python -u under a log collector), a queued record, a record below the
+    level and a rate-sampled record that is dropped. The writer thread is
+    started afterwards, and the time it takes to format and write the
+    queued records is reported per record (writer_us). Records are built
+    with the service's settings (lean_records).
+    """
+    import logging
+    import threading
+    from logging_setup import SampledLogger, create_queue_logging, lean_records
+
+    devnull = open(os.devnull, "w")
+    read_end, write_end = os.pipe()
+    pipe = os.fdopen(write_end, "w")
+
+    def drain():
+        while os.read(read_end, 65536):
+            pass
+
+    threading.Thread(target=drain, daemon=True).start()
+    handler, listener = create_queue_logging(stream=devnull, fmt="json", queue_size=calls + 1)
+    logger = logging.getLogger("bench.logging")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    logger.addHandler(handler)
+    sampled = SampledLogger(logger)
+    sampled.isEnabledFor(logging.INFO)  # spend the only token, so every measured call is skipped
+
+    def per_call(log):
+        started = time.perf_counter()
+        for i in range(calls):
+            log(i)
+        return round((time.perf_counter() - started) / calls * 1e6, 3)
+
+    try:
+        with lean_records():
+            result = {
+                "calls": calls,
+                "print_us": per_call(lambda i: print(f"Voice reply sent: model=models/x chars={i}", file=devnull)),
+                "print_flushed_us": per_call(
+                    lambda i: print(f"Voice reply sent: model=models/x chars={i}", file=pipe, flush=True)),
+                "queued_us": per_call(
+                    lambda i: logger.info("Voice reply sent", extra={"model": "models/x", "chars": i})),
+                "below_level_us": per_call(lambda i: logger.debug("Audio frame", extra={"bytes": i})),
+                "sampled_out_us": per_call(lambda i: sampled.info("Audio frame", extra={"bytes": i})),
+            }
+        started = time.perf_counter()
+        listener.start()
+        handler.wait_written()
+        result["writer_us"] = round((time.perf_counter() - started) / calls * 1e6, 3)
+        result["dropped"] = handler.dropped
+        return result
+    finally:
+        if listener._thread is not None:
+            listener.stop()
+        logger.removeHandler(handler)
+        devnull.close()
+        pipe.close()
+        os.close(read_end)
+
+
+def run(args):
+    from logging_setup import flush_logging
+
+    rss_before = rss_mb()
+    quiet = open(os.devnull, "w") if not args.verbose else None
+    with contextlib.redirect_stdout(quiet) if quiet else contextlib.nullcontext():
+        main, behavior, db = setup_service(args)
+        flush_logging()
+    rss_loaded = rss_mb()
+
+    results = {}
+    with BenchServer(main.app) as server:
+        for name in args.scenarios.split(","):
+            print(f"Running {name} ...", file=sys.stderr)
+            with contextlib.redirect_stdout(quiet) if quiet else contextlib.nullcontext():
+                results[name] = asyncio.run(SCENARIOS[name](server, args))
+                results[name]["rss_mb"] = rss_mb()
+                flush_logging()
+        server_stats = asyncio.run(fetch_server_stats(server))
+    logging_overhead = measure_logging_overhead()
+
+    if quiet:
+        quiet.close()
+
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git_revision": git_revision(),
+        "python": sys.version.split()[0],
+        "config": {key: value for key, value in vars(args).items()
+                   if key not in ("compare", "baseline", "output", "verbose")},
+        "results": results,
+        "memory": {"rss_start_mb": rss_before, "rss_loaded_mb": rss_loaded, "rss_end_mb": rss_mb(),
+                   "peak_rss_mb": peak_rss_mb()},
+        "fakes": {"llm_calls": behavior.calls, "llm_injected_errors": behavior.injected_errors,
+                  "live_sessions": behavior.live_sessions, "firestore_operations": db.operations,
+                  "firestore_injected_errors": db.injected_errors},
+        "server": server_stats,
+        "logging": logging_overhead,
+    }
+
+
+def print_report(report):
+    print(f"\nBenchmark @ {report['git_revision'] or 'unknown revision'} ({report['timestamp']})")
+    header = f"{'scenario':<12} {'ok':>6} {'err':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>8} {'rss MB':>8}"
+    print(header)
+    print("-" * len(header))
+    for name, r in report["results"].items():
+        print(f"{name:<12} {r['ok']:>6} {r['errors']:>5} {_fmt(r['p50_ms']):>9} {_fmt(r['p95_ms']):>9} "
+              f"{_fmt(r['p99_ms']):>9} {_fmt(r['throughput_per_s']):>8} {_fmt(r.get('rss_mb')):>8}")
+    overhead = report.get("logging")
+    if overhead:
+        print(f"Log call: {_fmt(overhead['queued_us'])} µs queued, {_fmt(overhead['below_level_us'])} µs below level, "
+              f"{_fmt(overhead['sampled_out_us'])} µs sampled out (print: {_fmt(overhead['print_us'])} µs, "
+              f"{_fmt(overhead.get('print_flushed_us'))} µs flushed; "
+              f"writer thread: {_fmt(overhead['writer_us'])} µs)")
+    memory = report["memory"]
+    print(f"Memory: start {_fmt(memory['rss_start_mb'])} MB, loaded {_fmt(memory['rss_loaded_mb'])} MB, "
+          f"end {_fmt(memory['rss_end_mb'])} MB, peak {_fmt(memory['peak_rss_mb'])} MB")
+
+
+def _fmt(value):
+    return "-" if value is None else f"{value:g}"
+
+
+def compare(base, new, threshold):
+    """Prints per-metric changes; returns the list of regressions beyond threshold percent."""
+    regressions = []
+    print(f"\nComparing {base.get('git_revision')} ({base.get('timestamp')}) -> "
+          f"{new.get('git_revision')} ({new.get('timestamp')})")
+    for name, new_result in new["results"].items():
+        base_result = base["results"].get(name)
+        if base_result is None:
+            print(f"{name}: no baseline")
+            continue
+        for metric in LOWER_IS_BETTER + HIGHER_IS_BETTER:
+            before, after = base_result.get(metric), new_result.get(metric)
+            if before is None or after is None:
+                continue
+            if before:
+                change = (after - before) / before * 100
+            else:
+                change = 0.0 if after == before else float("inf")
+            worse = change > threshold if metric in LOWER_IS_BETTER else change < -threshold
+            if metric == "error_rate":
+                worse = after - before > threshold / 100
+            flag = "  REGRESSION" if worse else ""
+            print(f"  {name:<12} {metric:<17} {before:>10g} -> {after:<10g} ({change:+.1f}%){flag}")
+            if worse:
+                regressions.append((name, metric, before, after))
+    return regressions
+
+
+def load_report(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline load test for the Insightify AI service.")
+    parser.add_argument("--scenarios", default="chat,voice-agent,agent",
+                        help="comma-separated: " + ", ".join(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=200, help="requests/messages per HTTP or text scenario")
+    parser.add_argument("--agent-sessions", type=int, default=40, help="live sessions for the agent scenario")
+    parser.add_argument("--agent-audio-ms", type=int, default=1000, help="mic audio sent per live session")
+    parser.add_argument("--unique-questions", type=int, default=50,
+                        help="distinct questions; fewer means more cache hits and coalescing")
+    parser.add_argument("--reviews", type=int, default=2000, help="reviews seeded into the fake Firestore")
+    parser.add_argument("--retrieval", choices=("store", "firestore"), default="store",
+                        help="serve retrieval from the in-memory store or from (fake) Firestore reads")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="seconds per Gemini call")
+    parser.add_argument("--llm-jitter", type=float, default=0.05)
+    parser.add_argument("--llm-sentences", type=int, default=1, help="sentences per fake Gemini answer")
+    parser.add_argument("--voice-stream", action="store_true",
+                        help="voice-agent messages ask for sentence streaming (latency = first sentence)")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-error-kinds", default="quota", help="comma-separated: quota, not_found, timeout, error")
+    parser.add_argument("--live-connect-latency", type=float, default=0.3)
+    parser.add_argument("--firestore-latency", type=float, default=0.02, help="seconds per Firestore read/write")
+    parser.add_argument("--firestore-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help=f"where to save the JSON report (default: {RESULTS_DIR}/bench-<time>.json)")
+    parser.add_argument("--baseline", help="report to compare this run against")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"), help="compare two saved reports and exit")
+    parser.add_argument("--threshold", type=float, default=10.0, help="percent change counted as a regression")
+    parser.add_argument("--verbose", action="store_true", help="show the service's own log output")
+    args = parser.parse_args(argv)
+    unknown = set(args.scenarios.split(",")) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    return args
+
+
+def main_cli(argv=None):
+    args = parse_args(argv)
+    if args.compare:
+        regressions = compare(load_report(args.compare[0]), load_report(args.compare[1]), args.threshold)
+        return 1 if regressions else 0
+
+    report = run(args)
+    print_report(report)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"bench-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved {output}")
+
+    if args.baseline:
+        regressions = compare(load_report(args.baseline), report, args.threshold)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,244 @@
+import os
+import re
+import math
+import threading
+from array import array
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+
+# BM25 term-frequency saturation and length normalisation
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+# Rebuild the postings once this fraction of indexed documents is deleted/replaced
+BM25_COMPACT_RATIO = float(os.getenv("BM25_COMPACT_RATIO", "0.3"))
+
+# Words, numbers and dotted versions ("2.1.3", "android 14", "can't")
+_TOKEN = re.compile(r"[a-z0-9]+(?:[.'][a-z0-9]+)*")
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have i if in is it its my of on or so that the this "
+    "to was we were with you your me".split()
+)
+# Term frequencies are stored as uint16
+_MAX_TF = 65535
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in _TOKEN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    Inverted index with BM25 scoring over the review store's text.
+
+    Each indexed review is a document number; postings are per-term arrays
+    of (document, term frequency) and scoring is vectorized with numpy, so a
+    query costs a few array operations per query term. The index follows the
+    store through subscribe(): an updated review is re-indexed under a new
+    document number and its old postings are masked out until the next
+    compaction.
+
+    Filters (app, rating, date) reuse the store's columnar filters, since
+    every document remembers the store row it came from.
+    """
+
+    def __init__(self, store=None, k1: float = BM25_K1, b: float = BM25_B):
+        self.store = store
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._postings = {}  # term -> (array('I') documents, array('H') term frequencies)
+        self._doc_by_id = {}  # review id -> document
+        self._doc_ids = []  # document -> review id
+        self._doc_rows = array("q")  # document -> store row (-1 if unknown)
+        self._doc_lengths = array("I")
+        self._alive = bytearray()
+        self._total_length = 0
+        self._dead = 0
+        self._norms = None  # cached per-document length normalisation, reset on writes
+        if store is not None:
+            store.subscribe(self._on_store_change)
+
+    def __len__(self) -> int:
+        return len(self._doc_by_id)
+
+    # -- writes ---------------------------------------------------------------
+
+    def _on_store_change(self, upserted: List[Dict[str, Any]], removed: List[str]):
+        with self._lock:
+            for review_id in removed:
+                self._remove(review_id)
+            for review in upserted:
+                self._add(review["id"], review.get("text") or review.get("content") or "")
+            self._maybe_compact()
+
+    def add(self, review_id: str, text: str, row: Optional[int] = None):
+        with self._lock:
+            self._add(str(review_id), text, row)
+            self._maybe_compact()
+
+    def remove(self, review_id: str):
+        with self._lock:
+            self._remove(str(review_id))
+            self._maybe_compact()
+
+    def _add(self, review_id: str, text: str, row: Optional[int] = None):
+        self._remove(review_id)
+        self._norms = None
+        if row is None:
+            row = self.store.row_of(review_id) if self.store is not None else None
+
+        counts = {}
+        for token in tokenize(text):
+            counts[token] = counts.get(token, 0) + 1
+
+        doc = len(self._doc_ids)
+        self._doc_ids.append(review_id)
+        self._doc_rows.append(-1 if row is None else row)
+        length = sum(counts.values())
+        self._doc_lengths.append(length)
+        self._alive.append(1)
+        self._doc_by_id[review_id] = doc
+        self._total_length += length
+
+        for term, count in counts.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = (array("I"), array("H"))
+            postings[0].append(doc)
+            postings[1].append(min(count, _MAX_TF))
+
+    def _remove(self, review_id: str):
+        doc = self._doc_by_id.pop(review_id, None)
+        if doc is None:
+            return
+        self._alive[doc] = 0
+        self._total_length -= self._doc_lengths[doc]
+        self._dead += 1
+        self._norms = None
+
+    def _maybe_compact(self):
+        if self._dead < 1000 or self._dead < BM25_COMPACT_RATIO * len(self._doc_ids):
+            return
+        self._compact()
+
+    def _compact(self):
+        """Drops postings of dead documents and renumbers the live ones."""
+        count = len(self._doc_ids)
+        alive = np.frombuffer(self._alive, dtype=np.uint8, count=count).astype(bool)
+        new_numbers = np.cumsum(alive, dtype=np.int64) - 1
+
+        postings = {}
+        for term, (docs, freqs) in self._postings.items():
+            doc_array = np.frombuffer(docs, dtype=np.uint32, count=len(docs))
+            keep = alive[doc_array]
+            if not keep.any():
+                continue
+            postings[term] = (
+                array("I", new_numbers[doc_array[keep]].astype(np.uint32).tobytes()),
+                array("H", np.frombuffer(freqs, dtype=np.uint16, count=len(freqs))[keep].tobytes()),
+            )
+            del doc_array
+
+        live = np.flatnonzero(alive)
+        self._doc_ids = [self._doc_ids[doc] for doc in live]
+        self._doc_rows = array("q", np.frombuffer(self._doc_rows, dtype=np.int64, count=count)[live].tobytes())
+        self._doc_lengths = array("I", np.frombuffer(self._doc_lengths, dtype=np.uint32, count=count)[live].tobytes())
+        self._alive = bytearray(b"\x01" * len(live))
+        self._doc_by_id = {review_id: doc for doc, review_id in enumerate(self._doc_ids)}
+        self._postings = postings
+        self._dead = 0
+        self._norms = None
+
+    # -- reads ----------------------------------------------------------------
+
+    def search(self, query: str, top_k: int = 10, app_id: Optional[str] = None,
+               min_rating: Optional[int] = None, max_rating: Optional[int] = None,
+               since: Optional[float] = None, until: Optional[float] = None) -> List[Tuple[str, float]]:
+        """Returns up to top_k (review_id, bm25_score) pairs, best first."""
+        terms = set(tokenize(query))
+        filtered = any(value is not None for value in (app_id, min_rating, max_rating, since, until))
+        allowed_rows = None
+        if filtered and self.store is not None:
+            allowed_rows = self.store.rows(app_id=app_id, min_rating=min_rating, max_rating=max_rating,
+                                           since=since, until=until)
+            if len(allowed_rows) == 0:
+                return []
+
+        with self._lock:
+            count = len(self._doc_ids)
+            live = len(self._doc_by_id)
+            if not terms or live == 0:
+                return []
+            norms = self._length_norms(count, live)
+            scores = np.zeros(count, dtype=np.float32)
+            matched = []
+
+            for term in terms:
+                postings = self._postings.get(term)
+                if postings is None:
+                    continue
+                docs = np.frombuffer(postings[0], dtype=np.uint32, count=len(postings[0])).copy()
+                freqs = np.frombuffer(postings[1], dtype=np.uint16, count=len(postings[1])).astype(np.float32)
+                # Document frequency counts dead postings too until compaction; close enough for idf
+                idf = math.log(1 + (live - len(docs) + 0.5) / (len(docs) + 0.5))
+                scores[docs] += idf * freqs * (self.k1 + 1) / (freqs + norms[docs])
+                matched.append(docs)
+
+            if not matched:
+                return []
+
+            # Rare terms touch few documents; only look at those
+            touched = sum(len(docs) for docs in matched)
+            if touched < count // 8:
+                candidates = matched[0] if len(matched) == 1 else np.unique(np.concatenate(matched))
+            else:
+                candidates = np.flatnonzero(scores)
+            alive = np.frombuffer(self._alive, dtype=np.uint8, count=count)
+            keep = alive[candidates].astype(bool)
+            del alive
+            if allowed_rows is not None:
+                rows = np.frombuffer(self._doc_rows, dtype=np.int64, count=count)[candidates]
+                allowed = np.zeros(int(max(allowed_rows.max(), rows.max(initial=-1))) + 1, dtype=bool)
+                allowed[allowed_rows] = True
+                keep &= (rows >= 0) & allowed[np.maximum(rows, 0)]
+            candidates = candidates[keep]
+
+            if len(candidates) == 0:
+                return []
+            candidate_scores = scores[candidates]
+            if len(candidates) > top_k:
+                top = np.argpartition(-candidate_scores, top_k)[:top_k]
+                candidates, candidate_scores = candidates[top], candidate_scores[top]
+            order = np.argsort(-candidate_scores, kind="stable")
+            return [(self._doc_ids[int(candidates[i])], float(candidate_scores[i])) for i in order]
+
+    def _length_norms(self, count: int, live: int) -> np.ndarray:
+        if self._norms is None or len(self._norms) != count:
+            lengths = np.frombuffer(self._doc_lengths, dtype=np.uint32, count=count).astype(np.float32)
+            average_length = max(self._total_length / live, 1e-9)
+            self._norms = self.k1 * (1 - self.b + self.b * lengths / average_length)
+        return self._norms
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            posting_count = sum(len(docs) for docs, _ in self._postings.values())
+            return {
+                "documents": len(self._doc_by_id),
+                "dead_documents": self._dead,
+                "terms": len(self._postings),
+                "postings": posting_count,
+                "posting_bytes": posting_count * 6,
+            }
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    Fuses several best-first id rankings: each id scores sum(1 / (k + rank)).
+    Ids ranked well by several retrievers beat ids ranked first by only one.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, review_id in enumerate(ranking, start=1):
+            scores[review_id] = scores.get(review_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,153 @@
+import os
+import re
+import logging
+from typing import List, Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# Default token budget for the review context of one prompt
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+# Optional per-model overrides: "models/gemini-2.5-flash=2000,models/gemini-pro-latest=4000"
+CONTEXT_TOKEN_BUDGETS = os.getenv("CONTEXT_TOKEN_BUDGETS", "")
+# Individual reviews are cut to this many characters before packing
+CONTEXT_MAX_REVIEW_CHARS = int(os.getenv("CONTEXT_MAX_REVIEW_CHARS", "600"))
+# Reviews whose word sets overlap at least this much count as duplicates
+CONTEXT_DUPLICATE_SIMILARITY = float(os.getenv("CONTEXT_DUPLICATE_SIMILARITY", "0.85"))
+
+# Gemini averages roughly four characters per token for English text
+CHARS_PER_TOKEN = 4
+# Don't bother squeezing a truncated review into less room than this
+MIN_REVIEW_TOKENS = 24
+
+_WORDS = re.compile(r"\w+")
+
+
+def _parse_budgets(spec: str) -> Dict[str, int]:
+    budgets = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        model, budget = item.rsplit("=", 1)
+        try:
+            budgets[model.strip()] = int(budget)
+        except ValueError:
+            logger.warning("Ignoring invalid context budget %r", item)
+    return budgets
+
+
+MODEL_TOKEN_BUDGETS = _parse_budgets(CONTEXT_TOKEN_BUDGETS)
+
+
+def token_budget_for(model: Optional[str]) -> int:
+    return MODEL_TOKEN_BUDGETS.get(model, CONTEXT_TOKEN_BUDGET)
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def truncate(text: str, max_chars: int) -> str:
+    """Cuts text to max_chars on a word boundary, marking the cut with an ellipsis."""
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars - 1]
+    space = cut.rfind(" ")
+    if space > max_chars // 2:
+        cut = cut[:space]
+    return cut.rstrip() + "…"
+
+
+def format_review(review: Dict[str, Any], text: str) -> str:
+    """One compact line per review: [5★ 2024-03-01 v2.1] text"""
+    tags = []
+    if review.get("score"):
+        tags.append(f"{review['score']}★")
+    date = review.get("date")
+    if date:
+        tags.append(str(date)[:10])
+    version = review.get("version")
+    if version and version != "unknown":
+        tags.append(f"v{version}")
+    prefix = f"[{' '.join(tags)}] " if tags else ""
+    return f"- {prefix}{text}"
+
+
+class ReviewContext:
+    __slots__ = ("text", "token_count", "included", "duplicates", "truncated", "dropped")
+
+    def __init__(self, text: str, token_count: int, included: int, duplicates: int, truncated: int, dropped: int):
+        self.text = text
+        self.token_count = token_count
+        self.included = included
+        self.duplicates = duplicates
+        self.truncated = truncated
+        self.dropped = dropped
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "context_tokens": self.token_count,
+            "reviews_included": self.included,
+            "reviews_duplicate": self.duplicates,
+            "reviews_truncated": self.truncated,
+            "reviews_dropped": self.dropped,
+        }
+
+
+def build_context(reviews: List[Dict[str, Any]], token_budget: int = CONTEXT_TOKEN_BUDGET,
+                  max_review_chars: int = CONTEXT_MAX_REVIEW_CHARS,
+                  duplicate_similarity: float = CONTEXT_DUPLICATE_SIMILARITY) -> ReviewContext:
+    """
+    Packs reviews (assumed best-first) into a compact context block.
+
+    Only the rating, date, version and text of each review are kept;
+    placeholder/error entries and near-duplicate reviews are skipped. Reviews
+    are added in rank order until the token budget is used up, truncating the
+    last one that only partly fits.
+    """
+    lines = []
+    seen_word_sets = []
+    used_tokens = 0
+    duplicates = truncated = dropped = 0
+
+    for review in reviews or []:
+        if not isinstance(review, dict):
+            continue
+        text = " ".join((review.get("text") or review.get("content") or "").split())
+        if not text:
+            continue
+
+        words = frozenset(_WORDS.findall(text.lower()))
+        if any(_jaccard(words, seen) >= duplicate_similarity for seen in seen_word_sets):
+            duplicates += 1
+            continue
+
+        short_text = truncate(text, max_review_chars)
+        was_truncated = short_text != text
+        line = format_review(review, short_text)
+        # +1 for the newline joining this line to the previous one
+        line_tokens = estimate_tokens(line) + 1
+
+        remaining = token_budget - used_tokens
+        if line_tokens > remaining:
+            if remaining < MIN_REVIEW_TOKENS:
+                dropped += 1
+                continue
+            overhead = len(line) - len(short_text)
+            short_text = truncate(text, (remaining - 1) * CHARS_PER_TOKEN - overhead)
+            was_truncated = True
+            line = format_review(review, short_text)
+            line_tokens = estimate_tokens(line) + 1
+
+        lines.append(line)
+        seen_word_sets.append(words)
+        used_tokens += line_tokens
+        truncated += was_truncated
+
+    text = "\n".join(lines)
+    return ReviewContext(text, estimate_tokens(text), len(lines), duplicates, truncated, dropped)
+
+
+def _jaccard(a: frozenset, b: frozenset) -> float:
+    if not a or not b:
+        return 1.0 if a == b else 0.0
+    return len(a & b) / len(a | b)
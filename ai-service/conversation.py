@@ -0,0 +1,133 @@
+import os
+import asyncio
+import logging
+from collections import deque
+from typing import Awaitable, Callable, Dict, Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Turns (user message + reply) kept verbatim in every prompt
+CONVERSATION_MAX_TURNS = int(os.getenv("CONVERSATION_MAX_TURNS", "6"))
+# Longest message text kept per turn; a pasted wall of text doesn't stay in every prompt
+CONVERSATION_MAX_TURN_CHARS = int(os.getenv("CONVERSATION_MAX_TURN_CHARS", "600"))
+# Upper bound on the rolling summary of older turns
+CONVERSATION_SUMMARY_MAX_CHARS = int(os.getenv("CONVERSATION_SUMMARY_MAX_CHARS", "1200"))
+# Turns that must drop out of the verbatim window before they are summarized
+# together; one model call per this many turns instead of one per turn
+CONVERSATION_SUMMARY_BATCH_TURNS = int(os.getenv("CONVERSATION_SUMMARY_BATCH_TURNS", "4"))
+
+Turn = Tuple[str, str]
+
+
+def _clip(text: str, limit: int) -> str:
+    text = (text or "").strip()
+    return text if len(text) <= limit else text[:limit - 1].rstrip() + "…"
+
+
+def format_turns(turns: List[Turn]) -> str:
+    return "\n".join(f"User: {user}\nAssistant: {assistant}" for user, assistant in turns)
+
+
+def summary_prompt(summary: str, turns: List[Turn], max_chars: int = CONVERSATION_SUMMARY_MAX_CHARS) -> str:
+    """The prompt that folds older turns into the running summary."""
+    return (
+        "Update the summary of a conversation between a user and an assistant for app developers. "
+        "Keep facts, names, apps, numbers and open questions; drop pleasantries. "
+        f"Reply with the new summary only, under {max_chars} characters.\n\n"
+        f"Current summary:\n{summary or '(empty)'}\n\n"
+        f"Turns to add:\n{format_turns(turns)}"
+    )
+
+
+class Conversation:
+    """
+    Memory of one voice-agent connection whose prompt size doesn't grow.
+
+    The last max_turns turns go into the prompt verbatim. Older turns are
+    folded into a rolling summary by summarize(summary, turns) -> new summary
+    once summary_batch_turns of them have dropped out of the window. It runs
+    as a background task after the reply has been sent, so the response path
+    never waits on it. Until a summary lands, the turns it covers stay in the
+    prompt verbatim (at most another max_turns of them); if summarizing fails
+    they are appended to the summary as clipped text.
+    """
+
+    def __init__(self, summarize: Optional[Callable[[str, List[Turn]], Awaitable[str]]] = None,
+                 max_turns: int = CONVERSATION_MAX_TURNS, max_turn_chars: int = CONVERSATION_MAX_TURN_CHARS,
+                 summary_max_chars: int = CONVERSATION_SUMMARY_MAX_CHARS,
+                 summary_batch_turns: int = CONVERSATION_SUMMARY_BATCH_TURNS):
+        self.summarize = summarize
+        self.max_turns = max(1, max_turns)
+        self.max_turn_chars = max_turn_chars
+        self.summary_max_chars = summary_max_chars
+        # Waiting turns stay in the prompt, so a batch never exceeds the window
+        self.summary_batch_turns = min(max(1, summary_batch_turns), self.max_turns)
+        self.turns = deque()
+        self.summary = ""
+        self._pending = []  # evicted turns not yet in the summary
+        self._task = None
+        self.turn_count = 0
+        self.summaries = 0
+        self.summary_failures = 0
+
+    def add_turn(self, user_text: str, reply: str):
+        """Records a finished turn; may start summarizing in the background (needs a running loop)."""
+        self.turns.append((_clip(user_text, self.max_turn_chars), _clip(reply, self.max_turn_chars)))
+        self.turn_count += 1
+        while len(self.turns) > self.max_turns:
+            self._pending.append(self.turns.popleft())
+        if len(self._pending) >= self.summary_batch_turns and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._summarize_pending())
+
+    async def _summarize_pending(self):
+        while len(self._pending) >= self.summary_batch_turns:
+            batch = list(self._pending)
+            if self.summarize is None:
+                summary = None
+            else:
+                try:
+                    summary = await self.summarize(self.summary, batch)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.warning("Conversation summary failed: %s", str(e)[:200])
+                    self.summary_failures += 1
+                    summary = None
+            if summary is None:
+                # No summarizer (or it failed): keep the gist as clipped text
+                summary = " ".join(filter(None, [self.summary, format_turns(batch).replace("\n", " ")]))
+                summary = summary[-self.summary_max_chars:]
+            else:
+                self.summaries += 1
+            self.summary = _clip(summary, self.summary_max_chars)
+            del self._pending[:len(batch)]
+
+    def build_prompt(self, instructions: str, user_text: str) -> str:
+        """instructions, then the summary and recent turns (if any), then the new message."""
+        parts = [instructions]
+        if self.summary:
+            parts.append(f"Summary of the earlier conversation:\n{self.summary}")
+        # Pending turns only pile up while a summary is slow; never more than max_turns of them
+        recent = self._pending[-self.max_turns:] + list(self.turns)
+        if recent:
+            parts.append(f"Recent conversation:\n{format_turns(recent)}")
+        parts.append(f"User says: {_clip(user_text, self.max_turn_chars)}")
+        return "\n\n".join(parts)
+
+    async def aclose(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "turns": self.turn_count,
+            "verbatim_turns": len(self.turns),
+            "pending_turns": len(self._pending),
+            "summary_chars": len(self.summary),
+            "summaries": self.summaries,
+            "summary_failures": self.summary_failures,
+        }
@@ -0,0 +1,637 @@
+"""
+On-disk, quantized embedding store for large review corpora.
+
+Vectors are kept as int8 (with one float32 scale per vector) or float16 in
+flat files that readers memory-map, so every uvicorn worker on a host
+shares one copy through the page cache instead of holding float32 vectors
+in its own heap. Layout of EMBEDDING_STORE_PATH:
+
+    meta.json            dim, dtype, committed row count, app names, IVF state
+    vectors.bin          rows x dim int8/float16
+    scales.bin           float32 per row (int8 only)
+    apps.bin / alive.bin uint32 app number / uint8 live flag per row
+    docs.bin             JSON {"text", metadata...} per row, addressed by
+    doc_offsets.bin      uint64 offset and
+    doc_lengths.bin      uint32 length per row
+    ids.txt              one JSON-encoded review id per row
+    ivf_*.npy            optional coarse partitioning (see build_ivf)
+
+Rows are append-only: re-upserting a review appends a new row and clears
+the old row's live flag. Writers (ingest.py, `python rag_tool.py`, any
+worker) take an exclusive file lock per commit, append rows and then
+atomically replace meta.json, so readers only ever see fully written rows
+and never wait for a writer.
+
+Search is brute-force over memory-mapped blocks (one BLAS matrix product
+per block, for any number of queries at once), or, once build_ivf() has
+run, over the nprobe partitions nearest to each query plus the rows added
+since. Measure both against exact float32 search with:
+
+    python embedding_store.py bench --count 200000 --dim 384
+"""
+import os
+import json
+import time
+import argparse
+import threading
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: no writer lock
+    fcntl = None
+
+EMBEDDING_STORE_PATH = os.getenv("EMBEDDING_STORE_PATH", "embedding_store")
+# int8 (4x smaller than float32) or float16 (2x smaller, near-exact scores)
+EMBEDDING_STORE_DTYPE = os.getenv("EMBEDDING_STORE_DTYPE", "int8")
+# Rows scored per matrix product; bounds the temporary float32 block
+EMBEDDING_SEARCH_BLOCK_ROWS = int(os.getenv("EMBEDDING_SEARCH_BLOCK_ROWS", "16384"))
+# IVF partitions searched per query (more: better recall, slower)
+EMBEDDING_IVF_NPROBE = int(os.getenv("EMBEDDING_IVF_NPROBE", "16"))
+# Rebuild the IVF partitions once this fraction of rows was added after the last build
+EMBEDDING_IVF_REBUILD_RATIO = float(os.getenv("EMBEDDING_IVF_REBUILD_RATIO", "0.2"))
+
+DTYPES = {"int8": np.int8, "float16": np.float16}
+
+
+def quantize(vectors: np.ndarray, dtype: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """L2-normalizes float vectors and converts them to the storage dtype (+ per-row scales for int8)."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors = vectors / np.maximum(norms, 1e-12)
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales = np.maximum(scales, 1e-12).astype(np.float32)
+    return np.round(vectors / scales[:, None]).astype(np.int8), scales
+
+
+class _Snapshot:
+    """Everything a search reads, swapped in one assignment when a commit is picked up."""
+
+    __slots__ = ("meta", "count", "vectors", "scales", "apps", "alive", "doc_offsets", "doc_lengths", "ivf")
+
+    def __init__(self, path: str, meta: Dict[str, Any], ivf=None):
+        self.meta = meta
+        self.count = count = meta["count"]
+        dim = meta["dim"]
+
+        def column(name, dtype, shape):
+            if count == 0:
+                return np.zeros(shape, dtype=dtype)
+            return np.memmap(os.path.join(path, name), dtype=dtype, mode="r", shape=shape)
+
+        self.vectors = column("vectors.bin", DTYPES[meta["dtype"]], (count, dim))
+        self.scales = column("scales.bin", np.float32, (count,)) if meta["dtype"] == "int8" else None
+        self.apps = column("apps.bin", np.uint32, (count,))
+        self.alive = column("alive.bin", np.uint8, (count,))
+        self.doc_offsets = column("doc_offsets.bin", np.uint64, (count,))
+        self.doc_lengths = column("doc_lengths.bin", np.uint32, (count,))
+        self.ivf = ivf  # (centroids, order, offsets) over the first meta["ivf_count"] rows
+
+    def dequantize(self, rows) -> np.ndarray:
+        block = np.asarray(self.vectors[rows], dtype=np.float32)
+        if self.scales is not None:
+            block *= np.asarray(self.scales[rows])[:, None]
+        return block
+
+    def scores(self, rows, queries: np.ndarray) -> np.ndarray:
+        """Similarities of rows to queries (dim x n); int8 scales are applied to the products, not the block."""
+        scores = np.asarray(self.vectors[rows], dtype=np.float32) @ queries
+        if self.scales is not None:
+            scale = np.asarray(self.scales[rows])
+            scores *= scale[:, None] if scores.ndim == 2 else scale
+        return scores
+
+    def valid(self, rows, app: Optional[int]) -> np.ndarray:
+        valid = np.asarray(self.alive[rows]).astype(bool)
+        if app is not None:
+            valid &= np.asarray(self.apps[rows]) == app
+        return valid
+
+
+class EmbeddingStore:
+    """Memory-mapped, quantized vectors with an id map; see the module docstring."""
+
+    def __init__(self, path: str = EMBEDDING_STORE_PATH, dim: Optional[int] = None,
+                 dtype: str = EMBEDDING_STORE_DTYPE):
+        """Opens the store at path, creating it if it doesn't exist and dim is given."""
+        if dtype not in DTYPES:
+            raise ValueError(f"Unsupported embedding dtype {dtype!r} (use int8 or float16)")
+        self.path = path
+        self._lock = threading.RLock()
+        self._meta_version = None
+        self._snapshot = None
+        self._writing_depth = 0
+        self.ids = []  # row -> review id; append-only, so rows below any snapshot's count are stable
+        self._ids_position = 0
+        self._slot_by_id = {}
+        self._app_index = {}
+
+        if dim is not None and not os.path.exists(self._file("meta.json")):
+            os.makedirs(path, exist_ok=True)
+            with self._writing():
+                if not os.path.exists(self._file("meta.json")):
+                    self._write_meta({"dim": int(dim), "dtype": dtype, "count": 0, "dead": 0, "apps": [],
+                                      "docs_bytes": 0, "ids_bytes": 0, "ivf_count": 0, "ivf_lists": 0})
+        if not self.refresh(force=True):
+            raise FileNotFoundError(f"No embedding store at {path}")
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    # -- reading the committed state ------------------------------------------
+
+    def refresh(self, force: bool = False) -> bool:
+        """Re-maps the files if a writer committed since the last call (one stat() otherwise)."""
+        try:
+            stat = os.stat(self._file("meta.json"))
+        except FileNotFoundError:
+            return False
+        version = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if not force and version == self._meta_version:
+            return False
+        with self._lock:
+            with open(self._file("meta.json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            self._read_ids(meta["count"])
+            self._app_index = {app: index for index, app in enumerate(meta["apps"])}
+            previous = self._snapshot
+            ivf = None
+            if meta.get("ivf_lists"):
+                if previous is not None and previous.ivf is not None and \
+                        previous.meta.get("ivf_version") == meta.get("ivf_version"):
+                    ivf = previous.ivf
+                else:
+                    ivf = (np.load(self._file("ivf_centroids.npy")),
+                           np.load(self._file("ivf_order.npy"), mmap_mode="r"),
+                           np.load(self._file("ivf_offsets.npy")))
+            self._snapshot = _Snapshot(self.path, meta, ivf)
+            self._meta_version = version
+        return True
+
+    def _read_ids(self, count: int):
+        if len(self.ids) >= count:
+            return
+        with open(self._file("ids.txt"), "rb") as f:
+            f.seek(self._ids_position)
+            while len(self.ids) < count:
+                line = f.readline()
+                if not line:
+                    break
+                review_id = json.loads(line)
+                self._slot_by_id[review_id] = len(self.ids)
+                self.ids.append(review_id)
+            self._ids_position = f.tell()
+
+    @property
+    def meta(self) -> Dict[str, Any]:
+        return self._snapshot.meta
+
+    def __len__(self) -> int:
+        self.refresh()
+        return self.meta["count"] - self.meta.get("dead", 0)
+
+    @property
+    def dim(self) -> int:
+        return self.meta["dim"]
+
+    def slot_of(self, review_id) -> Optional[int]:
+        snapshot = self._snapshot
+        slot = self._slot_by_id.get(str(review_id))
+        return slot if slot is not None and slot < snapshot.count and snapshot.alive[slot] else None
+
+    def document(self, slot: int) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        offset, length = int(snapshot.doc_offsets[slot]), int(snapshot.doc_lengths[slot])
+        with open(self._file("docs.bin"), "rb") as f:
+            f.seek(offset)
+            return json.loads(f.read(length))
+
+    # -- writes ---------------------------------------------------------------
+
+    @contextmanager
+    def _writing(self):
+        """Exclusive across threads and processes; the state is re-read so commits never overlap."""
+        with self._lock:
+            if self._writing_depth:
+                yield  # nested, e.g. build_ivf() from upsert(): the file lock is already held
+                return
+            with open(self._file("writer.lock"), "w") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                self._writing_depth += 1
+                try:
+                    self.refresh()
+                    yield
+                finally:
+                    self._writing_depth -= 1
+
+    def upsert(self, ids: Sequence[str], vectors, documents: Optional[Sequence[str]] = None,
+               metadatas: Optional[Sequence[Dict[str, Any]]] = None) -> int:
+        """Appends rows (replacing earlier rows of the same ids) and commits them."""
+        if len(ids) == 0:
+            return 0
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.shape != (len(ids), self.dim):
+            raise ValueError(f"Expected vectors of shape ({len(ids)}, {self.dim}), got {vectors.shape}")
+        documents = documents or [""] * len(ids)
+        metadatas = metadatas or [{}] * len(ids)
+
+        with self._writing():
+            meta = dict(self.meta)
+            apps = list(meta["apps"])
+            app_index = dict(self._app_index)
+            count = meta["count"]
+
+            # Within one batch the last occurrence of an id wins
+            positions = sorted({str(review_id): position for position, review_id in enumerate(ids)}.values())
+            replaced = [slot for slot in (self.slot_of(ids[p]) for p in positions) if slot is not None]
+
+            quantized, scales = quantize(vectors[positions], meta["dtype"])
+            app_numbers = np.empty(len(positions), dtype=np.uint32)
+            blobs, id_lines = [], []
+            for row, position in enumerate(positions):
+                metadata = metadatas[position] or {}
+                app = str(metadata.get("appId") or "")
+                if app not in app_index:
+                    app_index[app] = len(apps)
+                    apps.append(app)
+                app_numbers[row] = app_index[app]
+                blobs.append(json.dumps({"text": documents[position], **metadata}).encode("utf-8"))
+                id_lines.append((json.dumps(str(ids[position])) + "\n").encode("utf-8"))
+
+            lengths = np.array([len(blob) for blob in blobs], dtype=np.uint32)
+            offsets = meta["docs_bytes"] + np.concatenate([[0], np.cumsum(lengths[:-1], dtype=np.uint64)])
+            docs = b"".join(blobs)
+            id_bytes = b"".join(id_lines)
+
+            # Each file is cut back to its committed size first, dropping
+            # whatever a crashed, uncommitted write left behind
+            self._append("vectors.bin", quantized.tobytes(), count * self.dim * quantized.itemsize)
+            if scales is not None:
+                self._append("scales.bin", scales.tobytes(), count * 4)
+            self._append("apps.bin", app_numbers.tobytes(), count * 4)
+            self._append("alive.bin", bytes([1]) * len(positions), count)
+            self._append("doc_offsets.bin", offsets.astype(np.uint64).tobytes(), count * 8)
+            self._append("doc_lengths.bin", lengths.tobytes(), count * 4)
+            self._append("docs.bin", docs, meta["docs_bytes"])
+            self._append("ids.txt", id_bytes, meta["ids_bytes"])
+            self._clear_alive(replaced)
+
+            meta.update(count=count + len(positions), apps=apps, dead=meta.get("dead", 0) + len(replaced),
+                        docs_bytes=meta["docs_bytes"] + len(docs), ids_bytes=meta["ids_bytes"] + len(id_bytes))
+            self._write_meta(meta)
+            self.refresh(force=True)
+            if meta.get("ivf_lists") and self.ivf_tail_ratio() > EMBEDDING_IVF_REBUILD_RATIO:
+                self.build_ivf(meta["ivf_lists"])
+        return len(positions)
+
+    def delete(self, ids: Sequence[str]) -> int:
+        with self._writing():
+            slots = [slot for slot in (self.slot_of(review_id) for review_id in ids) if slot is not None]
+            if not slots:
+                return 0
+            self._clear_alive(slots)
+            self._write_meta({**self.meta, "dead": self.meta.get("dead", 0) + len(slots)})
+            self.refresh(force=True)
+            return len(slots)
+
+    def _append(self, name: str, data: bytes, committed_size: int):
+        with open(self._file(name), "ab") as f:
+            if f.tell() != committed_size:
+                f.truncate(committed_size)
+            f.write(data)
+
+    def _clear_alive(self, slots: List[int]):
+        if not slots:
+            return
+        with open(self._file("alive.bin"), "r+b") as f:
+            for slot in slots:
+                f.seek(slot)
+                f.write(b"\x00")
+
+    def _write_meta(self, meta: Dict[str, Any]):
+        temporary = self._file("meta.json.tmp")
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self._file("meta.json"))
+
+    def build_ivf(self, lists: Optional[int] = None, iterations: int = 10, sample: int = 256, seed: int = 0):
+        """
+        Partitions the rows around `lists` centroids (spherical k-means on a
+        sample), so a query only scores the partitions nearest to it. Rows
+        added afterwards are searched exhaustively until the next build.
+        """
+        with self._writing():
+            snapshot = self._snapshot
+            count = snapshot.count
+            lists = int(lists or max(1, int(np.sqrt(count))))
+            live = np.flatnonzero(snapshot.alive)
+            if len(live) < lists:
+                raise ValueError(f"Need at least {lists} vectors to build {lists} partitions")
+            rng = np.random.default_rng(seed)
+            training = np.sort(rng.choice(live, size=min(len(live), lists * sample), replace=False))
+            points = snapshot.dequantize(training)
+            centroids = points[rng.choice(len(points), size=lists, replace=False)].copy()
+            for _ in range(iterations):
+                assignment = _nearest(points, centroids)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, assignment, points)
+                empty = np.bincount(assignment, minlength=lists) == 0
+                sums[empty] = points[rng.choice(len(points), size=int(empty.sum()))]
+                centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+
+            assignment = np.empty(count, dtype=np.int32)
+            for start in range(0, count, EMBEDDING_SEARCH_BLOCK_ROWS):
+                end = min(count, start + EMBEDDING_SEARCH_BLOCK_ROWS)
+                assignment[start:end] = _nearest(snapshot.dequantize(slice(start, end)), centroids)
+            order = np.argsort(assignment, kind="stable").astype(np.int64)
+            offsets = np.searchsorted(assignment[order], np.arange(lists + 1)).astype(np.int64)
+
+            for name, values in (("ivf_centroids.npy", centroids.astype(np.float32)),
+                                 ("ivf_order.npy", order), ("ivf_offsets.npy", offsets)):
+                # Replaced, not rewritten in place: readers may have the old file mapped
+                with open(self._file(name + ".tmp"), "wb") as f:
+                    np.save(f, values)
+                os.replace(self._file(name + ".tmp"), self._file(name))
+            self._write_meta({**self.meta, "ivf_lists": lists, "ivf_count": count,
+                              "ivf_version": self.meta.get("ivf_version", 0) + 1})
+            self.refresh(force=True)
+
+    def ivf_tail_ratio(self) -> float:
+        count = self.meta["count"]
+        return (count - self.meta.get("ivf_count", 0)) / count if count else 0.0
+
+    # -- search ---------------------------------------------------------------
+
+    def search(self, queries, top_k: int = 10, app_id: Optional[str] = None,
+               nprobe: Optional[int] = None, exhaustive: bool = False) -> List[List[Tuple[str, float]]]:
+        """
+        Cosine top_k (review_id, similarity) per query vector, best first.
+        Uses the IVF partitions when built, unless exhaustive=True.
+        """
+        self.refresh()
+        snapshot = self._snapshot
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        if snapshot.count == 0:
+            return [[] for _ in queries]
+        app = None
+        if app_id is not None:
+            app = self._app_index.get(str(app_id))
+            if app is None:
+                return [[] for _ in queries]
+        if snapshot.ivf is not None and not exhaustive:
+            results = [_search_ivf(snapshot, query, top_k, app, nprobe or EMBEDDING_IVF_NPROBE) for query in queries]
+        else:
+            results = _search_blocks(snapshot, queries, top_k, app, 0, snapshot.count)
+        ids = self.ids
+        return [[(ids[slot], score) for slot, score in result] for result in results]
+
+    def stats(self) -> Dict[str, Any]:
+        self.refresh()
+        snapshot = self._snapshot
+        meta = snapshot.meta
+        bytes_per_row = self.dim * np.dtype(DTYPES[meta["dtype"]]).itemsize + (4 if snapshot.scales is not None else 0)
+        return {
+            "vectors": len(self),
+            "rows": snapshot.count,
+            "dim": self.dim,
+            "dtype": meta["dtype"],
+            "vector_bytes": snapshot.count * bytes_per_row,
+            "float32_bytes": snapshot.count * self.dim * 4,
+            "ivf_lists": meta.get("ivf_lists", 0),
+            "ivf_tail_rows": snapshot.count - meta["ivf_count"] if meta.get("ivf_lists") else None,
+        }
+
+
+def _nearest(points: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    return np.argmax(points @ centroids.T, axis=1)
+
+
+def _search_blocks(snapshot: _Snapshot, queries: np.ndarray, top_k: int, app: Optional[int],
+                   start: int, end: int) -> List[List[Tuple[int, float]]]:
+    # Running best top_k per query, merged block by block
+    best_slots = [np.empty(0, dtype=np.int64) for _ in queries]
+    best_scores = [np.empty(0, dtype=np.float32) for _ in queries]
+    for block_start in range(start, end, EMBEDDING_SEARCH_BLOCK_ROWS):
+        block_end = min(end, block_start + EMBEDDING_SEARCH_BLOCK_ROWS)
+        rows = slice(block_start, block_end)
+        valid = snapshot.valid(rows, app)
+        if not valid.any():
+            continue
+        scores = snapshot.scores(rows, queries.T)  # (rows, queries)
+        scores[~valid] = -np.inf
+        slots = np.arange(block_start, block_end)
+        for q in range(len(queries)):
+            column = scores[:, q]
+            top = np.argpartition(-column, top_k)[:top_k] if len(column) > top_k else np.arange(len(column))
+            best_slots[q], best_scores[q] = _merge(best_slots[q], best_scores[q], slots[top], column[top], top_k)
+    return [_ranked(slots, scores) for slots, scores in zip(best_slots, best_scores)]
+
+
+def _search_ivf(snapshot: _Snapshot, query: np.ndarray, top_k: int, app: Optional[int], nprobe: int):
+    centroids, order, offsets = snapshot.ivf
+    ivf_count = snapshot.meta["ivf_count"]
+    nprobe = min(nprobe, len(centroids))
+    nearest = np.argpartition(-(centroids @ query), nprobe - 1)[:nprobe]
+    candidates = np.sort(np.concatenate([order[offsets[l]:offsets[l + 1]] for l in nearest]))
+    candidates = candidates[snapshot.valid(candidates, app)]
+
+    slots, scores = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    for block_start in range(0, len(candidates), EMBEDDING_SEARCH_BLOCK_ROWS):
+        block = candidates[block_start:block_start + EMBEDDING_SEARCH_BLOCK_ROWS]
+        block_scores = snapshot.scores(block, query)
+        slots, scores = _merge(slots, scores, block, block_scores, top_k)
+
+    # Rows written after the partitions were built are scanned exhaustively
+    if ivf_count < snapshot.count:
+        tail = _search_blocks(snapshot, query[None, :], top_k, app, ivf_count, snapshot.count)[0]
+        if tail:
+            tail_slots, tail_scores = zip(*tail)
+            slots, scores = _merge(slots, scores, np.array(tail_slots), np.array(tail_scores, np.float32), top_k)
+    return _ranked(slots, scores)
+
+
+def _merge(slots, scores, new_slots, new_scores, top_k):
+    slots = np.concatenate([slots, new_slots])
+    scores = np.concatenate([scores, new_scores.astype(np.float32)])
+    keep = np.isfinite(scores)
+    slots, scores = slots[keep], scores[keep]
+    if len(scores) > top_k:
+        top = np.argpartition(-scores, top_k)[:top_k]
+        slots, scores = slots[top], scores[top]
+    return slots, scores
+
+
+def _ranked(slots, scores) -> List[Tuple[int, float]]:
+    order = np.argsort(-scores, kind="stable")
+    return [(int(slots[i]), float(scores[i])) for i in order]
+
+
+class MemmapVectorIndex:
+    """
+    The ReviewVectorIndex interface (count / embed / upsert / query) over an
+    EmbeddingStore; selected with VECTOR_BACKEND=memmap.
+    """
+
+    def __init__(self, path: str = EMBEDDING_STORE_PATH, model_name: Optional[str] = None,
+                 dtype: str = EMBEDDING_STORE_DTYPE):
+        from sentence_transformers import SentenceTransformer
+        from vector_index import EMBEDDING_MODEL
+
+        self.model_name = model_name or EMBEDDING_MODEL
+        self.model = SentenceTransformer(self.model_name)
+        self.store = EmbeddingStore(path, dim=self.model.get_sentence_embedding_dimension(), dtype=dtype)
+
+    def count(self) -> int:
+        self.store.refresh()
+        return len(self.store)
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        from vector_index import EMBEDDING_BATCH_SIZE
+
+        vectors = self.model.encode(
+            texts,
+            batch_size=EMBEDDING_BATCH_SIZE,
+            normalize_embeddings=True,
+            show_progress_bar=False,
+        )
+        return vectors.tolist()
+
+    def upsert(self, reviews: List[Dict[str, Any]]) -> int:
+        from vector_index import prepare_reviews
+
+        ids, documents, metadatas = prepare_reviews(reviews)
+        if not ids:
+            return 0
+        return self.upsert_embedded(ids, self.embed(documents), documents, metadatas)
+
+    def upsert_embedded(self, ids: List[str], embeddings, documents: List[str],
+                        metadatas: List[Dict[str, Any]]) -> int:
+        return self.store.upsert(ids, embeddings, documents, metadatas)
+
+    def delete(self, ids: List[str]):
+        if ids:
+            self.store.delete([str(i) for i in ids])
+
+    def query(self, query: str, top_k: int = 5, app_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Returns the top_k reviews closest to the query, optionally for one app."""
+        matches = self.store.search(self.embed([query]), top_k=top_k, app_id=app_id)[0]
+        reviews = []
+        for review_id, similarity in matches:
+            slot = self.store.slot_of(review_id)
+            review = self.store.document(slot) if slot is not None else {}
+            review["id"] = review_id
+            review["similarity"] = round(similarity, 4)
+            reviews.append(review)
+        return reviews
+
+
+# -- accuracy / speed against exact float32 search ------------------------------
+
+def _synthetic(count: int, dim: int, clusters: int, seed: int) -> np.ndarray:
+    """Clustered unit vectors, closer to sentence embeddings than uniform noise."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = np.empty((count, dim), dtype=np.float32)
+    for start in range(0, count, 65536):
+        end = min(count, start + 65536)
+        vectors[start:end] = centers[rng.integers(0, clusters, end - start)]
+        vectors[start:end] += 0.6 * rng.standard_normal((end - start, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def benchmark(count: int = 200000, dim: int = 384, queries: int = 200, top_k: int = 10,
+              lists: Optional[int] = None, nprobes: Sequence[int] = (8, 16, 32), path: str = "bench_embedding_store",
+              seed: int = 0) -> List[Dict[str, Any]]:
+    """
+    Builds int8 and float16 stores from the same synthetic vectors and
+    reports recall@top_k against exact float32 search, per-query latency
+    and batched throughput.
+    """
+    import shutil
+
+    data = _synthetic(count, dim, clusters=max(16, count // 2000), seed=seed)
+    rng = np.random.default_rng(seed + 1)
+    probe = data[rng.choice(count, queries, replace=False)]
+    probe = probe + 0.3 * rng.standard_normal(probe.shape).astype(np.float32) / np.sqrt(dim)
+    probe /= np.linalg.norm(probe, axis=1, keepdims=True)
+
+    def timed(fn):
+        started = time.perf_counter()
+        value = fn()
+        return value, time.perf_counter() - started
+
+    def exact_top(q):
+        scores = data @ q
+        top = np.argpartition(-scores, top_k)[:top_k]
+        return top[np.argsort(-scores[top])]
+
+    exact, exact_seconds = timed(lambda: [exact_top(q) for q in probe])
+    exact_sets = [set(int(i) for i in row) for row in exact]
+    rows = [{"method": "float32 exact (in RAM)", "recall": 1.0, "bytes": data.nbytes,
+             "query_ms": round(exact_seconds / queries * 1000, 3)}]
+
+    def recall(results):
+        hits = sum(len(exact_sets[i] & {int(review_id) for review_id, _ in result}) for i, result in enumerate(results))
+        return round(hits / (queries * top_k), 4)
+
+    for dtype in ("float16", "int8"):
+        store_path = f"{path}_{dtype}"
+        shutil.rmtree(store_path, ignore_errors=True)
+        store = EmbeddingStore(store_path, dim=dim, dtype=dtype)
+        _, build_seconds = timed(lambda: [store.upsert([str(i) for i in range(start, min(count, start + 50000))],
+                                                       data[start:start + 50000])
+                                          for start in range(0, count, 50000)])
+        single, single_seconds = timed(lambda: [store.search(q, top_k, exhaustive=True)[0] for q in probe])
+        _, batched_seconds = timed(lambda: store.search(probe, top_k, exhaustive=True))
+        rows.append({"method": f"{dtype} brute force", "recall": recall(single),
+                     "bytes": store.stats()["vector_bytes"], "build_s": round(build_seconds, 2),
+                     "query_ms": round(single_seconds / queries * 1000, 3),
+                     "batched_query_ms": round(batched_seconds / queries * 1000, 3)})
+        if dtype == "int8":
+            _, ivf_seconds = timed(lambda: store.build_ivf(lists))
+            for nprobe in nprobes:
+                results, seconds = timed(lambda: [store.search(q, top_k, nprobe=nprobe)[0] for q in probe])
+                rows.append({"method": f"int8 IVF{store.meta['ivf_lists']} nprobe={nprobe}", "recall": recall(results),
+                             "bytes": store.stats()["vector_bytes"], "build_s": round(ivf_seconds, 2),
+                             "query_ms": round(seconds / queries * 1000, 3)})
+        shutil.rmtree(store_path, ignore_errors=True)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantized memory-mapped embedding store tools.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    bench = commands.add_parser("bench", help="recall and latency vs exact float32 search on synthetic vectors")
+    bench.add_argument("--count", type=int, default=200000)
+    bench.add_argument("--dim", type=int, default=384)
+    bench.add_argument("--queries", type=int, default=200)
+    bench.add_argument("--top-k", type=int, default=10)
+    bench.add_argument("--lists", type=int, default=None)
+    ivf = commands.add_parser("build-ivf", help="(re)build the IVF partitions of EMBEDDING_STORE_PATH")
+    ivf.add_argument("--lists", type=int, default=None, help="partitions (default: sqrt of the row count)")
+    commands.add_parser("stats", help="print the store's size and layout")
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        for row in benchmark(args.count, args.dim, args.queries, args.top_k, args.lists):
+            print(json.dumps(row))
+    elif args.command == "build-ivf":
+        store = EmbeddingStore()
+        store.build_ivf(args.lists)
+        print(json.dumps(store.stats(), indent=2))
+    else:
+        print(json.dumps(EmbeddingStore().stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+"""
+Minimal in-memory stand-in for the parts of the Firestore client the AI
+service uses: collection / document writes, where / order_by / limit /
+start_after queries, stream() and on_snapshot listeners.
+
+It lets the review store, retrieval and ingestion run offline:
+
+    db = FakeFirestore()
+    db.collection("reviews").document("r1").set({"appId": "app", "score": 5, "text": "Great"})
+
+For benchmarks, reads and writes can be slowed down and made to fail:
+
+    db = FakeFirestore(latency=0.02, error_rate=0.01, seed=42)
+"""
+import copy
+import enum
+import collections.abc
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+DOCUMENT_ID = "__name__"
+
+
+class FakeFirestoreError(Exception):
+    """Injected failure, worded like the errors the real client raises."""
+
+
+class ChangeType(enum.Enum):
+    ADDED = 1
+    REMOVED = 2
+    MODIFIED = 3
+
+
+class FakeDocumentSnapshot:
+    def __init__(self, reference, data: Optional[Dict[str, Any]]):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+
+    @property
+    def exists(self) -> bool:
+        return self._data is not None
+
+    def to_dict(self) -> Optional[Dict[str, Any]]:
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field: str):
+        if field == DOCUMENT_ID:
+            return self.id
+        return (self._data or {}).get(field)
+
+
+class FakeDocumentChange:
+    def __init__(self, change_type: ChangeType, document: FakeDocumentSnapshot):
+        self.type = change_type
+        self.document = document
+
+
+class _LazyCollectionSnapshot(collections.abc.Sequence):
+    """
+    The col_snapshot argument of a listener callback, built on first use.
+    Listeners usually only look at the changes, and building every
+    document's snapshot on every write would make filling a watched
+    collection quadratic. Unlike the real client, it shows the collection
+    as it is when first read, not as of the change.
+    """
+
+    def __init__(self, collection):
+        self._collection = collection
+        self._snapshots = None
+
+    def _load(self) -> List[FakeDocumentSnapshot]:
+        if self._snapshots is None:
+            self._snapshots = list(self._collection._stream())
+        return self._snapshots
+
+    def __getitem__(self, index):
+        return self._load()[index]
+
+    def __len__(self) -> int:
+        return len(self._load())
+
+
+class FakeWatch:
+    def __init__(self, collection, callback):
+        self._collection = collection
+        self._callback = callback
+
+    def unsubscribe(self):
+        self._collection._watches.discard(self)
+
+
+class FakeDocumentReference:
+    def __init__(self, collection, doc_id: str):
+        self._collection = collection
+        self.id = doc_id
+
+    def get(self) -> FakeDocumentSnapshot:
+        self._collection._db._simulate("get")
+        return FakeDocumentSnapshot(self, self._collection._docs.get(self.id))
+
+    def set(self, data: Dict[str, Any], merge: bool = False):
+        self._collection._db._simulate("set")
+        with self._collection._lock:
+            existing = self._collection._docs.get(self.id)
+            if merge and existing is not None:
+                data = {**existing, **data}
+            self._collection._docs[self.id] = copy.deepcopy(data)
+            change = ChangeType.ADDED if existing is None else ChangeType.MODIFIED
+        snapshot = FakeDocumentSnapshot(self, self._collection._docs.get(self.id))
+        self._collection._notify([FakeDocumentChange(change, snapshot)])
+
+    def update(self, data: Dict[str, Any]):
+        if self.id not in self._collection._docs:
+            raise KeyError(f"No document to update: {self.id}")
+        self.set(data, merge=True)
+
+    def delete(self):
+        self._collection._db._simulate("delete")
+        with self._collection._lock:
+            existing = self._collection._docs.pop(self.id, None)
+        if existing is not None:
+            snapshot = FakeDocumentSnapshot(self, existing)
+            self._collection._notify([FakeDocumentChange(ChangeType.REMOVED, snapshot)])
+
+
+class FakeQuery:
+    def __init__(self, collection, filters=None, orders=None, limit_count=None, cursor=None):
+        self._collection = collection
+        self._filters = filters or []
+        self._orders = orders or []
+        self._limit = limit_count
+        self._cursor = cursor
+
+    def _copy(self, **changes):
+        params = {
+            "filters": list(self._filters),
+            "orders": list(self._orders),
+            "limit_count": self._limit,
+            "cursor": self._cursor,
+        }
+        params.update(changes)
+        return FakeQuery(self._collection, **params)
+
+    def where(self, field: str, op: str, value):
+        return self._copy(filters=self._filters + [(field, op, value)])
+
+    def order_by(self, field: str, direction: str = "ASCENDING"):
+        return self._copy(orders=self._orders + [(field, direction)])
+
+    def limit(self, count: int):
+        return self._copy(limit_count=count)
+
+    def start_after(self, document):
+        return self._copy(cursor=document)
+
+    def stream(self):
+        self._collection._db._simulate("query")
+        return self._stream()
+
+    def _stream(self):
+        with self._collection._lock:
+            snapshots = [
+                FakeDocumentSnapshot(FakeDocumentReference(self._collection, doc_id), copy.deepcopy(data))
+                for doc_id, data in self._collection._docs.items()
+            ]
+        snapshots = [s for s in snapshots if all(_matches(s.get(f), op, v) for f, op, v in self._filters)]
+        # Like Firestore, documents without an order_by field are left out
+        snapshots = [s for s in snapshots
+                     if all(f == DOCUMENT_ID or f in (s._data or {}) for f, _ in self._orders)]
+
+        orders = self._orders or [(DOCUMENT_ID, "ASCENDING")]
+        for field, direction in reversed(orders):
+            snapshots.sort(key=lambda s: (_sortable(s.get(field)), s.id), reverse=direction == "DESCENDING")
+
+        if self._cursor is not None:
+            cursor_id = self._cursor.id if hasattr(self._cursor, "id") else str(self._cursor)
+            ids = [s.id for s in snapshots]
+            if cursor_id in ids:
+                snapshots = snapshots[ids.index(cursor_id) + 1:]
+
+        if self._limit is not None:
+            snapshots = snapshots[:self._limit]
+        return iter(snapshots)
+
+    def get(self) -> List[FakeDocumentSnapshot]:
+        return list(self.stream())
+
+
+class FakeCollectionReference(FakeQuery):
+    def __init__(self, name: str, db: "FakeFirestore"):
+        super().__init__(self)
+        self._db = db
+        self.id = name
+        self._docs = {}
+        self._watches = set()
+        self._lock = threading.RLock()
+        self._auto_id = 0
+
+    def document(self, doc_id: Optional[str] = None) -> FakeDocumentReference:
+        if doc_id is None:
+            with self._lock:
+                self._auto_id += 1
+                doc_id = f"auto-{self._auto_id}"
+        return FakeDocumentReference(self, doc_id)
+
+    def add(self, data: Dict[str, Any]):
+        ref = self.document()
+        ref.set(data)
+        return None, ref
+
+    def on_snapshot(self, callback: Callable) -> FakeWatch:
+        """Like Firestore: the first callback delivers every document as ADDED."""
+        watch = FakeWatch(self, callback)
+        snapshots = list(self._stream())
+        self._watches.add(watch)
+        callback(snapshots, [FakeDocumentChange(ChangeType.ADDED, s) for s in snapshots], None)
+        return watch
+
+    def _notify(self, changes: List[FakeDocumentChange]):
+        # Only the changed documents are built here; the full collection
+        # snapshot is left for the (rare) listener that reads it
+        if not self._watches:
+            return
+        snapshots = _LazyCollectionSnapshot(self)
+        for watch in list(self._watches):
+            watch._callback(snapshots, changes, None)
+
+
+class FakeFirestore:
+    """
+    latency (seconds, +/- jitter) is slept on every read and write, and
+    error_rate of them raise FakeFirestoreError. Listener deliveries are
+    never delayed. A seed makes the injected latencies and failures repeatable.
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 seed: Optional[int] = None):
+        self._collections = {}
+        self._lock = threading.Lock()
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self.operations = 0
+        self.injected_errors = 0
+
+    def collection(self, name: str) -> FakeCollectionReference:
+        with self._lock:
+            if name not in self._collections:
+                self._collections[name] = FakeCollectionReference(name, self)
+            return self._collections[name]
+
+    def _simulate(self, operation: str):
+        with self._lock:
+            self.operations += 1
+            delay = self.latency + self._random.uniform(-self.jitter, self.jitter) if self.latency else 0.0
+            fail = self.error_rate > 0 and self._random.random() < self.error_rate
+            if fail:
+                self.injected_errors += 1
+        if delay > 0:
+            time.sleep(delay)
+        if fail:
+            raise FakeFirestoreError(f"503 UNAVAILABLE: injected {operation} failure")
+
+
+def _sortable(value):
+    # None sorts first, then numbers, then everything else as strings
+    if value is None:
+        return (0, 0)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    if hasattr(value, "timestamp"):
+        return (1, value.timestamp())
+    return (2, str(value))
+
+
+def _matches(actual, op: str, expected) -> bool:
+    if op == "==":
+        return actual == expected
+    if op == "!=":
+        return actual != expected
+    if op == "in":
+        return actual in expected
+    if actual is None:
+        return False
+    if op == "<":
+        return _sortable(actual) < _sortable(expected)
+    if op == "<=":
+        return _sortable(actual) <= _sortable(expected)
+    if op == ">":
+        return _sortable(actual) > _sortable(expected)
+    if op == ">=":
+        return _sortable(actual) >= _sortable(expected)
+    raise ValueError(f"Unsupported operator: {op}")
@@ -0,0 +1,237 @@
+"""
+Deterministic local stand-in for google.genai.Client, for benchmarks and
+offline runs. Covers what the AI service calls:
+
+    client.models.generate_content / generate_content_stream        (sync)
+    client.aio.models.generate_content / generate_content_stream    (async)
+    client.aio.live.connect(...) sessions                            (live audio)
+
+Answers are derived from a hash of the prompt, latencies come from a seeded
+RNG, and a fraction of calls can be made to fail with errors shaped like the
+real API's (quota, not found, timeout), so the model router reacts to them.
+
+    import fake_genai
+    fake_genai.install(latency=0.3, error_rate=0.05, seed=42)  # patches genai.Client
+"""
+import time
+import random
+import asyncio
+import hashlib
+import threading
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional, Sequence
+
+# Error messages the model router's classify_error understands
+ERROR_MESSAGES = {
+    "quota": "429 RESOURCE_EXHAUSTED. Quota exceeded for this model (injected)",
+    "not_found": "404 NOT_FOUND. models/unknown is not found (injected)",
+    "error": "500 INTERNAL. An internal error has occurred (injected)",
+}
+
+WORDS = (
+    "users", "mention", "crashes", "after", "the", "latest", "update", "battery", "drain", "login",
+    "issues", "praise", "new", "dashboard", "sync", "is", "slow", "notifications", "work", "well",
+)
+
+
+class FakeGenAIError(Exception):
+    """Injected API failure."""
+
+
+class FakeBehavior:
+    """Shared latency / failure settings; seeded so a run can be repeated exactly."""
+
+    def __init__(self, latency: float = 0.2, jitter: float = 0.05, first_chunk_latency: Optional[float] = None,
+                 chunk_interval: float = 0.02, chunks: int = 8, sentences: int = 1, error_rate: float = 0.0,
+                 error_kinds: Sequence[str] = ("quota",), failing_models: Sequence[str] = (),
+                 live_reply_chunks: int = 5, live_turn_chunks: int = 10, live_connect_latency: float = 0.3,
+                 audio_chunk_bytes: int = 4800, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.first_chunk_latency = latency if first_chunk_latency is None else first_chunk_latency
+        self.chunk_interval = chunk_interval
+        self.chunks = chunks
+        self.sentences = sentences
+        self.error_rate = error_rate
+        self.error_kinds = tuple(error_kinds)
+        self.failing_models = set(failing_models)
+        self.live_reply_chunks = live_reply_chunks
+        self.live_turn_chunks = live_turn_chunks
+        self.live_connect_latency = live_connect_latency
+        self.audio_chunk_bytes = audio_chunk_bytes
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.injected_errors = 0
+        self.live_sessions = 0
+
+    def delay(self, base: float) -> float:
+        with self._lock:
+            return max(0.0, base + self._random.uniform(-self.jitter, self.jitter))
+
+    def maybe_fail(self, model: str):
+        with self._lock:
+            self.calls += 1
+            if model in self.failing_models:
+                kind = "not_found"
+            elif self.error_rate > 0 and self._random.random() < self.error_rate:
+                kind = self._random.choice(self.error_kinds)
+            else:
+                return
+            self.injected_errors += 1
+        if kind == "timeout":
+            raise asyncio.TimeoutError()
+        raise FakeGenAIError(ERROR_MESSAGES.get(kind, ERROR_MESSAGES["error"]))
+
+    def answer(self, contents) -> str:
+        sentences = []
+        for index in range(max(1, self.sentences)):
+            key = str(contents) if index == 0 else f"{index}:{contents}"
+            digest = hashlib.sha1(key.encode("utf-8")).digest()
+            words = [WORDS[b % len(WORDS)] for b in digest[:12]]
+            sentences.append(" ".join(words).capitalize() + ".")
+        return " ".join(sentences)
+
+    def split(self, text: str):
+        words = text.split(" ")
+        size = max(1, -(-len(words) // max(1, self.chunks)))
+        for start in range(0, len(words), size):
+            yield " ".join(words[start:start + size]) + (" " if start + size < len(words) else "")
+
+
+class FakeResponse:
+    def __init__(self, text: Optional[str] = None, data: Optional[bytes] = None):
+        self.text = text
+        self.data = data
+
+
+class _Models:
+    def __init__(self, behavior: FakeBehavior):
+        self._behavior = behavior
+
+    def generate_content(self, model: str, contents, config=None) -> FakeResponse:
+        time.sleep(self._behavior.delay(self._behavior.latency))
+        self._behavior.maybe_fail(model)
+        return FakeResponse(self._behavior.answer(contents))
+
+    def generate_content_stream(self, model: str, contents, config=None):
+        behavior = self._behavior
+        time.sleep(behavior.delay(behavior.first_chunk_latency))
+        behavior.maybe_fail(model)
+        for index, text in enumerate(behavior.split(behavior.answer(contents))):
+            if index:
+                time.sleep(behavior.chunk_interval)
+            yield FakeResponse(text)
+
+
+class _AsyncModels:
+    def __init__(self, behavior: FakeBehavior):
+        self._behavior = behavior
+
+    async def generate_content(self, model: str, contents, config=None) -> FakeResponse:
+        await asyncio.sleep(self._behavior.delay(self._behavior.latency))
+        self._behavior.maybe_fail(model)
+        return FakeResponse(self._behavior.answer(contents))
+
+    async def generate_content_stream(self, model: str, contents, config=None):
+        # Like the SDK: awaiting the call yields an async iterator of chunks
+        behavior = self._behavior
+        await asyncio.sleep(behavior.delay(behavior.first_chunk_latency))
+        behavior.maybe_fail(model)
+
+        async def chunks():
+            for index, text in enumerate(behavior.split(behavior.answer(contents))):
+                if index:
+                    await asyncio.sleep(behavior.chunk_interval)
+                yield FakeResponse(text)
+
+        return chunks()
+
+
+class FakeLiveSession:
+    """
+    Replies with live_reply_chunks audio chunks after every live_turn_chunks
+    audio inputs (standing in for server-side turn detection) and after
+    audio_stream_end. receive() ends once the input has ended and every
+    reply has been delivered.
+    """
+
+    def __init__(self, behavior: FakeBehavior, model: str):
+        self._behavior = behavior
+        self.model = model
+        self._inbox = asyncio.Queue()
+        self._since_reply = 0
+        self._ended = False
+        self.audio_in = 0
+        self.bytes_in = 0
+
+    async def send_realtime_input(self, audio=None, audio_stream_end: Optional[bool] = None, **kwargs):
+        if self._ended:
+            raise FakeGenAIError("1000 (OK) session input already ended")
+        if audio is not None:
+            self.audio_in += 1
+            self.bytes_in += len(getattr(audio, "data", audio) or b"")
+            self._since_reply += 1
+            if self._since_reply >= self._behavior.live_turn_chunks:
+                self._since_reply = 0
+                self._inbox.put_nowait("turn")
+        if audio_stream_end:
+            self._ended = True
+            self._inbox.put_nowait("end")
+
+    async def receive(self):
+        behavior = self._behavior
+        while True:
+            event = await self._inbox.get()
+            await asyncio.sleep(behavior.delay(behavior.first_chunk_latency))
+            for index in range(behavior.live_reply_chunks):
+                if index:
+                    await asyncio.sleep(behavior.chunk_interval)
+                yield FakeResponse(data=bytes(behavior.audio_chunk_bytes))
+            if event == "end":
+                return
+
+
+class _Live:
+    def __init__(self, behavior: FakeBehavior):
+        self._behavior = behavior
+
+    @asynccontextmanager
+    async def connect(self, model: str, config: Optional[Dict[str, Any]] = None):
+        behavior = self._behavior
+        await asyncio.sleep(behavior.delay(behavior.live_connect_latency))
+        behavior.maybe_fail(model)
+        behavior.live_sessions += 1
+        yield FakeLiveSession(behavior, model)
+
+
+class _AsyncClient:
+    def __init__(self, behavior: FakeBehavior):
+        self.models = _AsyncModels(behavior)
+        self.live = _Live(behavior)
+
+    async def aclose(self):
+        pass
+
+
+class FakeClient:
+    """Drop-in for genai.Client(api_key=..., http_options=...)."""
+
+    def __init__(self, api_key: Optional[str] = None, http_options=None, behavior: Optional[FakeBehavior] = None,
+                 **kwargs):
+        self.behavior = behavior or FakeBehavior()
+        self.models = _Models(self.behavior)
+        self.aio = _AsyncClient(self.behavior)
+
+
+def install(behavior: Optional[FakeBehavior] = None, **options) -> FakeBehavior:
+    """
+    Replaces google.genai.Client with FakeClient for the whole process; all
+    clients created afterwards share one FakeBehavior. Returns it, so callers
+    can read its counters or change settings mid-run.
+    """
+    from google import genai
+
+    behavior = behavior or FakeBehavior(**options)
+    genai.Client = lambda *args, **kwargs: FakeClient(*args, behavior=behavior, **kwargs)
+    return behavior
@@ -1,75 +1,122 @@
 import os
 import asyncio
-import traceback
-from google import genai
+import logging
 from dotenv import load_dotenv
+from logging_setup import sampled_logger
 
 load_dotenv()
+logger = logging.getLogger(__name__)
+audio_logger = sampled_logger(__name__ + ".audio_in")
+
+# Using the experimental flash model for live capabilities
+LIVE_MODEL = "models/gemini-2.0-flash-exp"
+LIVE_CONFIG = {"response_modalities": ["AUDIO"]}
 
 class GeminiLiveClient:
-    def __init__(self):
+    def __init__(self, client=None, pool=None):
+        """
+        Args:
+            client: A shared genai.Client; a new one is created if omitted.
+            pool: Optional live_pool.LiveSessionPool to take a pre-connected session from.
+        """
         self.api_key = os.getenv("GOOGLE_API_KEY")
         if not self.api_key:
-            print("Error: GOOGLE_API_KEY not found in environment variables")
+            logger.error("GOOGLE_API_KEY not found in environment variables")
         
-        self.client = genai.Client(api_key=self.api_key, http_options={"api_version": "v1beta"})
-        self.model = "models/gemini-2.0-flash-exp"  # Using the experimental flash model for live capabilities
+        if client is None:
+            from google import genai
+            client = genai.Client(api_key=self.api_key, http_options={"api_version": "v1beta"})
+        self.client = client
+        self.pool = pool
+        self.model = LIVE_MODEL
+        self.config = LIVE_CONFIG
 
-    async def connect(self, input_stream, output_queue):
+    async def connect(self, input_stream, output_queue, mime_type="audio/pcm;rate=16000"):
         """
         Connects to the Gemini Live API.
         
         Args:
-            input_stream: An async generator yielding audio bytes from the client.
-            output_queue: An asyncio.Queue to put audio bytes (or messages) to send back to client.
+            input_stream: An async generator yielding PCM audio buffers (bytes or memoryview) from the client.
+            output_queue: A queue (asyncio.Queue or audio_pipeline.AudioQueue) to put audio bytes (or messages) to send back to client.
+            mime_type: MIME type of the input audio, including its sample rate.
         """
         if not self.api_key:
              await output_queue.put({"error": "config_error", "message": "API Key missing"})
              return
 
-        config = {"response_modalities": ["AUDIO"]}
-        
         try:
-            # Note: exact syntax depends on SDK version, assuming standard goog-genai pattern
-            async with self.client.aio.live.connect(model=self.model, config=config) as session:
-                print("Connected to Gemini Live API")
-                
-                async def send_audio_loop():
-                    try:
-                        async for data in input_stream:
-                            if data is None:
-                                break
-                            # Send audio chunk
-                            # Using "audio/pcm" or "application/pcm" depending on SDK expectations, often just raw bytes with mime_type
-                            await session.send(input={"data": data, "mime_type": "audio/pcm"}, end_of_turn=True)
-                    except Exception as e:
-                        print(f"Error in send_audio_loop: {e}")
-
-                async def receive_audio_loop():
-                    try:
-                        async for response in session.receive():
-                            # The response structure depends on the SDK
-                            # Typically response.data is the audio bytes if modality is AUDIO
-                            if response.data:
-                                await output_queue.put(response.data)
-                            elif response.text:
-                                # In case we get text debug info or fallback
-                                pass
-                    except Exception as e:
-                        print(f"Error in receive_audio_loop: {e}")
-                        # Don't break immediately on receive error, let session handle it or reconnect if needed?
-                        # For now, just log.
-
-                # Run both loops
-                # We need to manage their lifecycle. 
-                # If input stream closes, we might still want to receive pending audio.
-                
-                send_task = asyncio.create_task(send_audio_loop())
-                receive_task = asyncio.create_task(receive_audio_loop())
-                
-                await asyncio.gather(send_task, receive_task)
+            if self.pool is not None:
+                # Take a warm session; it goes back to the pool only if the
+                # session ended normally without any audio being sent on it.
+                # Cancelled or failed sessions are always closed.
+                pooled = await self.pool.acquire(self.model, self.config)
+                logger.info("Connected to Gemini Live API", extra={"warm": pooled.warm})
+                reusable = False
+                try:
+                    await self._run_session(pooled.session, input_stream, output_queue, mime_type, pooled)
+                    reusable = not pooled.used
+                finally:
+                    await self.pool.release(pooled, reusable=reusable)
+            else:
+                async with self.client.aio.live.connect(model=self.model, config=self.config) as session:
+                    logger.info("Connected to Gemini Live API", extra={"warm": False})
+                    await self._run_session(session, input_stream, output_queue, mime_type)
                 
         except Exception as e:
-            print(f"Error connecting to Gemini Live: {e}")
-            traceback.print_exc()
+            logger.exception("Error connecting to Gemini Live")
             await output_queue.put({"error": "connection_error", "message": str(e)})
+
+    async def _run_session(self, session, input_stream, output_queue, mime_type, pooled=None):
+        """Pumps audio both ways until both loops finish. Marks pooled as used before the first send."""
+        from google.genai import types
+
+        sent = 0
+
+        async def send_audio_loop():
+            nonlocal sent
+            try:
+                async for data in input_stream:
+                    if data is None:
+                        break
+                    # Stream audio as continuous realtime input; the server's voice
+                    # activity detection decides where turns end. The SDK needs
+                    # bytes, so pooled buffers are copied once here.
+                    if pooled is not None:
+                        pooled.used = True
+                    await session.send_realtime_input(
+                        audio=types.Blob(data=bytes(data), mime_type=mime_type)
+                    )
+                    sent += 1
+                if sent:
+                    await session.send_realtime_input(audio_stream_end=True)
+            except Exception as e:
+                logger.error("Error in send_audio_loop: %s", e)
+
+        async def receive_audio_loop():
+            try:
+                async for response in session.receive():
+                    # The response structure depends on the SDK
+                    # Typically response.data is the audio bytes if modality is AUDIO
+                    if response.data:
+                        await output_queue.put(response.data)
+                        audio_logger.debug("Live audio chunk received", extra={"bytes": len(response.data)})
+                    elif response.text:
+                        # In case we get text debug info or fallback
+                        pass
+            except Exception as e:
+                logger.error("Error in receive_audio_loop: %s", e)
+                # Don't break immediately on receive error, let session handle it or reconnect if needed?
+                # For now, just log.
+
+        # Run both loops
+        # We need to manage their lifecycle. 
+        # If input stream closes, we might still want to receive pending audio.
+        
+        send_task = asyncio.create_task(send_audio_loop())
+        receive_task = asyncio.create_task(receive_audio_loop())
+        
+        try:
+            await asyncio.gather(send_task, receive_task)
+        finally:
+            send_task.cancel()
+            receive_task.cancel()
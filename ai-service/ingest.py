@@ -0,0 +1,364 @@
+"""
+Bulk, incremental ingestion of the Firestore 'reviews' collection into the
+vector index.
+
+    python ingest.py                  # new/changed reviews since the last run
+    python ingest.py --full           # start over from the oldest review
+    python ingest.py --workers 8 --page-size 5000
+
+Reviews are read in pages ordered by their date, embedded in batches across
+a process pool (one model copy per worker, so every core is busy) and written
+to the index one page at a time. After each written page the (date, id) of
+its last review is saved to a checkpoint file, so a crashed or interrupted
+run resumes where it stopped and the next run only picks up reviews dated
+since. The service exposes the same job as POST /ingest.
+
+Reviews without the date field are not visited (Firestore leaves them out of
+queries ordered by it); a run that finds none at all while the collection has
+reviews fails instead of reporting nothing to do. `python rag_tool.py`
+re-indexes everything. Deleted reviews are not removed from the index by
+ingestion.
+"""
+import os
+import json
+import time
+import argparse
+import threading
+import multiprocessing
+import logging
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from vector_index import prepare_reviews
+from metrics import INGESTED_REVIEWS
+from logging_setup import setup_cli_logging
+
+logger = logging.getLogger(__name__)
+
+# Field holding a review's time (the scraper writes `date`); the incremental cursor follows it
+INGEST_UPDATED_FIELD = os.getenv("INGEST_UPDATED_FIELD", "date")
+INGEST_CHECKPOINT_PATH = os.getenv("INGEST_CHECKPOINT_PATH", "ingest_checkpoint.json")
+# Reviews read from Firestore (and written to the index) per page
+INGEST_PAGE_SIZE = int(os.getenv("INGEST_PAGE_SIZE", "2000"))
+# Texts per embedding task handed to a worker process
+INGEST_EMBED_BATCH_SIZE = int(os.getenv("INGEST_EMBED_BATCH_SIZE", "256"))
+# Embedding processes; 0 embeds in the calling process with the index's own model
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 1)))
+# Cap on embedding processes for POST /ingest, which shares the host with the
+# service's own workers (each process loads its own model copy)
+INGEST_API_WORKERS = int(os.getenv("INGEST_API_WORKERS", "2"))
+# Pages read ahead while earlier ones are still being embedded
+INGEST_MAX_PENDING_PAGES = int(os.getenv("INGEST_MAX_PENDING_PAGES", "2"))
+INGEST_READ_RETRIES = int(os.getenv("INGEST_READ_RETRIES", "3"))
+
+DOCUMENT_ID = "__name__"
+
+
+# -- worker processes ----------------------------------------------------------
+
+_worker_model = None
+
+
+def _init_worker(model_name: str, threads: int):
+    global _worker_model
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    # Workers split the cores between them instead of each using all of them
+    torch.set_num_threads(threads)
+    _worker_model = SentenceTransformer(model_name)
+
+
+def _embed_in_worker(texts: List[str]):
+    return _worker_model.encode(
+        texts,
+        batch_size=len(texts),
+        normalize_embeddings=True,
+        convert_to_numpy=True,
+        show_progress_bar=False,
+    ).astype("float32")
+
+
+# -- checkpoint ----------------------------------------------------------------
+
+def _encode_cursor_value(value):
+    if isinstance(value, datetime):
+        return {"timestamp": value.isoformat()}
+    return value
+
+
+def _decode_cursor_value(value):
+    if isinstance(value, dict) and "timestamp" in value:
+        return datetime.fromisoformat(value["timestamp"])
+    return value
+
+
+def load_checkpoint(path: str = INGEST_CHECKPOINT_PATH) -> Dict[str, Any]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            checkpoint = json.load(f)
+    except FileNotFoundError:
+        return {}
+    checkpoint["updated_at"] = _decode_cursor_value(checkpoint.get("updated_at"))
+    return checkpoint
+
+
+def save_checkpoint(checkpoint: Dict[str, Any], path: str = INGEST_CHECKPOINT_PATH):
+    """Written to a temporary file and renamed, so a crash never leaves half a checkpoint."""
+    data = {**checkpoint, "updated_at": _encode_cursor_value(checkpoint.get("updated_at"))}
+    temporary = f"{path}.tmp"
+    with open(temporary, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(temporary, path)
+
+
+# -- ingestion -----------------------------------------------------------------
+
+class ReviewIngester:
+    """
+    One ingestion run over a Firestore-compatible client into a vector
+    index (see vector_index.create_vector_index). run() blocks; stats()
+    can be read from another thread while it is going.
+    """
+
+    def __init__(self, db, index, checkpoint_path: str = INGEST_CHECKPOINT_PATH,
+                 page_size: int = INGEST_PAGE_SIZE, batch_size: int = INGEST_EMBED_BATCH_SIZE,
+                 workers: int = INGEST_WORKERS, updated_field: str = INGEST_UPDATED_FIELD,
+                 max_pending_pages: int = INGEST_MAX_PENDING_PAGES):
+        self.db = db
+        self.index = index
+        self.checkpoint_path = checkpoint_path
+        self.page_size = page_size
+        self.batch_size = batch_size
+        self.workers = workers
+        self.updated_field = updated_field
+        self.max_pending_pages = max(1, max_pending_pages)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.state = "idle"
+        self.error = None
+        self.read = 0
+        self.written = 0
+        self.skipped = 0
+        self.pages = 0
+        self.started_at = None
+        self.finished_at = None
+        self.stage_seconds = {"read": 0.0, "embed_wait": 0.0, "write": 0.0}
+        self.checkpoint = {}
+
+    def stop(self):
+        """Asks a running ingestion to stop after the page it is writing."""
+        self._stop.set()
+
+    def run(self, full: bool = False, max_reviews: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Ingests reviews updated since the checkpoint (all of them with full=True).
+        Returns stats(); raises if reading, embedding or writing fails, leaving
+        the checkpoint at the last page that was fully written.
+        """
+        with self._lock:
+            if self.state == "running":
+                raise RuntimeError("Ingestion is already running")
+            self.state = "running"
+        self.error = None
+        self.read = self.written = self.skipped = self.pages = 0
+        self.stage_seconds = {stage: 0.0 for stage in self.stage_seconds}
+        self.started_at, self.finished_at = time.time(), None
+        self._stop.clear()
+
+        self.checkpoint = {} if full else load_checkpoint(self.checkpoint_path)
+        if self.checkpoint.get("updated_field", self.updated_field) != self.updated_field:
+            self.checkpoint = {}
+        if self.checkpoint:
+            logger.info("Resuming ingestion after %s (%s)", self.checkpoint.get("updated_at"), self.checkpoint.get("id"))
+
+        pool = None
+        try:
+            if self.workers > 0:
+                threads = max(1, (os.cpu_count() or 1) // self.workers)
+                # spawn: forked copies of a process that already loaded torch can deadlock
+                pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.index.model_name, threads),
+                )
+            self._ingest(pool, max_reviews)
+            self.state = "stopped" if self._stop.is_set() else "done"
+        except BaseException as e:
+            self.state = "failed"
+            self.error = f"{type(e).__name__}: {str(e)[:200]}"
+            raise
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+            self.finished_at = time.time()
+            stats = self.stats()
+            logger.info("Ingestion %s: %d reviews written in %.1fs (%.0f reviews/s)", self.state,
+                        stats["written"], stats["elapsed_seconds"], stats["reviews_per_second"])
+        return self.stats()
+
+    def _ingest(self, pool, max_reviews: Optional[int]):
+        # Pages whose embeddings are still being computed, oldest first. Reading
+        # the next page overlaps with embedding the previous ones, and pages are
+        # written (and checkpointed) strictly in order.
+        pending = deque()
+        for docs in self._pages():
+            if max_reviews is not None and self.read >= max_reviews:
+                break
+            if max_reviews is not None:
+                docs = docs[:max_reviews - self.read]
+            self.read += len(docs)
+            pending.append(self._submit(pool, docs))
+            while len(pending) >= self.max_pending_pages:
+                self._write(pending.popleft())
+            if self._stop.is_set():
+                break
+        while pending:
+            self._write(pending.popleft())
+
+    def _query(self):
+        query = self.db.collection("reviews")
+        cursor_value = self.checkpoint.get("updated_at")
+        if cursor_value is not None:
+            query = query.where(self.updated_field, ">=", cursor_value)
+        return query.order_by(self.updated_field).order_by(DOCUMENT_ID)
+
+    def _pages(self):
+        query = self._query()
+        cursor_value, cursor_id = self.checkpoint.get("updated_at"), self.checkpoint.get("id")
+        last_doc = None
+        while True:
+            page = query.limit(self.page_size)
+            if last_doc is not None:
+                page = page.start_after(last_doc)
+            started = time.perf_counter()
+            docs = self._read_page(page)
+            self.stage_seconds["read"] += time.perf_counter() - started
+            if not docs:
+                if last_doc is None and cursor_value is None:
+                    self._check_field_present()
+                return
+            last_doc = docs[-1]
+            if cursor_value is not None:
+                # The query restarts at the checkpoint's timestamp; drop reviews
+                # with that timestamp that were already written
+                docs = [doc for doc in docs
+                        if not (doc.get(self.updated_field) == cursor_value and doc.id <= cursor_id)]
+                if not docs:
+                    continue
+            yield docs
+
+    def _check_field_present(self):
+        # An empty first page from the start of the collection means no review
+        # has the field; with reviews present that is a misconfiguration
+        if self._read_page(self.db.collection("reviews").limit(1)):
+            raise RuntimeError(
+                f"No reviews have the '{self.updated_field}' field; set INGEST_UPDATED_FIELD "
+                "to the field holding the review time"
+            )
+
+    def _read_page(self, page):
+        for attempt in range(INGEST_READ_RETRIES + 1):
+            try:
+                return list(page.stream())
+            except Exception as e:
+                if attempt == INGEST_READ_RETRIES:
+                    raise
+                logger.warning("Error reading reviews page, retrying: %s", e)
+                time.sleep(0.5 * 2 ** attempt)
+
+    def _submit(self, pool, docs):
+        reviews = [{"id": doc.id, **(doc.to_dict() or {})} for doc in docs]
+        ids, documents, metadatas = prepare_reviews(reviews)
+        self.skipped += len(docs) - len(ids)
+        if pool is None or not documents:
+            futures = None
+        else:
+            futures = [pool.submit(_embed_in_worker, documents[start:start + self.batch_size])
+                       for start in range(0, len(documents), self.batch_size)]
+        last = docs[-1]
+        cursor = {"updated_at": last.get(self.updated_field), "id": last.id}
+        return ids, documents, metadatas, futures, cursor
+
+    def _write(self, pending_page):
+        ids, documents, metadatas, futures, cursor = pending_page
+        started = time.perf_counter()
+        if futures is not None:
+            embeddings = []
+            for future in futures:
+                embeddings.extend(future.result())
+        elif documents:
+            embeddings = self.index.embed(documents)
+        else:
+            embeddings = []
+        self.stage_seconds["embed_wait"] += time.perf_counter() - started
+
+        started = time.perf_counter()
+        written = self.index.upsert_embedded(ids, embeddings, documents, metadatas)
+        self.stage_seconds["write"] += time.perf_counter() - started
+
+        self.written += written
+        self.pages += 1
+        INGESTED_REVIEWS.inc(written)
+        self.checkpoint = {**cursor, "updated_field": self.updated_field,
+                           "total": self.checkpoint.get("total", 0) + written}
+        save_checkpoint(self.checkpoint, self.checkpoint_path)
+        stats = self.stats()
+        logger.info("Ingested %d reviews (%.0f reviews/s)", stats["written"], stats["reviews_per_second"])
+
+    def stats(self) -> Dict[str, Any]:
+        end = self.finished_at or time.time()
+        elapsed = end - self.started_at if self.started_at else 0.0
+        checkpoint = self.checkpoint
+        return {
+            "state": self.state,
+            "error": self.error,
+            "read": self.read,
+            "written": self.written,
+            "skipped": self.skipped,
+            "pages": self.pages,
+            "workers": self.workers,
+            "elapsed_seconds": round(elapsed, 3),
+            "reviews_per_second": round(self.written / elapsed, 1) if elapsed > 0 else 0.0,
+            "stage_seconds": {stage: round(seconds, 3) for stage, seconds in self.stage_seconds.items()},
+            "checkpoint": {
+                "updated_at": str(checkpoint["updated_at"]) if checkpoint.get("updated_at") is not None else None,
+                "id": checkpoint.get("id"),
+                "total": checkpoint.get("total", 0),
+            },
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embed Firestore reviews into the local vector index.")
+    parser.add_argument("--full", action="store_true", help="ignore the checkpoint and start from the oldest review")
+    parser.add_argument("--page-size", type=int, default=INGEST_PAGE_SIZE)
+    parser.add_argument("--batch-size", type=int, default=INGEST_EMBED_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS)
+    parser.add_argument("--checkpoint", default=INGEST_CHECKPOINT_PATH)
+    parser.add_argument("--max-reviews", type=int, default=None, help="stop after this many reviews")
+    args = parser.parse_args()
+    # Progress lines on stderr; stdout is left for the final stats
+    setup_cli_logging()
+
+    from rag_tool import create_firestore_client
+    from vector_index import create_vector_index
+
+    db = create_firestore_client()
+    if db is None:
+        raise SystemExit("Firestore client not initialized. Check credentials.")
+    ingester = ReviewIngester(db, create_vector_index(), checkpoint_path=args.checkpoint,
+                              page_size=args.page_size, batch_size=args.batch_size, workers=args.workers)
+    try:
+        stats = ingester.run(full=args.full, max_reviews=args.max_reviews)
+    except KeyboardInterrupt:
+        stats = ingester.stats()
+        print("Interrupted; the next run resumes from the checkpoint")
+    print(json.dumps(stats, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Dict
+
+logger = logging.getLogger(__name__)
+
+# Warm Gemini Live sessions kept ready per (model, config); 0 disables the pool
+LIVE_POOL_SIZE = int(os.getenv("LIVE_POOL_SIZE", "2"))
+# The pool only fills after a first /ws/agent session, and stops topping up
+# once no session has been taken for this long, so an idle worker holds no
+# Live connections (and spends no quota reconnecting them)
+LIVE_POOL_KEEP_WARM_SECONDS = float(os.getenv("LIVE_POOL_KEEP_WARM_SECONDS", "600"))
+# Idle warm sessions are retired after this long; the server drops idle
+# live sessions on its own after a while
+LIVE_POOL_MAX_IDLE_SECONDS = float(os.getenv("LIVE_POOL_MAX_IDLE_SECONDS", "120"))
+# How often the background task tops the pool up / retires stale sessions
+LIVE_POOL_REFILL_INTERVAL_SECONDS = float(os.getenv("LIVE_POOL_REFILL_INTERVAL_SECONDS", "1"))
+# Back-off after a failed warm-up connect (e.g. quota), so the refill loop doesn't hammer the API
+LIVE_POOL_ERROR_BACKOFF_SECONDS = float(os.getenv("LIVE_POOL_ERROR_BACKOFF_SECONDS", "30"))
+
+
+def pool_key(model: str, config: Dict[str, Any]) -> str:
+    return f"{model}|{json.dumps(config, sort_keys=True, default=str)}"
+
+
+class PooledLiveSession:
+    """
+    An entered client.aio.live.connect() context, held open outside `async with`.
+    used is set before the first audio is sent; from then on the session
+    holds someone's conversation and must never go back into the pool.
+    """
+
+    __slots__ = ("key", "session", "_context", "created_at", "warm", "used")
+
+    def __init__(self, key: str, session, context, warm: bool):
+        self.key = key
+        self.session = session
+        self._context = context
+        self.created_at = time.monotonic()
+        self.warm = warm
+        self.used = False
+
+    @property
+    def is_open(self) -> bool:
+        ws = getattr(self.session, "_ws", None)
+        return ws is None or getattr(ws, "close_code", None) is None
+
+    async def close(self):
+        try:
+            await self._context.__aexit__(None, None, None)
+        except Exception as e:
+            logger.warning("Error closing live session: %s", e)
+
+
+class LiveSessionPool:
+    """
+    Keeps a few Gemini Live sessions connected ahead of time, per model and
+    config, so a new /ws/agent connection skips the TLS and live-session
+    handshakes. A background task refills the pool and retires idle
+    sessions, but only for keys acquired within keep_warm seconds. Sessions
+    that carried a conversation are closed, not reused.
+    """
+
+    def __init__(self, client, size: int = LIVE_POOL_SIZE, max_idle: float = LIVE_POOL_MAX_IDLE_SECONDS,
+                 keep_warm: float = LIVE_POOL_KEEP_WARM_SECONDS):
+        self.client = client
+        self.size = size
+        self.max_idle = max_idle
+        self.keep_warm = keep_warm
+        self._idle = {}  # key -> deque of PooledLiveSession
+        self._targets = {}  # key -> (model, config) to keep warm
+        self._connecting = {}  # key -> number of warm-ups in flight
+        self._backoff_until = {}  # key -> monotonic time
+        self._last_acquired = {}  # key -> monotonic time of the last acquire()
+        self._refill_task = None
+        self._wake = asyncio.Event()
+        self.hits = 0
+        self.misses = 0
+        self.connects = 0
+        self.connect_errors = 0
+        self.retired = 0
+        self.returned = 0
+
+    def register(self, model: str, config: Dict[str, Any]) -> str:
+        """Starts keeping sessions for this model/config warm."""
+        key = pool_key(model, config)
+        self._targets.setdefault(key, (model, config))
+        self._idle.setdefault(key, deque())
+        return key
+
+    def start(self):
+        if self._refill_task is None and self.size > 0:
+            self._refill_task = asyncio.create_task(self._refill_loop())
+
+    async def _connect(self, key: str, model: str, config: Dict[str, Any], warm: bool) -> PooledLiveSession:
+        context = self.client.aio.live.connect(model=model, config=config)
+        session = await context.__aenter__()
+        self.connects += 1
+        return PooledLiveSession(key, session, context, warm)
+
+    async def acquire(self, model: str, config: Dict[str, Any]) -> PooledLiveSession:
+        """Returns a connected session: a warm one if available, else a fresh connect."""
+        key = self.register(model, config)
+        self._last_acquired[key] = time.monotonic()
+        idle = self._idle[key]
+        while idle:
+            pooled = idle.popleft()
+            if pooled.is_open and time.monotonic() - pooled.created_at < self.max_idle:
+                self.hits += 1
+                self._wake_refill()
+                return pooled
+            await self._retire(pooled)
+
+        self.misses += 1
+        self._wake_refill()
+        return await self._connect(key, model, config, warm=False)
+
+    async def release(self, pooled: PooledLiveSession, reusable: bool = False):
+        """
+        Hands a session back. Only sessions that were never used (reusable=True
+        and pooled.used unset) go back into the pool; everything else is closed.
+        """
+        idle = self._idle.get(pooled.key)
+        if (reusable and not pooled.used and idle is not None and len(idle) < self.size and pooled.is_open
+                and time.monotonic() - pooled.created_at < self.max_idle):
+            idle.append(pooled)
+            self.returned += 1
+            return
+        await self._retire(pooled)
+
+    async def _retire(self, pooled: PooledLiveSession):
+        self.retired += 1
+        await pooled.close()
+
+    def _wake_refill(self):
+        self._wake.set()
+
+    async def _refill_once(self):
+        now = time.monotonic()
+        for key, (model, config) in list(self._targets.items()):
+            idle = self._idle[key]
+            stale = [p for p in idle if not p.is_open or now - p.created_at >= self.max_idle]
+            for pooled in stale:
+                idle.remove(pooled)
+            for pooled in stale:
+                await self._retire(pooled)
+
+            if now < self._backoff_until.get(key, 0):
+                continue
+            # Nothing taken lately (or ever): let the pool drain instead of
+            # reconnecting sessions nobody is asking for
+            if now - self._last_acquired.get(key, float("-inf")) >= self.keep_warm:
+                continue
+            missing = self.size - len(idle) - self._connecting.get(key, 0)
+            if missing > 0:
+                self._connecting[key] = self._connecting.get(key, 0) + missing
+                await asyncio.gather(*(self._warm_one(key, model, config) for _ in range(missing)))
+
+    async def _warm_one(self, key: str, model: str, config: Dict[str, Any]):
+        try:
+            pooled = await self._connect(key, model, config, warm=True)
+        except Exception as e:
+            self.connect_errors += 1
+            self._backoff_until[key] = time.monotonic() + LIVE_POOL_ERROR_BACKOFF_SECONDS
+            logger.warning("Failed to pre-connect live session for %s: %s", model, str(e)[:120])
+            return
+        finally:
+            self._connecting[key] -= 1
+
+        idle = self._idle[key]
+        if len(idle) < self.size:
+            idle.append(pooled)
+        else:
+            await self._retire(pooled)
+
+    async def _refill_loop(self):
+        # Runs on a timer, or right away when acquire() takes a session
+        while True:
+            self._wake.clear()
+            try:
+                await self._refill_once()
+            except Exception as e:
+                logger.warning("Live session pool refill failed: %s", e)
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=LIVE_POOL_REFILL_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    async def aclose(self):
+        if self._refill_task is not None:
+            self._refill_task.cancel()
+            self._refill_task = None
+        for idle in self._idle.values():
+            while idle:
+                await self._retire(idle.popleft())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": self.size,
+            "warm": {key: len(idle) for key, idle in self._idle.items()},
+            "hits": self.hits,
+            "misses": self.misses,
+            "connects": self.connects,
+            "connect_errors": self.connect_errors,
+            "returned": self.returned,
+            "retired": self.retired,
+        }
@@ -0,0 +1,97 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Optional
+
+from metrics import LLM_CALL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on Gemini calls in flight per worker process. Extra callers wait
+# for a slot instead of opening more upstream connections.
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+# Per-call timeout in seconds (covers one generate_content call, not the wait for a slot)
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "30"))
+
+PLACEHOLDER_API_KEYS = ("your_google_api_key_here", "your_key")
+
+
+def get_api_key() -> Optional[str]:
+    """Returns the configured Google API key, or None if missing or a placeholder."""
+    api_key = os.getenv("GOOGLE_API_KEY")
+    if not api_key or api_key in PLACEHOLDER_API_KEYS:
+        return None
+    return api_key
+
+
+class GeminiService:
+    """
+    One shared Gemini client per worker process.
+
+    All calls go through the async client (client.aio), so a slow generation
+    only suspends the request that made it instead of blocking the event loop.
+    The underlying HTTP connection pool is reused across requests.
+    """
+
+    def __init__(self, api_key: str, max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 timeout: float = LLM_TIMEOUT_SECONDS):
+        # Imported here: the SDK is slow to import, and this runs in the startup warm-up
+        from google import genai
+
+        self.client = genai.Client(api_key=api_key, http_options={"api_version": "v1beta"})
+        self.aio = self.client.aio
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def generate(self, model: str, contents, timeout: Optional[float] = None) -> str:
+        """
+        Runs one generate_content call and returns the response text.
+        Raises asyncio.TimeoutError if the call takes longer than the timeout.
+        """
+        async with self._semaphore:
+            with LLM_CALL_SECONDS.labels(model, "generate").time():
+                response = await asyncio.wait_for(
+                    self.aio.models.generate_content(model=model, contents=contents),
+                    timeout=timeout or self.timeout,
+                )
+        return response.text
+
+    async def stream(self, model: str, contents, timeout: Optional[float] = None):
+        """
+        Streams the response text chunk by chunk as the model emits it.
+        The timeout applies to the wait for each chunk, not the whole stream.
+        """
+        timeout = timeout or self.timeout
+        async with self._semaphore:
+            # Only time spent waiting on the model is observed; the caller's
+            # work while a chunk is out (e.g. sending it on) is not its latency
+            waited = 0.0
+            started = time.perf_counter()
+            try:
+                chunks = await asyncio.wait_for(
+                    self.aio.models.generate_content_stream(model=model, contents=contents),
+                    timeout=timeout,
+                )
+                iterator = chunks.__aiter__()
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(iterator.__anext__(), timeout=timeout)
+                    except StopAsyncIteration:
+                        break
+                    if chunk.text:
+                        waited += time.perf_counter() - started
+                        started = None
+                        yield chunk.text
+                        started = time.perf_counter()
+            finally:
+                if started is not None:
+                    waited += time.perf_counter() - started
+                LLM_CALL_SECONDS.labels(model, "stream").observe(waited)
+
+    async def aclose(self):
+        try:
+            await self.aio.aclose()
+        except Exception as e:
+            logger.warning("Failed to close Gemini client: %s", e)
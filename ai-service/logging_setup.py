@@ -0,0 +1,342 @@
+import os
+import sys
+import json
+import time
+import uuid
+import queue
+import atexit
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional, Tuple
+
+# Lowest level written: DEBUG, INFO, WARNING or ERROR
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "json" (one object per line, for log collectors) or "text" (for reading in a terminal)
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+# Records waiting for the writer thread; beyond this they are dropped (and counted), never waited on
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Records per second kept for each rate-sampled event (per-frame audio, ...)
+LOG_SAMPLE_PER_SECOND = float(os.getenv("LOG_SAMPLE_PER_SECOND", "1"))
+
+# Set per connection / request; every record logged inside carries them
+session_id_var = contextvars.ContextVar("session_id", default=None)
+request_id_var = contextvars.ContextVar("request_id", default=None)
+
+# Libraries that log every HTTP call at INFO (the Gemini SDK goes through httpx)
+_CHATTY_LOGGERS = ("httpx", "httpcore", "google_genai")
+
+# Attributes every LogRecord has; anything else on a record came from extra={...}
+_RECORD_FIELDS = frozenset(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+
+@contextmanager
+def log_context(session_id: Optional[str] = None, request_id: Optional[str] = None):
+    """Tags records logged inside the block (and in tasks started from it) with these ids."""
+    tokens = []
+    if session_id is not None:
+        tokens.append((session_id_var, session_id_var.set(session_id)))
+    if request_id is not None:
+        tokens.append((request_id_var, request_id_var.set(request_id)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+class RequestContextMiddleware:
+    """
+    ASGI middleware giving every HTTP request a request id for its log
+    records: the client's X-Request-ID if it sent one, else a new one. The id
+    is echoed back in the X-Request-ID response header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_id = next((value.decode("latin-1")[:64] for name, value in scope.get("headers", ())
+                           if name == b"x-request-id"), None) or new_request_id()
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        with log_context(request_id=request_id):
+            await self.app(scope, receive, send_with_request_id)
+
+
+class ContextFilter(logging.Filter):
+    """Copies the context ids onto the record while still in the caller's context."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.session_id = session_id_var.get()
+        record.request_id = request_id_var.get()
+        return True
+
+
+class SampledLogger(logging.LoggerAdapter):
+    """
+    Logger for a high-frequency event (per audio frame) that keeps at most
+    per_second records per second. The check sits in isEnabledFor, so a
+    skipped call returns before any LogRecord is built and costs about as
+    much as a call below the level. A kept record reports how many were
+    skipped since the previous one (sampled_out).
+    """
+
+    def __init__(self, logger: logging.Logger, per_second: float = LOG_SAMPLE_PER_SECOND):
+        super().__init__(logger, {})
+        self.per_second = per_second
+        self._capacity = max(per_second, 1.0)
+        self._tokens = self._capacity
+        self._refilled_at = time.monotonic()
+        self._skipped = 0  # since the last kept record
+        self.dropped = 0
+
+    def isEnabledFor(self, level: int) -> bool:
+        if not self.logger.isEnabledFor(level):
+            return False
+        # No lock: these events are logged from the event loop, and a race
+        # from another thread could only let one extra record through or
+        # miscount a skip, which a lock on every call isn't worth
+        now = time.monotonic()
+        tokens = min(self._capacity, self._tokens + (now - self._refilled_at) * self.per_second)
+        self._refilled_at = now
+        if tokens < 1.0:
+            self._tokens = tokens
+            self._skipped += 1
+            self.dropped += 1
+            return False
+        self._tokens = tokens - 1.0
+        return True
+
+    def process(self, msg, kwargs):
+        # Called only for kept records, right after isEnabledFor
+        skipped, self._skipped = self._skipped, 0
+        if skipped:
+            kwargs["extra"] = {**(kwargs.get("extra") or {}), "sampled_out": skipped}
+        return msg, kwargs
+
+
+_sampled_loggers = {}
+
+
+def sampled_logger(name: str, per_second: float = LOG_SAMPLE_PER_SECOND) -> SampledLogger:
+    """The rate-sampled logger for one event, e.g. sampled_logger(__name__ + ".audio_in")."""
+    sampled = _sampled_loggers.get(name)
+    if sampled is None:
+        sampled = _sampled_loggers[name] = SampledLogger(logging.getLogger(name), per_second)
+    return sampled
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    QueueHandler on a SimpleQueue (a C queue, much cheaper per put than
+    queue.Queue) that drops records once max_size are waiting, instead of
+    blocking the caller.
+    """
+
+    def __init__(self, max_size: int = LOG_QUEUE_SIZE):
+        super().__init__(queue.SimpleQueue())
+        self.max_size = max_size
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only render what can't travel to another thread (args, tracebacks);
+        # formatting happens on the writer thread. A plain __dict__ copy is
+        # a fraction of the cost of copy.copy.
+        prepared = logging.LogRecord.__new__(logging.LogRecord)
+        prepared.__dict__.update(record.__dict__)
+        prepared.message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            prepared.exc_text = logging.Formatter().formatException(record.exc_info)
+        prepared.msg, prepared.args, prepared.exc_info = prepared.message, None, None
+        return prepared
+
+    def enqueue(self, record: logging.LogRecord):
+        if self.queue.qsize() >= self.max_size:
+            self.dropped += 1
+            return
+        self.queue.put_nowait(record)
+
+    def wait_written(self, timeout: Optional[float] = None) -> bool:
+        """Blocks until the writer has handled every record queued before this call."""
+        done = threading.Event()
+        self.queue.put_nowait(logging.makeLogRecord({"levelno": logging.CRITICAL, "flush_event": done}))
+        return done.wait(timeout)
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_FIELDS and value is not None:
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        timestamp = time.strftime("%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}"
+        fields = " ".join(f"{key}={value}" for key, value in record.__dict__.items()
+                          if key not in _RECORD_FIELDS and value is not None)
+        line = f"[{timestamp}] {record.levelname:<7} {record.name}: {record.getMessage()}"
+        if fields:
+            line += f"  {fields}"
+        if record.exc_text:
+            line += "\n" + record.exc_text
+        return line
+
+
+class _WriterHandler(logging.StreamHandler):
+    """
+    The listener thread's handler. Without a stream it writes to whatever
+    sys.stdout is at the time, like print() (so redirect_stdout still works).
+    """
+
+    def __init__(self, stream=None):
+        self._follow_stdout = stream is None
+        super().__init__(stream)
+
+    @property
+    def stream(self):
+        return sys.stdout if self._follow_stdout else self._stream
+
+    @stream.setter
+    def stream(self, value):
+        self._stream = value
+
+    def emit(self, record: logging.LogRecord):
+        done = getattr(record, "flush_event", None)
+        if done is not None:
+            self.flush()
+            done.set()
+            return
+        super().emit(record)
+
+
+# Module-wide switches for what every LogRecord collects
+_RECORD_SWITCHES = {"_srcfile": None, "logThreads": False, "logProcesses": False, "logMultiprocessing": False}
+
+
+def _use_lean_records() -> Dict[str, Any]:
+    # Records never show the caller's file/line, thread or process, so skip
+    # collecting them: the stack walk behind file/line is most of what a log
+    # call costs (see "Optimization" in the logging docs)
+    saved = {name: getattr(logging, name) for name in _RECORD_SWITCHES}
+    for name, value in _RECORD_SWITCHES.items():
+        setattr(logging, name, value)
+    return saved
+
+
+def _restore_records(saved: Dict[str, Any]):
+    for name, value in saved.items():
+        setattr(logging, name, value)
+
+
+@contextmanager
+def lean_records():
+    """The record settings setup_logging uses, for the duration of the block."""
+    saved = _use_lean_records()
+    try:
+        yield
+    finally:
+        _restore_records(saved)
+
+
+def create_queue_logging(stream=None, fmt: str = LOG_FORMAT,
+                         queue_size: int = LOG_QUEUE_SIZE) -> Tuple[QueueHandler, QueueListener]:
+    """
+    The handler to attach to loggers, and the listener (not yet started)
+    whose thread formats and writes the records to stream (stdout by default).
+    """
+    writer = _WriterHandler(stream)
+    writer.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+    handler = NonBlockingQueueHandler(queue_size)
+    handler.addFilter(ContextFilter())
+    return handler, QueueListener(handler.queue, writer, respect_handler_level=True)
+
+
+_handler = None
+_listener = None
+_saved_state = None  # (logger levels, record switches) from before setup_logging
+
+
+def setup_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT):
+    """
+    Routes the root logger through the queue. This changes process-wide
+    logging state, so it belongs to a server's startup, not to module
+    imports; stop_logging() puts everything back. Safe to call more than once.
+    """
+    global _handler, _listener, _saved_state
+    if _handler is not None:
+        return
+    root = logging.getLogger()
+    levels = {name: logging.getLogger(name).level for name in ("", *_CHATTY_LOGGERS)}
+    _saved_state = (levels, _use_lean_records())
+    root.setLevel(level)
+    for name in _CHATTY_LOGGERS:
+        logging.getLogger(name).setLevel(max(root.level, logging.WARNING))
+    _handler, _listener = create_queue_logging(fmt=fmt)
+    root.addHandler(_handler)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def setup_cli_logging(level: str = LOG_LEVEL):
+    """Plain text lines on stderr, written by the calling thread, for command-line tools."""
+    handler = logging.StreamHandler()
+    handler.setFormatter(TextFormatter())
+    handler.addFilter(ContextFilter())
+    logging.basicConfig(level=level, handlers=[handler])
+
+
+def flush_logging():
+    """Blocks until every record queued so far has been written."""
+    if _handler is not None:
+        _handler.wait_written(timeout=10)
+
+
+def stop_logging():
+    """Writes out whatever is still queued, stops the writer thread and undoes setup_logging."""
+    global _handler, _listener, _saved_state
+    if _listener is None:
+        return
+    logging.getLogger().removeHandler(_handler)
+    _listener.stop()
+    levels, records = _saved_state
+    for name, level in levels.items():
+        logging.getLogger(name).setLevel(level)
+    _restore_records(records)
+    _handler, _listener, _saved_state = None, None, None
+
+
+def logging_stats() -> Dict[str, Any]:
+    if _handler is None:
+        return {"enabled": False}
+    return {
+        "enabled": True,
+        "level": logging.getLevelName(logging.getLogger().level),
+        "queued": _handler.queue.qsize(),
+        "dropped": _handler.dropped,
+        "sampled_out": sum(sampled.dropped for sampled in _sampled_loggers.values()),
+    }
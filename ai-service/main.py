@@ -1,20 +1,153 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from contextlib import asynccontextmanager, aclosing
 import asyncio
-from gemini_live import GeminiLiveClient
+from gemini_live import GeminiLiveClient, LIVE_MODEL, LIVE_CONFIG
+from live_pool import LiveSessionPool, LIVE_POOL_SIZE
+from audio_pipeline import AudioPipeline
+from admission import (
+    AdmissionRejected, WS_TRY_AGAIN_LATER, client_id_for, create_live_admission, create_llm_admission,
+)
 from pydantic import BaseModel
-from rag_tool import query_reviews
-from google import genai
+from rag_tool import query_reviews, get_review_tool
+from answer_cache import AnswerCache, ANSWER_CACHE_SEMANTIC, answer_key, normalize_question
+from context_builder import build_context, estimate_tokens, token_budget_for
+from aggregates import answer_directly, format_summary
+from llm_client import GeminiService, get_api_key
 import os
+import json
 import time
-from session_manager import SessionManager
+import uuid
+import logging
+from session_manager import get_session_manager, SESSION_REAP_INTERVAL_SECONDS
+from model_router import ModelRouter, NoHealthyModelError
+from single_flight import SingleFlight
+from warmup import LazyResource, STARTUP_WARMUP
+from ingest import ReviewIngester, INGEST_WORKERS, INGEST_API_WORKERS
+from conversation import Conversation, summary_prompt
+from sentence_stream import stream_sentences
+from logging_setup import (
+    RequestContextMiddleware, setup_logging, stop_logging, logging_stats, sampled_logger, new_request_id, session_id_var, request_id_var,
+)
+from typing import Optional
+from metrics import (
+    REGISTRY, CONTENT_TYPE, PROMPT_BUILD_SECONDS, WS_FRAME_SECONDS, WEBSOCKETS_ACTIVE,
+    LIVE_SESSIONS, QUEUE_DEPTH, VOICE_FIRST_SENTENCE_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+# Per-frame audio events, rate-sampled (LOG_SAMPLE_PER_SECOND)
+audio_in_logger = sampled_logger(__name__ + ".audio_in")
+audio_out_logger = sampled_logger(__name__ + ".audio_out")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # JSON lines written by a background thread; the event loop only
+    # enqueues (see logging_setup.py). Set up here rather than at import,
+    # so importing the app leaves the process's logging alone.
+    setup_logging()
+    # Nothing heavy happens here, so the worker takes traffic straight away;
+    # the Gemini client and review retrieval load in the background (or on
+    # first use with STARTUP_WARMUP=0), see /readyz
+    app.state.live_pool = None
+    # Daily session counters are shared by all workers (see SESSION_BACKEND).
+    # Opened here so a required backend that is down stops the worker at startup
+    await asyncio.to_thread(get_session_manager)
+    warmup_task = asyncio.create_task(warm_up()) if STARTUP_WARMUP else None
+    reaper_task = asyncio.create_task(reap_stale_sessions())
+    yield
+    reaper_task.cancel()
+    if ingester is not None:
+        ingester.stop()
+    if warmup_task is not None:
+        warmup_task.cancel()
+    gemini_resource.cancel()
+    retrieval_resource.cancel()
+    if app.state.live_pool is not None:
+        await app.state.live_pool.aclose()
+    if gemini_resource.value is not None:
+        await gemini_resource.value.aclose()
+    stop_logging()
+
+
+def create_gemini_service():
+    # One Gemini client (and connection pool) for the lifetime of the worker
+    api_key = get_api_key()
+    if not api_key:
+        logger.warning("GOOGLE_API_KEY not configured; Gemini endpoints will return errors")
+        return None
+    return GeminiService(api_key)
+
+
+def load_review_tool():
+    tool = get_review_tool()
+    # Semantic answer-cache matching reuses the review index's embedding model
+    if ANSWER_CACHE_SEMANTIC and tool.index is not None:
+        answer_cache.embed = tool.index.embed
+    return tool
 
-app = FastAPI(title="Insightify AI Service")
 
-# Initialize session manager
-# Set is_paid=True if you've enabled billing on your Google Cloud project
-session_manager = SessionManager(is_paid=False)  # Change to True after enabling billing
+gemini_resource = LazyResource("Gemini client", create_gemini_service)
+retrieval_resource = LazyResource("Review retrieval", load_review_tool)
+
+
+async def get_gemini():
+    """The shared GeminiService (None without an API key), waiting for it to load if needed."""
+    try:
+        gemini = await gemini_resource.get()
+    except Exception:
+        return None
+    # Pre-connected Gemini Live sessions for /ws/agent, see live_pool.py
+    if gemini is not None and app.state.live_pool is None and LIVE_POOL_SIZE > 0:
+        app.state.live_pool = LiveSessionPool(gemini.client)
+        app.state.live_pool.register(LIVE_MODEL, LIVE_CONFIG)
+        app.state.live_pool.start()
+    return gemini
+
+
+async def warm_up():
+    retrieval_resource.warm_up()
+    await get_gemini()
+    try:
+        await retrieval_resource.get()
+    except Exception:
+        pass  # logged by the resource; retried on first use
+
+
+async def reap_stale_sessions():
+    # Sessions of crashed connections never call end_session; drop them once
+    # their heartbeat goes stale
+    while True:
+        try:
+            await asyncio.to_thread(get_session_manager().reap_stale_sessions)
+        except Exception as e:
+            logger.error("Error reaping stale sessions: %s", e)
+        await asyncio.sleep(SESSION_REAP_INTERVAL_SECONDS)
 
+
+# Per-client and global limits on LLM calls and live sessions, see admission.py
+llm_admission = create_llm_admission()
+live_admission = create_live_admission()
+
+app = FastAPI(title="Insightify AI Service", lifespan=lifespan)
+
+
+# Per-model health shared by /chat and the voice agent, so a quota-exhausted
+# model is skipped everywhere until its cooldown passes
+model_router = ModelRouter()
+
+# Answers keyed on question + retrieved-review fingerprint. Semantic matching
+# is switched on once the review index (and its embedding model) has loaded.
+answer_cache = AnswerCache()
+
+# Concurrent identical /chat requests (e.g. a dashboard refresh fanning out)
+# share one review retrieval and one generation
+retrieval_flight = SingleFlight("retrieval")
+generation_flight = SingleFlight("generation")
+
+app.add_middleware(RequestContextMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -27,243 +160,698 @@ app.add_middleware(
 def read_root():
     return {"message": "Insightify AI Service (Gemini + RAG)"}
 
+@app.get("/healthz")
+def healthz():
+    # Liveness only: the worker is up and its event loop is responding
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """
+    Readiness: 200 once the Gemini client is set up and retrieval can
+    answer (review store loaded, or Firestore queried directly), else 503.
+    Also 503 while the session backend has fallen back to per-worker counters.
+    A probe also starts loading anything that hasn't started yet.
+    """
+    gemini_resource.warm_up()
+    retrieval_resource.warm_up()
+
+    tool = retrieval_resource.value
+    data_loaded = tool is not None and (tool.store is None or tool.store.ready.is_set())
+    components = {
+        "gemini": {**gemini_resource.status(), "configured": gemini_resource.value is not None},
+        "retrieval": {**retrieval_resource.status(), "data_loaded": data_loaded},
+        "sessions": get_session_manager().backend_status(),
+    }
+    ready = gemini_resource.ready and data_loaded and get_session_manager().backend_error is None
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "starting", "components": components},
+    )
+
 class ChatRequest(BaseModel):
     message: str
+    app_id: Optional[str] = None
 
-@app.post("/chat")
-async def chat_endpoint(request: ChatRequest):
-    try:
-        # 1. Retrieve relevant reviews from Firestore
-        reviews = query_reviews(request.message)
-        
-        # 2. Construct context from reviews
-        context_str = ""
-        if reviews and isinstance(reviews, list):
-            context_str = "\n".join([str(r) for r in reviews])
-        
-        # 3. Construct prompt
-        prompt = f"""
+CHAT_MODEL = "models/gemini-2.5-flash"
+
+# Retrieve more reviews than fit and let the context builder pack the best ones
+CHAT_RETRIEVAL_TOP_K = int(os.getenv("CHAT_RETRIEVAL_TOP_K", "20"))
+# Answer purely statistical questions (rating distribution, top complaints,
+# trends) from the review aggregates, without retrieval or a model call
+CHAT_STATS_DIRECT_ANSWERS = os.getenv("CHAT_STATS_DIRECT_ANSWERS", "1") == "1"
+
+def loaded_aggregates():
+    """Per-app review aggregates, once the review store has loaded (else None)."""
+    tool = retrieval_resource.value
+    if tool is None or tool.aggregates is None or not tool.store.ready.is_set():
+        return None
+    return tool.aggregates
+
+async def statistical_answer(message, app_id=None):
+    if not CHAT_STATS_DIRECT_ANSWERS:
+        return None
+    await retrieval_resource.get()
+    aggregates = loaded_aggregates()
+    if aggregates is None:
+        return None
+    return answer_directly(aggregates, message, app_id)
+
+def review_statistics(app_id=None):
+    aggregates = loaded_aggregates()
+    return format_summary(aggregates.summary(app_id)) if aggregates is not None else ""
+
+@PROMPT_BUILD_SECONDS.time()
+def build_chat_prompt(message, reviews, model=CHAT_MODEL, statistics=""):
+    # Construct a compact, deduplicated, token-budgeted context from reviews;
+    # the statistics share the budget, they replace some of the raw text
+    budget = token_budget_for(model) - estimate_tokens(statistics)
+    context = build_context(reviews, token_budget=max(0, budget))
+    statistics_block = f"Review statistics:\n{statistics}\n\n        " if statistics else ""
+    
+    prompt = f"""
         You are an expert app analyst. Answer the user's question based on the following app reviews:
         
-        Context (Reviews):
-        {context_str}
+        {statistics_block}Context (Reviews):
+        {context.text}
         
-        User Question: {request.message}
+        User Question: {message}
         
         Please provide a helpful and concise answer.
         """
+    return prompt, context
+
+async def cached_answer(message, reviews, app_id, statistics):
+    # Similarity lookups embed the question, so keep them off the event loop
+    if answer_cache.semantic:
+        return await asyncio.to_thread(answer_cache.get, message, reviews, app_id, statistics)
+    return answer_cache.get(message, reviews, app_id, statistics)
+
+async def cache_answer(message, reviews, answer, app_id, statistics):
+    if answer_cache.semantic:
+        await asyncio.to_thread(answer_cache.put, message, reviews, answer, app_id, statistics)
+    else:
+        answer_cache.put(message, reviews, answer, app_id, statistics)
+
+async def retrieve_reviews(message, app_id=None):
+    # Retrieval is sync I/O, so it runs off the event loop; identical
+    # questions in flight at the same time share one call
+    await retrieval_resource.get()
+    key = (normalize_question(message), CHAT_RETRIEVAL_TOP_K, app_id)
+    return await retrieval_flight.do(
+        key, lambda: asyncio.to_thread(query_reviews, message, CHAT_RETRIEVAL_TOP_K, app_id)
+    )
+
+async def generate_answer(gemini, message, reviews, prompt, client_id, app_id, statistics):
+    # Keyed like the answer cache, so requests coalesce exactly when they
+    # would share a cached answer. Only the caller that starts the
+    # generation takes an LLM slot; the others have spent their rate token
+    # (check_rate in chat_endpoint) and just wait for its result.
+    async def generate():
+        async with await llm_admission.acquire(client_id):
+            model_name, response_text = await model_router.run(
+                lambda model: gemini.generate(model, prompt), preferred=CHAT_MODEL
+            )
+        await cache_answer(message, reviews, response_text, app_id, statistics)
+        return response_text
+
+    key = answer_key(message, reviews, app_id, statistics)
+    return await generation_flight.do(key, generate)
+
+def chat_error_message(kind):
+    if kind == "timeout":
+        return "Sorry, the AI took too long to respond. Please try again."
+    if kind in ("quota", "unavailable"):
+        return "Sorry, I've reached my rate limit. Please wait a minute and try again."
+    return "Sorry, I encountered an error processing your request."
+
+def rejected_response(rejection):
+    return JSONResponse(
+        status_code=429,
+        content={"response": "Too many requests. Please slow down and try again shortly.", "reason": rejection.reason},
+        headers={"Retry-After": str(rejection.retry_after)},
+    )
+
+def sse_event(event, data):
+    """Formats one Server-Sent Events frame with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/chat")
+async def chat_endpoint(request: ChatRequest, http_request: Request):
+    # Clients that ask for an event stream get tokens as they are generated
+    if "text/event-stream" in http_request.headers.get("accept", ""):
+        return await chat_stream_endpoint(request, http_request)
+
+    # Statistical questions are answered from counts; no model call to admit
+    try:
+        direct = await statistical_answer(request.message, request.app_id)
+    except Exception as e:
+        logger.error("Error answering from aggregates: %s", e)
+        direct = None
+    if direct is not None:
+        return {"response": direct, "source": "aggregates"}
+
+    # Shed over-limit or overloaded callers before doing any work
+    client_id = client_id_for(http_request)
+    try:
+        llm_admission.check_rate(client_id)
+        llm_admission.check_capacity(client_id)
+    except AdmissionRejected as e:
+        logger.warning("Chat request rejected", extra={"client_id": client_id, "reason": e.reason})
+        return rejected_response(e)
+
+    try:
+        # 1. Retrieve relevant reviews
+        reviews = await retrieve_reviews(request.message, request.app_id)
+        
+        # 2. Reuse a previous answer built from the same reviews and statistics
+        statistics = review_statistics(request.app_id)
+        cached = await cached_answer(request.message, reviews, request.app_id, statistics)
+        if cached is not None:
+            return {"response": cached}
+        
+        # 3. Construct prompt with the reviews as context
+        prompt, context = build_chat_prompt(request.message, reviews, statistics=statistics)
+        logger.info("Chat context built", extra={"tokens": context.token_count, "reviews": context.included})
         
-        # 4. Generate response using Gemini
-        api_key = os.getenv("GOOGLE_API_KEY")
-        if not api_key:
+        # 4. Generate response using the shared Gemini client
+        gemini = await get_gemini()
+        if gemini is None:
              return {"response": "Error: Server misconfigured (missing API key)."}
 
-        client = genai.Client(api_key=api_key, http_options={"api_version": "v1beta"})
-        response = client.models.generate_content(model="models/gemini-2.5-flash", contents=prompt)
+        response_text = await generate_answer(gemini, request.message, reviews, prompt, client_id,
+                                              request.app_id, statistics)
         
-        return {"response": response.text}
+        return {"response": response_text}
+
+    except AdmissionRejected as e:
+        logger.warning("Chat request rejected", extra={"client_id": client_id, "reason": e.reason})
+        return rejected_response(e)
+
+    except NoHealthyModelError as e:
+        logger.error("Chat failed: all models failed", extra={"kind": e.kind, "error": str(e)[:200]})
+        return {"response": chat_error_message(e.kind)}
 
     except Exception as e:
-        print(f"Error in chat endpoint: {e}")
+        logger.exception("Error in chat endpoint")
         return {"response": "Sorry, I encountered an error processing your request."}
 
 
+@app.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest, http_request: Request):
+    """
+    Streams the answer as Server-Sent Events:
+      event: token  data: {"text": "..."}     (one per model chunk)
+      event: done   data: {timing metadata}
+      event: error  data: {"message": "..."}
+    Retrieval runs inside the stream, so a failure there still reaches the
+    client as an error event rather than a broken response.
+    """
+    started = time.perf_counter()
+    try:
+        direct = await statistical_answer(request.message, request.app_id)
+    except Exception as e:
+        logger.error("Error answering from aggregates: %s", e)
+        direct = None
+    if direct is not None:
+        async def direct_stream():
+            yield sse_event("token", {"text": direct})
+            yield sse_event("done", {
+                "source": "aggregates",
+                "cached": False,
+                "chunks": 1,
+                "total_ms": round((time.perf_counter() - started) * 1000, 1),
+            })
+        return StreamingResponse(
+            direct_stream(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    client_id = client_id_for(http_request)
+    try:
+        llm_admission.check_rate(client_id)
+        llm_admission.check_capacity(client_id)
+    except AdmissionRejected as e:
+        logger.warning("Chat stream rejected", extra={"client_id": client_id, "reason": e.reason})
+        return rejected_response(e)
+
+    async def event_stream():
+        # The 200 and its headers are already out once this runs, so every
+        # failure from here on has to be reported in the stream itself
+        try:
+            reviews = await retrieve_reviews(request.message, request.app_id)
+            retrieval_ms = (time.perf_counter() - started) * 1000
+            statistics = review_statistics(request.app_id)
+            cached = await cached_answer(request.message, reviews, request.app_id, statistics)
+            if cached is None:
+                prompt, context = build_chat_prompt(request.message, reviews, statistics=statistics)
+        except Exception:
+            logger.exception("Error retrieving reviews for chat stream")
+            yield sse_event("error", {"message": "Sorry, I encountered an error processing your request."})
+            return
+
+        if cached is not None:
+            yield sse_event("token", {"text": cached})
+            yield sse_event("done", {
+                "model": CHAT_MODEL,
+                "cached": True,
+                "chunks": 1,
+                "retrieval_ms": round(retrieval_ms, 1),
+                "total_ms": round((time.perf_counter() - started) * 1000, 1),
+            })
+            return
+
+        gemini = await get_gemini()
+        if gemini is None:
+            yield sse_event("error", {"message": "Server misconfigured (missing API key)."})
+            return
+
+        # Hold an LLM slot for the whole generation
+        try:
+            ticket = await llm_admission.acquire(client_id)
+        except AdmissionRejected as e:
+            yield sse_event("error", {"message": "The AI service is busy. Please try again shortly.", "reason": e.reason})
+            return
+        try:
+            async for event in generate_events(gemini, reviews, prompt, context, retrieval_ms):
+                yield event
+        except Exception:
+            logger.exception("Error in chat stream")
+            yield sse_event("error", {"message": "Sorry, I encountered an error processing your request."})
+        finally:
+            ticket.release()
+
+    async def generate_events(gemini, reviews, prompt, context, retrieval_ms):
+        generation_started = time.perf_counter()
+        first_token_ms = None
+        chunks = []
+        model_name = None
+        # The router falls through to the next healthy model only while
+        # nothing has been sent yet; once tokens are out the answer can't
+        # switch models
+        try:
+            async with aclosing(model_router.run_stream(lambda model: gemini.stream(model, prompt),
+                                                        preferred=CHAT_MODEL)) as stream:
+                async for model_name, text in stream:
+                    if first_token_ms is None:
+                        first_token_ms = (time.perf_counter() - started) * 1000
+                    chunks.append(text)
+                    yield sse_event("token", {"text": text})
+        except NoHealthyModelError as error:
+            yield sse_event("error", {"message": chat_error_message(error.kind)})
+            return
+
+        await cache_answer(request.message, reviews, "".join(chunks), request.app_id, statistics)
+        yield sse_event("done", {
+            "model": model_name,
+            "cached": False,
+            "chunks": len(chunks),
+            "reviews": len(reviews) if isinstance(reviews, list) else 0,
+            **context.stats(),
+            "retrieval_ms": round(retrieval_ms, 1),
+            "time_to_first_token_ms": round(first_token_ms, 1) if first_token_ms is not None else None,
+            "generation_ms": round((time.perf_counter() - generation_started) * 1000, 1),
+            "total_ms": round((time.perf_counter() - started) * 1000, 1),
+        })
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/cache/stats")
+def cache_stats():
+    return answer_cache.stats()
+
+
+@app.get("/metrics")
+def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+@app.get("/coalescing/stats")
+def coalescing_stats():
+    return {"retrieval": retrieval_flight.stats(), "generation": generation_flight.stats()}
+
+
+@app.get("/admission/stats")
+def admission_stats():
+    return {"llm": llm_admission.stats(), "live": live_admission.stats()}
+
+
+@app.get("/models/health")
+def models_health():
+    return {"models": model_router.snapshot()}
+
+
+class IngestRequest(BaseModel):
+    full: bool = False
+    max_reviews: Optional[int] = None
+
+# Bulk ingestion into the vector index (see ingest.py); one run at a time
+ingester = None
+ingest_task = None
+
+def ingest_finished(task):
+    # run() records the failure in its stats; this only keeps asyncio from warning
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Ingestion failed: %s", task.exception())
+
+@app.post("/ingest")
+async def start_ingest(request: IngestRequest = IngestRequest()):
+    """Starts embedding new/changed reviews in the background; poll GET /ingest for progress."""
+    global ingester, ingest_task
+    if ingest_task is not None and not ingest_task.done():
+        return JSONResponse(status_code=409, content={"error": "Ingestion is already running",
+                                                      "ingestion": ingester.stats()})
+    try:
+        tool = await retrieval_resource.get()
+    except Exception as e:
+        return JSONResponse(status_code=503, content={"error": f"Review retrieval is not available: {e}"})
+    if tool.db is None or tool.index is None:
+        return JSONResponse(status_code=503, content={"error": "Ingestion needs Firestore and the vector index"})
+
+    # Each embedding process loads a model copy next to this worker's own
+    ingester = ReviewIngester(tool.db, tool.index, workers=min(INGEST_WORKERS, INGEST_API_WORKERS))
+    ingest_task = asyncio.create_task(asyncio.to_thread(ingester.run, request.full, request.max_reviews))
+    ingest_task.add_done_callback(ingest_finished)
+    return JSONResponse(status_code=202, content={"status": "started", "full": request.full})
+
+@app.get("/ingest")
+def ingest_status():
+    return ingester.stats() if ingester is not None else {"state": "idle"}
+
+
+# Audio pipelines of the live /ws/agent sessions, by session id
+audio_sessions = {}
+
+# Queue depths are read when /metrics is scraped, so nothing is tracked per item
+QUEUE_DEPTH.labels("audio_input").set_function(
+    lambda: sum(pipeline.input_queue.qsize() for pipeline in list(audio_sessions.values())))
+QUEUE_DEPTH.labels("audio_output").set_function(
+    lambda: sum(pipeline.output_queue.qsize() for pipeline in list(audio_sessions.values())))
+QUEUE_DEPTH.labels("llm_admission").set_function(lambda: llm_admission.stats()["queued"])
+QUEUE_DEPTH.labels("log").set_function(lambda: logging_stats().get("queued", 0))
+
+VOICE_AGENT_SEND_SECONDS = WS_FRAME_SECONDS.labels("/ws/voice-agent", "send")
+AGENT_SEND_SECONDS = WS_FRAME_SECONDS.labels("/ws/agent", "send")
+AGENT_RECEIVE_SECONDS = WS_FRAME_SECONDS.labels("/ws/agent", "receive")
+
+@app.get("/sessions/audio")
+def audio_session_stats():
+    return {"sessions": {str(session_id): pipeline.stats() for session_id, pipeline in audio_sessions.items()}}
+
+
+@app.get("/logging/stats")
+def log_stats():
+    return logging_stats()
+
+
+@app.get("/live/pool")
+def live_pool_stats():
+    pool = app.state.live_pool
+    return pool.stats() if pool is not None else {"size": 0, "enabled": False}
+
+
+VOICE_AGENT_INSTRUCTIONS = "You are a helpful AI assistant for app developers. Be concise and friendly (2-3 sentences max)."
+
+def conversation_summarizer(gemini, client_id):
+    # Background summaries of older turns are model calls like any other: they
+    # count against the client's admission and use the same model fallback.
+    # A rejected summary falls back to clipped text (see Conversation)
+    async def summarize(summary, turns):
+        llm_admission.check_rate(client_id)
+        async with await llm_admission.acquire(client_id):
+            _, text = await model_router.run(lambda model: gemini.generate(model, summary_prompt(summary, turns)))
+        return text
+    return summarize
+
+async def stream_voice_reply(gemini, prompt, send_sentence):
+    """
+    Streams the reply and awaits send_sentence(sentence) for each sentence as
+    soon as it is complete. Falls through to the next model only while nothing
+    has been sent. Returns (model, reply text); raises NoHealthyModelError.
+    """
+    model_name, sentences = None, []
+    replies = model_router.run_stream(lambda model: stream_sentences(gemini.stream(model, prompt)))
+    # If sending fails (the client went away) the stream is closed, which
+    # releases the model without blaming it
+    async with aclosing(replies):
+        async for model_name, sentence in replies:
+            sentences.append(sentence)
+            await send_sentence(sentence)
+    return model_name, " ".join(sentences)
+
 @app.websocket("/ws/voice-agent")
+@WEBSOCKETS_ACTIVE.labels("/ws/voice-agent").track_inprogress()
 async def voice_agent_endpoint(websocket: WebSocket):
-    """Simple text-based voice agent for VoiceAgentFree.jsx"""
+    """
+    Simple text-based voice agent for VoiceAgentFree.jsx.
+
+    The client sends {"text": ...} and gets {"response": ...} once the reply
+    is complete. With {"text": ..., "stream": true} the reply arrives as
+    {"type": "sentence", "text": ...} frames as soon as each sentence is
+    generated (so speech can start after the first one), then
+    {"type": "done", "response": full text, ...timing}; failures end with
+    {"type": "error", "response": message}.
+    """
     await websocket.accept()
-    print("✅ Client connected to voice agent")
+    # Each connection runs in its own task, so these ids stay with it
+    session_id_var.set(uuid.uuid4().hex)
+    client_id = client_id_for(websocket)
+    logger.info("Voice agent client connected", extra={"client_id": client_id})
     
     # Check API key on connection
-    api_key = os.getenv("GOOGLE_API_KEY")
-    if not api_key or api_key == "your_google_api_key_here" or api_key == "your_key":
-        error_msg = "⚠️ GOOGLE_API_KEY not configured! Please add a valid API key to .env file"
-        print(error_msg)
+    gemini = await get_gemini()
+    if gemini is None:
+        logger.error("GOOGLE_API_KEY not configured; add a valid API key to the .env file")
         await websocket.send_json({
             "response": "Sorry, the AI service is not configured with a valid API key. Please check the server configuration."
         })
         await websocket.close()
         return
+
+    # Last turns verbatim plus a rolling summary, so the prompt stays the same size
+    conversation = Conversation(conversation_summarizer(gemini, client_id))
     
     try:
-        # Initialize client with v1beta API (required for these models)
-        client = genai.Client(api_key=api_key, http_options={"api_version": "v1beta"})
-        
-        # Models to try in order of preference (based on availability check)
-        models_to_try = [
-            "models/gemini-flash-latest",      # Latest stable flash model
-            "models/gemini-2.5-flash",         # Stable 2.5 flash
-            "models/gemini-2.0-flash",         # Fallback to 2.0 flash
-            "models/gemini-pro-latest",        # More powerful but slower
-        ]
-        
         while True:
-            print("⏳ Waiting for user speech...")
             data = await websocket.receive_json()
             user_text = data.get("text", "")
+            stream = bool(data.get("stream"))
+            request_id_var.set(new_request_id())
             
             if not user_text:
-                print("⚠️  Empty text received, skipping")
+                logger.debug("Empty text received, skipping")
                 continue
             
-            print(f"📝 Received transcription: '{user_text}'")
-            print("🤖 Sending to Gemini API...")
+            logger.info("Voice message received", extra={"chars": len(user_text), "stream": stream})
+            logger.debug("Transcription: %s", user_text)
             
-            response = None
-            last_error = None
+            prompt = conversation.build_prompt(VOICE_AGENT_INSTRUCTIONS, user_text)
+            started = time.perf_counter()
+            sent = []
+
+            async def send_sentence(sentence):
+                if not sent:
+                    VOICE_FIRST_SENTENCE_SECONDS.observe(time.perf_counter() - started)
+                sent.append(sentence)
+                with VOICE_AGENT_SEND_SECONDS.time():
+                    await websocket.send_json({"type": "sentence", "text": sentence, "index": len(sent) - 1})
+
+            async def send_error(message, **extra):
+                frame = {"response": message, **extra}
+                await websocket.send_json({"type": "error", **frame} if stream else frame)
             
-            # Try each model until one succeeds
-            for model_name in models_to_try:
-                try:
-                    print(f"🔄 Trying model: {model_name}")
-                    
-                    response = client.models.generate_content(
-                        model=model_name,
-                        contents=f"You are a helpful AI assistant for app developers. Be concise and friendly (2-3 sentences max). User says: {user_text}"
-                    )
-                    
-                    response_text = response.text
-                    print(f"✅ Success with {model_name}")
-                    print(f"📝 Response: '{response_text[:60]}...'")
-                    
-                    # Send successful response
-                    await websocket.send_json({"response": response_text})
-                    print("✅ Response sent to client\n")
-                    
-                    # Break out of model loop on success
-                    break
-                    
-                except Exception as model_error:
-                    error_str = str(model_error)
-                    last_error = model_error
-                    
-                    print(f"⚠️  Model {model_name} failed: {error_str[:100]}...")
-                    
-                    # Check if it's a quota error - try next model
-                    if "RESOURCE_EXHAUSTED" in error_str or "quota" in error_str.lower() or "429" in error_str:
-                        print(f"   → Quota exceeded, trying next model...")
-                        continue
-                    
-                    # Check if model not found - try next model
-                    elif "NOT_FOUND" in error_str or "404" in error_str:
-                        print(f"   → Model not found, trying next model...")
-                        continue
-                    
-                    # Other errors - still try next model
+            try:
+                llm_admission.check_rate(client_id)
+                # The router skips models that are cooling down (quota, 404, repeated errors)
+                async with await llm_admission.acquire(client_id):
+                    if stream:
+                        model_name, response_text = await stream_voice_reply(gemini, prompt, send_sentence)
                     else:
-                        print(f"   → Error occurred, trying next model...")
-                        continue
-            
-            # If all models failed, send error message
-            if response is None:
-                print(f"❌ All models failed. Last error: {str(last_error)[:200]}")
+                        model_name, response_text = await model_router.run(
+                            lambda model: gemini.generate(model, prompt)
+                        )
+                with VOICE_AGENT_SEND_SECONDS.time():
+                    if stream:
+                        await websocket.send_json({
+                            "type": "done",
+                            "response": response_text,
+                            "model": model_name,
+                            "sentences": len(sent),
+                            "total_ms": round((time.perf_counter() - started) * 1000, 1),
+                        })
+                    else:
+                        await websocket.send_json({"response": response_text})
+                logger.info("Voice reply sent", extra={
+                    "model": model_name,
+                    "chars": len(response_text),
+                    "sentences": len(sent) if stream else None,
+                    "total_ms": round((time.perf_counter() - started) * 1000, 1),
+                })
+                logger.debug("Reply: %s", response_text)
+                conversation.add_turn(user_text, response_text)
                 
-                error_msg = str(last_error) if last_error else "Unknown error"
+            except AdmissionRejected as e:
+                logger.warning("Voice message rejected", extra={"client_id": client_id, "reason": e.reason})
+                await send_error(
+                    "You're sending messages too quickly. Please wait a moment and try again.",
+                    retry_after=e.retry_after,
+                )
                 
-                if "RESOURCE_EXHAUSTED" in error_msg or "quota" in error_msg.lower():
-                    await websocket.send_json({
-                        "response": "Sorry, I've reached my rate limit. Please wait a minute and try again, or enable billing for higher quotas."
-                    })
-                elif "API_KEY_INVALID" in error_msg or "not valid" in error_msg.lower():
-                    await websocket.send_json({
-                        "response": "Sorry, the API key is invalid. Please check the server configuration."
-                    })
+            except NoHealthyModelError as e:
+                # If all models failed, send error message
+                logger.error("Voice reply failed: all models failed", extra={"kind": e.kind, "error": str(e)[:200]})
+                
+                if e.kind in ("quota", "unavailable"):
+                    await send_error(
+                        "Sorry, I've reached my rate limit. Please wait a minute and try again, or enable billing for higher quotas."
+                    )
+                elif e.kind == "invalid_key":
+                    await send_error("Sorry, the API key is invalid. Please check the server configuration.")
                 else:
-                    await websocket.send_json({
-                        "response": "Sorry, I encountered an error. Please try again in a moment."
-                    })
+                    await send_error("Sorry, I encountered an error. Please try again in a moment.")
+
+            except WebSocketDisconnect:
+                raise
+
+            except Exception:
+                # Any other failure still ends the reply with an error frame,
+                # even when some sentences were already sent
+                logger.exception("Voice reply failed")
+                await send_error("Sorry, I encountered an error. Please try again in a moment.")
             
-    except Exception as e:
-        print(f"❌ WebSocket Error: {e}")
-        import traceback
-        traceback.print_exc()
+    except WebSocketDisconnect:
+        pass
+    except Exception:
+        logger.exception("Voice agent websocket error")
     finally:
-        print("👋 Client disconnected")
+        await conversation.aclose()
+        logger.info("Voice agent client disconnected", extra={"turns": conversation.turn_count})
 
 @app.websocket("/ws/agent")
+@WEBSOCKETS_ACTIVE.labels("/ws/agent").track_inprogress()
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
-    print("Client connected via WebSocket")
+    # Each connection runs in its own task, so the id stays with its log records
+    session_id = uuid.uuid4().hex
+    session_id_var.set(session_id)
+    client_id = client_id_for(websocket)
+    logger.info("Live client connected", extra={"client_id": client_id})
     
-    # Check session limit before starting
-    can_start, message = session_manager.can_start_session()
-    if not can_start:
-        status = session_manager.get_status()
-        error_msg = f"{message}. Resets at: {status['resets_at']}. Enable billing for 50 sessions/day."
-        print(f"❌ Session limit: {error_msg}")
-        await websocket.close(code=4000, reason=error_msg)
+    # Per-client / global live-session limits; shed with "try again later"
+    try:
+        live_admission.check_rate(client_id)
+        admission_ticket = await live_admission.acquire(client_id)
+    except AdmissionRejected as e:
+        logger.warning("Live session rejected", extra={"client_id": client_id, "reason": e.reason})
+        LIVE_SESSIONS.labels("rejected_" + e.reason).inc()
+        await websocket.close(code=WS_TRY_AGAIN_LATER, reason=f"Too many sessions ({e.reason}). Retry in {e.retry_after}s.")
         return
     
-    # Record session start
-    session_id = id(websocket)
-    session_manager.start_session(session_id)
-    print(f"✅ Session started. Status: {session_manager.get_status()}")
-    
-    gemini_client = GeminiLiveClient()
-    input_queue = asyncio.Queue()
-    output_queue = asyncio.Queue()
+    # Everything after acquire() runs under one try/finally, so the ticket
+    # (and the session, once started) is given back however the call ends
+    session_started = False
+    pipeline = None
+    try:
+        session_manager = get_session_manager()
+        # Check the session limit and record the start in one atomic step.
+        # The backend does blocking I/O (SQLite may wait on another worker's
+        # write), so every session_manager call runs off the event loop
+        can_start, message = await asyncio.to_thread(session_manager.try_start_session, session_id)
+        if not can_start:
+            status = await asyncio.to_thread(session_manager.get_status)
+            error_msg = f"{message}. Resets at: {status['resets_at']}. Enable billing for 50 sessions/day."
+            logger.warning("Live session over the daily limit: %s", error_msg)
+            LIVE_SESSIONS.labels("rejected_daily_limit").inc()
+            await websocket.close(code=4000, reason=error_msg)
+            return
+        session_started = True
+        
+        logger.info("Live session started", extra=await asyncio.to_thread(session_manager.get_status))
+        LIVE_SESSIONS.labels("started").inc()
+        
+        gemini = await get_gemini()
+        if gemini is None:
+            logger.error("GOOGLE_API_KEY not configured; live session closed")
+            await websocket.close(code=1011, reason="AI service not configured.")
+            return
+        gemini_client = GeminiLiveClient(client=gemini.client, pool=websocket.app.state.live_pool)
+        # Bounded queues + fixed-duration mic batches; see audio_pipeline.py
+        pipeline = AudioPipeline()
+        audio_sessions[session_id] = pipeline
+        output_queue = pipeline.output_queue
+        
+        # Start Gemini connection in background
+        gemini_task = asyncio.create_task(
+            gemini_client.connect(pipeline.input_chunks(), output_queue, mime_type=pipeline.mime_type)
+        )
 
-    async def mic_stream_generator():
-        while True:
+        async def receive_audio_from_client():
             try:
-                data = await input_queue.get()
-                if data is None:
-                    break
-                yield data
-            except Exception:
-                break
-    
-    # Start Gemini connection in background
-    gemini_task = asyncio.create_task(gemini_client.connect(mic_stream_generator(), output_queue))
-
-    async def receive_audio_from_client():
-        try:
-            while True:
-                # Expecting raw bytes from client
-                data = await websocket.receive_bytes()
-                # print(f"Received audio from client: {len(data)} bytes")
-                await input_queue.put(data)
-        except WebSocketDisconnect:
-            print("Client disconnected")
-            await input_queue.put(None)
-        except Exception as e:
-            print(f"Error receiving from client: {e}")
-            await input_queue.put(None)
+                while True:
+                    # Expecting raw PCM16 bytes from client
+                    data = await websocket.receive_bytes()
+                    with AGENT_RECEIVE_SECONDS.time():
+                        pipeline.feed(data)
+                    audio_in_logger.debug("Audio frame received", extra={"bytes": len(data)})
+            except WebSocketDisconnect:
+                logger.info("Live client disconnected")
+                pipeline.end_input()
+            except Exception as e:
+                logger.error("Error receiving from client: %s", e)
+                pipeline.end_input()
 
-    async def send_audio_to_client():
-        try:
-            while True:
-                data = await output_queue.get()
+        async def send_audio_to_client():
+            try:
+                while True:
+                    data = await output_queue.get()
+                    if data is None:
+                        break
                 
-                # Check if it's an error message
-                if isinstance(data, dict) and data.get("error") == "quota_exceeded":
-                    print(f"Quota exceeded, closing connection: {data.get('message')}")
-                    await websocket.close(code=4000, reason="API Quota Exceeded. Please try again later or upgrade your plan.")
-                    break
+                    # Check if it's an error message
+                    if isinstance(data, dict) and data.get("error") == "quota_exceeded":
+                        logger.warning("Quota exceeded, closing connection: %s", data.get("message"))
+                        await websocket.close(code=4000, reason="API Quota Exceeded. Please try again later or upgrade your plan.")
+                        break
                 
-                # Otherwise it's audio data
-                # print(f"Sending audio to client: {len(data)} bytes")
-                await websocket.send_bytes(data)
-        except Exception as e:
-            print(f"Error sending to client: {e}")
+                    # Otherwise it's audio data
+                    if isinstance(data, dict):
+                        logger.error("Gemini Live error, closing connection: %s", data.get("message"))
+                        break
+                    pipeline.bytes_out += len(data)
+                    with AGENT_SEND_SECONDS.time():
+                        await websocket.send_bytes(bytes(data))
+                    audio_out_logger.debug("Audio frame sent", extra={"bytes": len(data)})
+            except Exception as e:
+                logger.error("Error sending to client: %s", e)
 
-    # Session monitoring task
-    async def monitor_session_limit():
-        start_time = time.time()
-        # 3 minutes limit for free trial
-        MAX_SESSION_DURATION = 180 
+        # Session monitoring task
+        async def monitor_session_limit():
+            start_time = time.time()
+            # 3 minutes limit for free trial
+            MAX_SESSION_DURATION = 180 
         
-        while True:
-            elapsed = time.time() - start_time
-            if elapsed > MAX_SESSION_DURATION:
-                print(f"Session limit reached for client {websocket.client}")
-                # Optional: Send a text message or audio indicating limit reached if architecture supported it easily
-                # For now, just close with specific code
-                await websocket.close(code=4000, reason="Free Trial Limit Reached (3 mins). Upgrade to continue.")
-                break
-            await asyncio.sleep(1) # Check every second
+            last_heartbeat = start_time
+        
+            while True:
+                elapsed = time.time() - start_time
+                # Keep the session from being reaped as stale while it is alive
+                if time.time() - last_heartbeat >= 15:
+                    await asyncio.to_thread(session_manager.heartbeat, session_id)
+                    last_heartbeat = time.time()
+                if elapsed > MAX_SESSION_DURATION:
+                    logger.info("Live session time limit reached", extra={"client_id": client_id})
+                    # Optional: Send a text message or audio indicating limit reached if architecture supported it easily
+                    # For now, just close with specific code
+                    await websocket.close(code=4000, reason="Free Trial Limit Reached (3 mins). Upgrade to continue.")
+                    break
+                await asyncio.sleep(1) # Check every second
 
-    try:
         # Create tasks
         receive_task = asyncio.create_task(receive_audio_from_client())
         send_task = asyncio.create_task(send_audio_to_client())
@@ -282,29 +870,39 @@ async def websocket_endpoint(websocket: WebSocket):
             if task.exception():
                 raise task.exception()
             
+            
     except Exception as e:
         error_msg = str(e)
         if "quota" in error_msg.lower() or "429" in error_msg:
-             print(f"DEBUG: QUOTA ERROR DETECTED: {error_msg}")
+             logger.warning("Live session quota exceeded: %s", error_msg)
              reason = "Gemini API Quota Exceeded. Try again later."
              try:
                 await websocket.close(code=4000, reason=reason)
              except RuntimeError:
                 pass 
         else:
-             print(f"WebSocket session error: {e}")
-             import traceback
-             traceback.print_exc()
+             logger.exception("Live session error")
              try:
                 await websocket.close(code=1011, reason=f"Internal Error: {str(e)[:50]}...")
              except RuntimeError:
                 pass
     finally:
-        # Record session end
-        session_manager.end_session(session_id)
-        print(f"Session ended. Remaining today: {session_manager.get_status()['sessions_remaining']}")
+        admission_ticket.release()
+        audio_sessions.pop(session_id, None)
+        if session_started:
+            # Record session end
+            try:
+                await asyncio.to_thread(session_manager.end_session, session_id)
+                status = await asyncio.to_thread(session_manager.get_status)
+            except Exception as e:
+                logger.error("Error recording session end: %s", e)  # the reaper drops it once its heartbeat is stale
+                status = {}
+            logger.info("Live session ended", extra={
+                "audio": pipeline.stats() if pipeline is not None else None,
+                "sessions_remaining": status.get("sessions_remaining"),
+            })
         
         try:
             await websocket.close()
-        except RuntimeError:
+        except (RuntimeError, WebSocketDisconnect):
             pass
@@ -0,0 +1,286 @@
+import os
+import time
+import asyncio
+import logging
+from typing import List, Dict, Any, Optional, Callable, Awaitable, AsyncIterator, Tuple
+
+from metrics import LLM_ERRORS, LLM_FALLBACKS
+
+logger = logging.getLogger(__name__)
+
+# Consecutive generic failures before a model's circuit opens
+ROUTER_FAILURE_THRESHOLD = int(os.getenv("ROUTER_FAILURE_THRESHOLD", "3"))
+# How long an open circuit stays open before one probe request is allowed
+ROUTER_COOLDOWN_SECONDS = float(os.getenv("ROUTER_COOLDOWN_SECONDS", "15"))
+ROUTER_QUOTA_COOLDOWN_SECONDS = float(os.getenv("ROUTER_QUOTA_COOLDOWN_SECONDS", "60"))
+ROUTER_NOT_FOUND_COOLDOWN_SECONDS = float(os.getenv("ROUTER_NOT_FOUND_COOLDOWN_SECONDS", "3600"))
+# Cooldowns double on every failed probe, up to this cap
+ROUTER_MAX_COOLDOWN_SECONDS = float(os.getenv("ROUTER_MAX_COOLDOWN_SECONDS", "600"))
+
+# Models in order of preference (based on availability check)
+DEFAULT_MODELS = [
+    "models/gemini-flash-latest",      # Latest stable flash model
+    "models/gemini-2.5-flash",         # Stable 2.5 flash
+    "models/gemini-2.0-flash",         # Fallback to 2.0 flash
+    "models/gemini-pro-latest",        # More powerful but slower
+]
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Weight of the newest sample in the latency / error-rate moving averages
+EWMA_ALPHA = 0.2
+
+
+def classify_error(error: BaseException) -> str:
+    """Maps a Gemini exception to quota / not_found / invalid_key / timeout / error."""
+    if isinstance(error, asyncio.TimeoutError):
+        return "timeout"
+    error_str = str(error)
+    if "RESOURCE_EXHAUSTED" in error_str or "quota" in error_str.lower() or "429" in error_str:
+        return "quota"
+    if "NOT_FOUND" in error_str or "404" in error_str:
+        return "not_found"
+    if "API_KEY_INVALID" in error_str or "not valid" in error_str.lower():
+        return "invalid_key"
+    return "error"
+
+
+class NoHealthyModelError(Exception):
+    """Raised when every model failed or is cooling down."""
+
+    def __init__(self, last_error: Optional[BaseException] = None):
+        self.last_error = last_error
+        self.kind = classify_error(last_error) if last_error is not None else "unavailable"
+        super().__init__(str(last_error) if last_error is not None else "All models are cooling down")
+
+
+class ModelHealth:
+    __slots__ = ("name", "rank", "state", "consecutive_failures", "open_until", "cooldown",
+                 "probing", "latency_ms", "error_rate", "successes", "failures", "last_error")
+
+    def __init__(self, name: str, rank: int):
+        self.name = name
+        self.rank = rank
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.cooldown = 0.0
+        self.probing = False
+        self.latency_ms = None
+        self.error_rate = 0.0
+        self.successes = 0
+        self.failures = 0
+        self.last_error = None
+
+    def snapshot(self, now: float) -> Dict[str, Any]:
+        return {
+            "model": self.name,
+            "state": self.state,
+            "latency_ms": round(self.latency_ms, 1) if self.latency_ms is not None else None,
+            "error_rate": round(self.error_rate, 3),
+            "successes": self.successes,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "retry_in_seconds": round(max(0.0, self.open_until - now), 1) if self.state != CLOSED else 0,
+            "last_error": self.last_error,
+        }
+
+
+class ModelRouter:
+    """
+    Shared, health-aware model selection with a circuit breaker per model.
+
+    Quota (429) and not-found (404) errors open a model's circuit straight
+    away; other errors open it after ROUTER_FAILURE_THRESHOLD in a row. Open
+    models are skipped until their cooldown passes, after which one probe
+    request is let through (half-open). Requests therefore go straight to a
+    working model instead of paying for known-bad ones first.
+    """
+
+    def __init__(self, models: List[str] = None, failure_threshold: int = ROUTER_FAILURE_THRESHOLD,
+                 cooldown: float = ROUTER_COOLDOWN_SECONDS, quota_cooldown: float = ROUTER_QUOTA_COOLDOWN_SECONDS,
+                 not_found_cooldown: float = ROUTER_NOT_FOUND_COOLDOWN_SECONDS,
+                 max_cooldown: float = ROUTER_MAX_COOLDOWN_SECONDS):
+        models = models or DEFAULT_MODELS
+        self.models = {name: ModelHealth(name, rank) for rank, name in enumerate(models)}
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.quota_cooldown = quota_cooldown
+        self.not_found_cooldown = not_found_cooldown
+        self.max_cooldown = max_cooldown
+
+    def _health(self, model: str) -> ModelHealth:
+        health = self.models.get(model)
+        if health is None:
+            health = self.models[model] = ModelHealth(model, len(self.models))
+        return health
+
+    def candidates(self, preferred: Optional[str] = None) -> List[str]:
+        """
+        Models worth trying right now, best first: the preferred model, then
+        healthy models fastest first by their latency moving average (models
+        not measured yet follow in preference order), with models that have
+        been erroring a lot pushed behind the rest. A model whose cooldown
+        has passed is offered to one caller at a time as a probe.
+        """
+        now = time.monotonic()
+        available = []
+        for health in self.models.values():
+            if health.state == OPEN and now >= health.open_until:
+                health.state = HALF_OPEN
+            if health.state == OPEN:
+                continue
+            if health.state == HALF_OPEN and health.probing:
+                continue
+            available.append(health)
+
+        def sort_key(health):
+            degraded = health.error_rate >= 0.5
+            unmeasured = health.latency_ms is None
+            return (health.name != preferred, degraded, unmeasured, health.latency_ms or 0.0, health.rank)
+
+        return [health.name for health in sorted(available, key=sort_key)]
+
+    def acquire(self, model: str):
+        """Marks the start of a call; claims the probe slot of a half-open model."""
+        health = self._health(model)
+        if health.state == HALF_OPEN:
+            health.probing = True
+
+    def release(self, model: str):
+        """Gives up a call without an outcome (e.g. cancelled); frees the probe slot."""
+        self._health(model).probing = False
+
+    def record_success(self, model: str, latency_ms: float):
+        health = self._health(model)
+        health.successes += 1
+        health.consecutive_failures = 0
+        health.error_rate = (1 - EWMA_ALPHA) * health.error_rate
+        if health.latency_ms is None:
+            health.latency_ms = latency_ms
+        else:
+            health.latency_ms = (1 - EWMA_ALPHA) * health.latency_ms + EWMA_ALPHA * latency_ms
+        health.state = CLOSED
+        health.probing = False
+        health.cooldown = 0.0
+
+    def record_failure(self, model: str, error: BaseException) -> str:
+        """Records a failed call and returns its error kind."""
+        kind = classify_error(error)
+        LLM_ERRORS.labels(model, kind).inc()
+        health = self._health(model)
+        health.failures += 1
+        health.consecutive_failures += 1
+        health.error_rate = (1 - EWMA_ALPHA) * health.error_rate + EWMA_ALPHA
+        health.last_error = f"{kind}: {str(error)[:120]}"
+
+        if kind == "quota":
+            base = self.quota_cooldown
+        elif kind == "not_found":
+            base = self.not_found_cooldown
+        elif health.state == HALF_OPEN or health.consecutive_failures >= self.failure_threshold:
+            base = self.cooldown
+        else:
+            base = 0.0
+
+        if base:
+            # Failed probes back off exponentially
+            if health.state == HALF_OPEN and health.cooldown:
+                cooldown = min(self.max_cooldown, max(base, health.cooldown * 2))
+            else:
+                cooldown = base
+            health.cooldown = cooldown
+            health.state = OPEN
+            health.open_until = time.monotonic() + cooldown
+
+        health.probing = False
+        return kind
+
+    async def run(self, call: Callable[[str], Awaitable[Any]], preferred: Optional[str] = None):
+        """
+        Calls `call(model)` on the best available model, falling through to
+        the next one on failure. Returns (model, result). Raises
+        NoHealthyModelError if nothing succeeded. An invalid API key fails
+        fast, since every model would reject it.
+        """
+        last_error = None
+        candidates = self.candidates(preferred)
+        for position, model in enumerate(candidates):
+            self.acquire(model)
+            started = time.perf_counter()
+            try:
+                result = await call(model)
+            except asyncio.CancelledError:
+                self.release(model)
+                raise
+            except Exception as e:
+                last_error = e
+                kind = self.record_failure(model, e)
+                logger.warning("Model call failed", extra={"model": model, "kind": kind, "error": str(e)[:200]})
+                if kind == "invalid_key":
+                    break
+                if position + 1 < len(candidates):
+                    LLM_FALLBACKS.labels(model).inc()
+                continue
+            self.record_success(model, (time.perf_counter() - started) * 1000)
+            return model, result
+
+        raise NoHealthyModelError(last_error)
+
+    async def run_stream(self, stream: Callable[[str], AsyncIterator[Any]],
+                         preferred: Optional[str] = None) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Streaming counterpart of run(): yields (model, item) for each item of
+        `stream(model)`. Falls through to the next model only while nothing
+        has been yielded; once items are out the reply can't switch models,
+        so a later failure raises NoHealthyModelError. The latency recorded
+        is the time spent waiting on the model, not on the consumer.
+
+        Close the generator (contextlib.aclosing) when stopping early; the
+        model's attempt is then released without counting as a failure.
+        """
+        last_error = None
+        candidates = self.candidates(preferred)
+        for position, model in enumerate(candidates):
+            self.acquire(model)
+            items = stream(model).__aiter__()
+            waited = 0.0
+            yielded = False
+            try:
+                while True:
+                    started = time.perf_counter()
+                    try:
+                        item = await items.__anext__()
+                    except StopAsyncIteration:
+                        break
+                    finally:
+                        waited += time.perf_counter() - started
+                    yielded = True
+                    yield model, item
+            except (asyncio.CancelledError, GeneratorExit):
+                self.release(model)
+                raise
+            except Exception as e:
+                last_error = e
+                kind = self.record_failure(model, e)
+                logger.warning("Model stream failed", extra={"model": model, "kind": kind, "error": str(e)[:200]})
+                if yielded:
+                    raise NoHealthyModelError(e) from e
+                if kind == "invalid_key":
+                    break
+                if position + 1 < len(candidates):
+                    LLM_FALLBACKS.labels(model).inc()
+                continue
+            finally:
+                if hasattr(items, "aclose"):
+                    await items.aclose()
+            self.record_success(model, waited * 1000)
+            return
+
+        raise NoHealthyModelError(last_error)
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        now = time.monotonic()
+        return [health.snapshot(now) for health in sorted(self.models.values(), key=lambda h: h.rank)]
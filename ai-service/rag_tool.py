@@ -1,59 +1,192 @@
 import os
 import json
-from typing import List, Dict, Any
+import threading
+import logging
+from typing import List, Dict, Any, Optional
 from dotenv import load_dotenv
 
-import firebase_admin
-from firebase_admin import credentials
-from firebase_admin import firestore
+from vector_index import create_vector_index
+from review_store import ReviewStore, to_rating, to_timestamp
+from bm25_index import BM25Index, reciprocal_rank_fusion
+from aggregates import ReviewAggregates
+from metrics import RETRIEVAL_SECONDS
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Path to your Firebase service account JSON file
 # User should export this env var or place the file in a known location
 FIREBASE_CREDENTIALS_PATH = os.getenv("FIREBASE_CREDENTIALS_PATH", "service_account.json")
+# Keep an in-memory copy of the reviews collection, synced by a snapshot listener
+REVIEW_STORE_ENABLED = os.getenv("REVIEW_STORE_ENABLED", "1") == "1"
+# Keyword (BM25) search over the review store, fused with the vector index
+BM25_ENABLED = os.getenv("BM25_ENABLED", "1") == "1"
+# Per-app rating / day / topic counts over the review store
+AGGREGATES_ENABLED = os.getenv("AGGREGATES_ENABLED", "1") == "1"
+# Reciprocal rank fusion constant; larger values flatten the rank weighting
+RRF_K = int(os.getenv("RRF_K", "60"))
+# Each retriever contributes this many times top_k candidates to the fusion
+RETRIEVAL_CANDIDATE_FACTOR = int(os.getenv("RETRIEVAL_CANDIDATE_FACTOR", "4"))
+
+def create_firestore_client():
+    """A Firestore client from FIREBASE_CREDENTIALS_PATH, or None if it can't be set up."""
+    try:
+        # Imported here: firebase_admin is slow to import and only needed for a real Firestore
+        import firebase_admin
+        from firebase_admin import credentials
+        from firebase_admin import firestore
+
+        # Check if app is already initialized to avoid errors on reload
+        if not firebase_admin._apps:
+            if os.path.exists(FIREBASE_CREDENTIALS_PATH):
+                cred = credentials.Certificate(FIREBASE_CREDENTIALS_PATH)
+                firebase_admin.initialize_app(cred)
+                logger.info("Firebase initialized with credentials from %s", FIREBASE_CREDENTIALS_PATH)
+            else:
+                logger.warning("Firebase credentials not found at %s", FIREBASE_CREDENTIALS_PATH)
+                # fallback to default (e.g. if running in GCP environment)
+                # firebase_admin.initialize_app() 
+        
+        return firestore.client()
+        
+    except Exception as e:
+        logger.warning("Failed to initialize Firebase Firestore: %s", e)
+        return None
 
 class ReviewTool:
-    def __init__(self):
-        self.db = None
+    def __init__(self, db=None):
+        # A Firestore-compatible client can be passed in (e.g. fake_firestore.FakeFirestore)
+        self.db = db
+        if self.db is None:
+            self._init_firestore()
+
+        # Local copy of the reviews collection, kept current by on_snapshot,
+        # with a keyword index and per-app aggregates that follow it
+        self.store = None
+        self.bm25 = None
+        self.aggregates = None
+        if self.db is not None and REVIEW_STORE_ENABLED:
+            try:
+                self.store = ReviewStore()
+                if BM25_ENABLED:
+                    self.bm25 = BM25Index(self.store)
+                if AGGREGATES_ENABLED:
+                    self.aggregates = ReviewAggregates(self.store)
+                self.store.listen(self.db.collection("reviews"))
+            except Exception as e:
+                logger.warning("Failed to start review store listener: %s", e)
+                self.store = None
+                self.bm25 = None
+                self.aggregates = None
+
+        # Local semantic index; retrieval falls back to the review store or
+        # Firestore when it is unavailable or has not been built yet (see sync_index).
+        self.index = None
         try:
-            # Check if app is already initialized to avoid errors on reload
-            if not firebase_admin._apps:
-                if os.path.exists(FIREBASE_CREDENTIALS_PATH):
-                    cred = credentials.Certificate(FIREBASE_CREDENTIALS_PATH)
-                    firebase_admin.initialize_app(cred)
-                    print(f"Firebase initialized with credentials from {FIREBASE_CREDENTIALS_PATH}")
-                else:
-                    print(f"Warning: Firebase credentials not found at {FIREBASE_CREDENTIALS_PATH}")
-                    # fallback to default (e.g. if running in GCP environment)
-                    # firebase_admin.initialize_app() 
-            
-            self.db = firestore.client()
-            
+            self.index = create_vector_index()
+            logger.info("Vector index loaded with %d reviews", self.index.count())
         except Exception as e:
-            print(f"Warning: Failed to initialize Firebase Firestore: {e}")
-            self.db = None
+            logger.warning("Failed to initialize vector index: %s", e)
+            self.index = None
+
+    def _init_firestore(self):
+        self.db = create_firestore_client()
 
-    def query_reviews(self, query: str) -> List[Dict[str, Any]]:
+    @RETRIEVAL_SECONDS.time()
+    def query_reviews(self, query: str, top_k: int = 5, app_id: Optional[str] = None,
+                      min_rating: Optional[int] = None, max_rating: Optional[int] = None,
+                      since: Optional[float] = None, until: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        Returns the reviews most relevant to the query.
+        Keyword (BM25) matches from the review store and semantic matches
+        from the vector index are fused by reciprocal rank, using whichever
+        of the two is available. Without either, falls back to the most
+        recent reviews in the store, and only reads Firestore directly when
+        there is no store. since/until are epoch seconds.
+        """
+        filters = {"app_id": app_id, "min_rating": min_rating, "max_rating": max_rating,
+                   "since": since, "until": until}
+        store_ready = self.store is not None and self.store.ready.is_set()
+
+        vector_ready = False
+        if self.index is not None:
+            try:
+                vector_ready = self.index.count() > 0
+            except Exception as e:
+                logger.error("Error querying vector index, falling back to the review store: %s", e)
+
+        if vector_ready or (store_ready and self.bm25 is not None):
+            results = self._hybrid_query(query, top_k, filters, use_vector=vector_ready,
+                                         use_keywords=store_ready and self.bm25 is not None)
+            if results:
+                return results
+            if not store_ready:
+                return [{"message": "No matching reviews found in the vector index."}]
+
+        if store_ready:
+            results = self.store.recent(top_k, **filters)
+            if results:
+                return results
+            return [{"message": "No reviews found in Firestore 'reviews' collection."}]
+
+        return self._query_firestore(query, top_k=top_k, app_id=app_id)
+
+    def _hybrid_query(self, query: str, top_k: int, filters: Dict[str, Any],
+                      use_vector: bool, use_keywords: bool) -> List[Dict[str, Any]]:
+        candidates = top_k * RETRIEVAL_CANDIDATE_FACTOR
+        rankings = []
+
+        vector_hits = {}
+        if use_vector:
+            try:
+                for review in self.index.query(query, top_k=candidates, app_id=filters["app_id"]):
+                    if _matches_filters(review, filters):
+                        vector_hits[review["id"]] = review
+                rankings.append(list(vector_hits))
+            except Exception as e:
+                logger.error("Error querying vector index: %s", e)
+
+        keyword_scores = {}
+        if use_keywords:
+            keyword_scores = dict(self.bm25.search(query, top_k=candidates, **filters))
+            rankings.append(list(keyword_scores))
+
+        fused = reciprocal_rank_fusion(rankings, k=RRF_K)[:top_k]
+        stored = {}
+        if self.store is not None:
+            stored = {review["id"]: review for review in self.store.get_many([review_id for review_id, _ in fused])}
+
+        results = []
+        for review_id, rrf_score in fused:
+            review = {**vector_hits.get(review_id, {}), **stored.get(review_id, {})}
+            if not review:
+                continue  # removed since it was ranked
+            review["rrf_score"] = round(rrf_score, 5)
+            if review_id in keyword_scores:
+                review["bm25_score"] = round(keyword_scores[review_id], 3)
+            results.append(review)
+        return results
+
+    def _query_firestore(self, query: str, top_k: int = 5, app_id: Optional[str] = None) -> List[Dict[str, Any]]:
         """
         Queries the Firestore database for reviews. 
         Note: Firestore has limited full-text search capabilities natively.
         This implementation retrieves recent reviews. 
-        For full-text search, consider integrating Algolia or Typesense.
         """
         if not self.db:
             return [{"error": "Firestore client not initialized. Check credentials."}]
 
-        print(f"Querying Firestore reviews (simulated search) for: {query}")
+        logger.debug("Querying Firestore reviews (simulated search) for: %s", query)
         
         try:
-            # Simple retrieval of latest 5 reviews
             # Assuming a collection named 'reviews' exists
             reviews_ref = self.db.collection("reviews")
+            if app_id:
+                reviews_ref = reviews_ref.where("appId", "==", app_id)
             
             # Since native full-text search isn't available, we just get recent ones
-            # In a real app, you'd filter by category or use an external search index.
-            docs = reviews_ref.limit(5).stream()
+            docs = reviews_ref.limit(top_k).stream()
             
             results = []
             for doc in docs:
@@ -67,17 +200,94 @@ class ReviewTool:
             return results
 
         except Exception as e:
-            print(f"Error querying Firestore: {e}")
+            logger.error("Error querying Firestore: %s", e)
             return [{"error": str(e)}]
 
-review_tool = ReviewTool()
+    def sync_index(self, batch_size: int = 500) -> int:
+        """
+        Embeds every review in the Firestore 'reviews' collection into the
+        vector index, one page at a time. Returns the number of reviews indexed.
+        """
+        if not self.db:
+            raise RuntimeError("Firestore client not initialized. Check credentials.")
+        if self.index is None:
+            raise RuntimeError("Vector index not available. Check VECTOR_BACKEND and its dependencies.")
+
+        reviews_ref = self.db.collection("reviews").order_by("__name__")
+        last_doc = None
+        total = 0
+
+        while True:
+            page = reviews_ref.limit(batch_size)
+            if last_doc is not None:
+                page = page.start_after(last_doc)
+            docs = list(page.stream())
+            if not docs:
+                break
+
+            batch = [{"id": doc.id, **doc.to_dict()} for doc in docs]
+            total += self.index.upsert(batch)
+            last_doc = docs[-1]
+            logger.info("Indexed %d reviews...", total)
 
-def query_reviews(query: str):
+        return total
+
+_review_tool = None
+_review_tool_lock = threading.Lock()
+
+def get_review_tool() -> ReviewTool:
+    """
+    The shared ReviewTool, created on first use. Building it reads
+    credentials, connects to Firestore and loads the index, so it is kept
+    out of import time.
+    """
+    global _review_tool
+    if _review_tool is None:
+        with _review_tool_lock:
+            if _review_tool is None:
+                _review_tool = ReviewTool()
+    return _review_tool
+
+def set_review_tool(tool: ReviewTool):
+    """Replaces the shared ReviewTool (e.g. with one over a FakeFirestore)."""
+    global _review_tool
+    _review_tool = tool
+
+def _matches_filters(review: Dict[str, Any], filters: Dict[str, Any]) -> bool:
+    if filters["min_rating"] is not None and to_rating(review.get("score")) < filters["min_rating"]:
+        return False
+    if filters["max_rating"] is not None and to_rating(review.get("score")) > filters["max_rating"]:
+        return False
+    if filters["since"] is not None or filters["until"] is not None:
+        timestamp = to_timestamp(review.get("date"))
+        if filters["since"] is not None and timestamp < filters["since"]:
+            return False
+        if filters["until"] is not None and timestamp > filters["until"]:
+            return False
+    return True
+
+def query_reviews(query: str, top_k: int = 5, app_id: Optional[str] = None,
+                  min_rating: Optional[int] = None, max_rating: Optional[int] = None,
+                  since: Optional[float] = None, until: Optional[float] = None):
     """
     Search for app reviews related to a specific topic or issue.
     Args:
         query: The search query.
+        top_k: Maximum number of reviews to return.
+        app_id: Only return reviews for this app.
+        min_rating / max_rating: Only return reviews rated within this range (1-5).
+        since / until: Only return reviews dated within this range (epoch seconds).
     Returns:
         A list of relevant reviews.
     """
-    return review_tool.query_reviews(query)
+    return get_review_tool().query_reviews(query, top_k=top_k, app_id=app_id, min_rating=min_rating,
+                                           max_rating=max_rating, since=since, until=until)
+
+
+if __name__ == "__main__":
+    # Build (or refresh) the local vector index: python rag_tool.py
+    from logging_setup import setup_cli_logging
+    setup_cli_logging()
+    review_tool = get_review_tool()
+    count = review_tool.sync_index()
+    print(f"Vector index now holds {review_tool.index.count()} reviews ({count} upserted)")
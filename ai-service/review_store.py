@@ -0,0 +1,331 @@
+import os
+import threading
+import logging
+from array import array
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional, Callable
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Review text beyond this many characters is not kept in memory. Together with
+# the fixed-width columns this bounds the store's footprint per review.
+REVIEW_STORE_MAX_TEXT_CHARS = int(os.getenv("REVIEW_STORE_MAX_TEXT_CHARS", "2000"))
+# Rebuild the text buffer once this fraction of it belongs to deleted/replaced reviews
+REVIEW_STORE_COMPACT_RATIO = float(os.getenv("REVIEW_STORE_COMPACT_RATIO", "0.3"))
+
+
+def to_timestamp(value) -> float:
+    """Converts a Firestore timestamp / ISO string / epoch number to epoch seconds (0 if unknown)."""
+    if value is None:
+        return 0.0
+    if isinstance(value, (int, float)):
+        # Millisecond epochs are common in the Node.js scraper
+        return value / 1000.0 if value > 1e11 else float(value)
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.timestamp()
+    if hasattr(value, "timestamp"):
+        return value.timestamp()
+    try:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return 0.0
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def to_rating(value) -> int:
+    try:
+        return max(0, min(5, int(round(float(value)))))
+    except (TypeError, ValueError):
+        return 0
+
+
+class ReviewStore:
+    """
+    In-memory copy of the Firestore 'reviews' collection in columnar form.
+
+    Each review is one row across fixed-width arrays (app id, rating,
+    timestamp, text offset/length); review text lives UTF-8 encoded in one
+    shared bytearray. Apart from the id -> row dict there is no per-review
+    Python object, so millions of reviews fit in a predictable amount of
+    memory. Rows of removed reviews are recycled and the text buffer is
+    compacted when too much of it is garbage.
+
+    The store is filled and kept current by a Firestore on_snapshot listener
+    (listen) or loaded once (load). It is thread-safe: snapshot callbacks
+    arrive on a Firestore background thread.
+    """
+
+    def __init__(self, max_text_chars: int = REVIEW_STORE_MAX_TEXT_CHARS):
+        self.max_text_chars = max_text_chars
+        self._lock = threading.RLock()
+        self._row_by_id = {}  # review id -> row
+        self._ids = []  # row -> review id (None for free rows)
+        self._free_rows = []
+        self._app_names = []  # interned app ids; column stores the index
+        self._app_index = {}
+        self._apps = array("I")
+        self._ratings = array("b")
+        self._timestamps = array("d")
+        self._text_offsets = array("Q")
+        self._text_lengths = array("I")
+        self._alive = bytearray()
+        self._text = bytearray()
+        self._dead_text_bytes = 0
+        self._listeners = []
+        self._watch = None
+        self.ready = threading.Event()
+
+    def __len__(self) -> int:
+        return len(self._row_by_id)
+
+    def __contains__(self, review_id) -> bool:
+        return str(review_id) in self._row_by_id
+
+    # -- writes ---------------------------------------------------------------
+
+    def _intern_app(self, app_id) -> int:
+        app_id = str(app_id or "")
+        index = self._app_index.get(app_id)
+        if index is None:
+            index = self._app_index[app_id] = len(self._app_names)
+            self._app_names.append(app_id)
+        return index
+
+    def _write_text(self, text: str):
+        encoded = text[:self.max_text_chars].encode("utf-8")
+        offset = len(self._text)
+        self._text += encoded
+        return offset, len(encoded)
+
+    def _upsert(self, review_id: str, data: Dict[str, Any]):
+        text = (data.get("text") or data.get("content") or "").strip()
+        app = self._intern_app(data.get("appId"))
+        rating = to_rating(data.get("score"))
+        timestamp = to_timestamp(data.get("date") or data.get("updatedAt"))
+
+        row = self._row_by_id.get(review_id)
+        if row is not None:
+            current = self._text_offsets[row], self._text_lengths[row]
+            if bytes(self._text[current[0]:current[0] + current[1]]) == text[:self.max_text_chars].encode("utf-8"):
+                offset, length = current
+            else:
+                self._dead_text_bytes += current[1]
+                offset, length = self._write_text(text)
+            self._apps[row] = app
+            self._ratings[row] = rating
+            self._timestamps[row] = timestamp
+            self._text_offsets[row] = offset
+            self._text_lengths[row] = length
+            return
+
+        offset, length = self._write_text(text)
+        if self._free_rows:
+            row = self._free_rows.pop()
+            self._ids[row] = review_id
+            self._apps[row] = app
+            self._ratings[row] = rating
+            self._timestamps[row] = timestamp
+            self._text_offsets[row] = offset
+            self._text_lengths[row] = length
+            self._alive[row] = 1
+        else:
+            row = len(self._ids)
+            self._ids.append(review_id)
+            self._apps.append(app)
+            self._ratings.append(rating)
+            self._timestamps.append(timestamp)
+            self._text_offsets.append(offset)
+            self._text_lengths.append(length)
+            self._alive.append(1)
+        self._row_by_id[review_id] = row
+
+    def _remove(self, review_id: str) -> bool:
+        row = self._row_by_id.pop(review_id, None)
+        if row is None:
+            return False
+        self._dead_text_bytes += self._text_lengths[row]
+        self._ids[row] = None
+        self._alive[row] = 0
+        self._text_lengths[row] = 0
+        self._free_rows.append(row)
+        return True
+
+    def upsert(self, review_id, data: Dict[str, Any]):
+        self.apply([("upsert", str(review_id), data)])
+
+    def remove(self, review_id):
+        self.apply([("remove", str(review_id), None)])
+
+    def apply(self, changes):
+        """
+        Applies a batch of ("upsert" | "remove", review_id, data) changes,
+        then notifies subscribers with the upserted reviews and removed ids.
+        """
+        upserted, removed = [], []
+        with self._lock:
+            for kind, review_id, data in changes:
+                if kind == "remove":
+                    if self._remove(review_id):
+                        removed.append(review_id)
+                else:
+                    self._upsert(review_id, data or {})
+                    upserted.append({"id": review_id, **(data or {})})
+            self._maybe_compact()
+
+        for listener in list(self._listeners):
+            try:
+                listener(upserted, removed)
+            except Exception as e:
+                logger.warning("Review store subscriber failed: %s", e)
+
+    def _maybe_compact(self):
+        if not self._text or self._dead_text_bytes < REVIEW_STORE_COMPACT_RATIO * len(self._text):
+            return
+        compacted = bytearray()
+        for row, alive in enumerate(self._alive):
+            if not alive:
+                continue
+            offset, length = self._text_offsets[row], self._text_lengths[row]
+            self._text_offsets[row] = len(compacted)
+            compacted += self._text[offset:offset + length]
+        self._text = compacted
+        self._dead_text_bytes = 0
+
+    def subscribe(self, callback: Callable[[List[Dict[str, Any]], List[str]], None]):
+        """Registers callback(upserted_reviews, removed_ids), called after every applied batch."""
+        self._listeners.append(callback)
+
+    # -- Firestore sync -------------------------------------------------------
+
+    def load(self, collection_ref, page_size: int = 1000) -> int:
+        """One-off bulk load of a collection, paged by document id."""
+        query = collection_ref.order_by("__name__")
+        last_doc = None
+        total = 0
+        while True:
+            page = query.limit(page_size)
+            if last_doc is not None:
+                page = page.start_after(last_doc)
+            docs = list(page.stream())
+            if not docs:
+                break
+            self.apply([("upsert", doc.id, doc.to_dict()) for doc in docs])
+            total += len(docs)
+            last_doc = docs[-1]
+        self.ready.set()
+        return total
+
+    def listen(self, collection_ref):
+        """
+        Keeps the store in sync with a collection. Firestore delivers the
+        whole collection as ADDED in the first callback, then only deltas.
+        """
+        self._watch = collection_ref.on_snapshot(self._on_snapshot)
+        return self._watch
+
+    def _on_snapshot(self, col_snapshot, changes, read_time):
+        batch = []
+        for change in changes:
+            kind = change.type.name
+            if kind == "REMOVED":
+                batch.append(("remove", change.document.id, None))
+            else:
+                batch.append(("upsert", change.document.id, change.document.to_dict()))
+        self.apply(batch)
+        if not self.ready.is_set():
+            self.ready.set()
+            logger.info("Review store loaded with %d reviews", len(self))
+
+    def close(self):
+        if self._watch is not None:
+            self._watch.unsubscribe()
+            self._watch = None
+
+    # -- reads ----------------------------------------------------------------
+
+    def _row_dict(self, row: int) -> Dict[str, Any]:
+        offset, length = self._text_offsets[row], self._text_lengths[row]
+        timestamp = self._timestamps[row]
+        return {
+            "id": self._ids[row],
+            "appId": self._app_names[self._apps[row]],
+            "score": self._ratings[row],
+            "date": datetime.fromtimestamp(timestamp, tz=timezone.utc).isoformat() if timestamp else None,
+            "text": self._text[offset:offset + length].decode("utf-8", errors="ignore"),
+        }
+
+    def get(self, review_id) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._row_by_id.get(str(review_id))
+            return self._row_dict(row) if row is not None else None
+
+    def row_of(self, review_id) -> Optional[int]:
+        """The row a review lives in, as used by rows(); None if it isn't stored."""
+        return self._row_by_id.get(str(review_id))
+
+    def get_many(self, review_ids) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = (self._row_by_id.get(str(review_id)) for review_id in review_ids)
+            return [self._row_dict(row) for row in rows if row is not None]
+
+    def rows(self, app_id: Optional[str] = None, min_rating: Optional[int] = None,
+             max_rating: Optional[int] = None, since: Optional[float] = None,
+             until: Optional[float] = None) -> np.ndarray:
+        """Row numbers of live reviews matching the filters (vectorized over the columns)."""
+        with self._lock:
+            count = len(self._ids)
+            if count == 0:
+                return np.empty(0, dtype=np.int64)
+            mask = np.frombuffer(self._alive, dtype=np.uint8, count=count).astype(bool)
+            if app_id is not None:
+                app = self._app_index.get(str(app_id))
+                if app is None:
+                    return np.empty(0, dtype=np.int64)
+                mask &= np.frombuffer(self._apps, dtype=np.uint32, count=count) == app
+            if min_rating is not None or max_rating is not None:
+                ratings = np.frombuffer(self._ratings, dtype=np.int8, count=count)
+                if min_rating is not None:
+                    mask &= ratings >= min_rating
+                if max_rating is not None:
+                    mask &= ratings <= max_rating
+            if since is not None or until is not None:
+                timestamps = np.frombuffer(self._timestamps, dtype=np.float64, count=count)
+                if since is not None:
+                    mask &= timestamps >= since
+                if until is not None:
+                    mask &= timestamps <= until
+            return np.flatnonzero(mask)
+
+    def recent(self, top_k: int = 5, **filters) -> List[Dict[str, Any]]:
+        """Most recent reviews matching the filters of rows()."""
+        with self._lock:
+            rows = self.rows(**filters)
+            if len(rows) == 0:
+                return []
+            timestamps = np.frombuffer(self._timestamps, dtype=np.float64, count=len(self._ids))[rows]
+            if len(rows) > top_k:
+                top = np.argpartition(-timestamps, top_k)[:top_k]
+                rows, timestamps = rows[top], timestamps[top]
+            order = np.argsort(-timestamps, kind="stable")
+            return [self._row_dict(int(row)) for row in rows[order]]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            column_bytes = sum(len(column) * column.itemsize for column in (
+                self._apps, self._ratings, self._timestamps, self._text_offsets, self._text_lengths
+            )) + len(self._alive)
+            return {
+                "reviews": len(self._row_by_id),
+                "rows": len(self._ids),
+                "apps": len(self._app_names),
+                "ready": self.ready.is_set(),
+                "text_bytes": len(self._text),
+                "dead_text_bytes": self._dead_text_bytes,
+                "column_bytes": column_bytes,
+            }
@@ -0,0 +1,99 @@
+import os
+import re
+from typing import AsyncIterator, List, Optional
+
+# Shorter sentences are held back and sent together with the next one
+VOICE_SENTENCE_MIN_CHARS = int(os.getenv("VOICE_SENTENCE_MIN_CHARS", "20"))
+# A run-on "sentence" is cut at a comma or space once it gets this long, so speech never waits on it
+VOICE_SENTENCE_MAX_CHARS = int(os.getenv("VOICE_SENTENCE_MAX_CHARS", "250"))
+
+# End punctuation (plus closing quotes/brackets) followed by whitespace, or a line break
+_BOUNDARY = re.compile(r"[.!?…]+[\"'”’)\]]*(?=\s)|\n+")
+# Words whose trailing period doesn't end a sentence ("e.g. the", "Dr. Smith", "J. Doe")
+_ABBREVIATIONS = frozenset("e.g i.e mr mrs ms dr st vs approx fig".split())
+# Abbreviations only when a number follows: "No. 5", but "The answer is no. You..."
+_NUMBER_ABBREVIATIONS = frozenset(["no"])
+_LAST_WORD = re.compile(r"([\w.]+)\.$")
+_NEXT_CHAR = re.compile(r"\s*(\S)")
+
+
+def _is_abbreviation(text: str, rest: str) -> Optional[bool]:
+    """
+    Whether the period ending text belongs to an abbreviation, given the
+    text that follows it. None if that depends on a character that hasn't
+    arrived yet.
+    """
+    match = _LAST_WORD.search(text)
+    if match is None:
+        return False
+    word = match.group(1).lower()
+    if word in _NUMBER_ABBREVIATIONS:
+        following = _NEXT_CHAR.match(rest)
+        return following.group(1).isdigit() if following is not None else None
+    return word in _ABBREVIATIONS or (len(word) == 1 and word.isalpha())
+
+
+class SentenceSplitter:
+    """
+    Turns streamed text chunks into whole sentences.
+
+    feed() returns the sentences completed by a chunk; a boundary only counts
+    once the whitespace after it has arrived, so "2.1" or "e.g." split across
+    chunks are never cut. flush() returns whatever is left at the end.
+    """
+
+    def __init__(self, min_chars: int = VOICE_SENTENCE_MIN_CHARS, max_chars: int = VOICE_SENTENCE_MAX_CHARS):
+        self.min_chars = min_chars
+        self.max_chars = max(max_chars, min_chars + 1)
+        self._buffer = ""
+        self._scanned = 0  # buffer prefix already searched for boundaries
+
+    def feed(self, text: str) -> List[str]:
+        self._buffer += text
+        sentences = []
+        start = 0
+        undecided = False
+        for match in _BOUNDARY.finditer(self._buffer, self._scanned):
+            end = match.end()
+            sentence = self._buffer[start:end].strip()
+            if len(sentence) < self.min_chars:
+                continue
+            if match.group()[0] == ".":
+                abbreviation = _is_abbreviation(sentence, self._buffer[end:])
+                if abbreviation is None:
+                    # Decided by the next chunk; look at this boundary again then
+                    undecided = True
+                    break
+                if abbreviation:
+                    continue
+            sentences.append(sentence)
+            start = end
+        self._buffer = self._buffer[start:]
+        while len(self._buffer) > self.max_chars:
+            cut = self._buffer.rfind(", ", 0, self.max_chars)
+            if cut < self.min_chars:
+                cut = self._buffer.rfind(" ", 0, self.max_chars)
+            cut = cut + 1 if cut >= self.min_chars else self.max_chars
+            sentences.append(self._buffer[:cut].strip())
+            self._buffer = self._buffer[cut:]
+        # The tail may be end punctuation (and quotes) still waiting for its whitespace
+        self._scanned = 0 if undecided else max(0, len(self._buffer) - 8)
+        return [sentence for sentence in sentences if sentence]
+
+    def flush(self) -> Optional[str]:
+        rest = self._buffer.strip()
+        self._buffer = ""
+        self._scanned = 0
+        return rest or None
+
+
+async def stream_sentences(chunks: AsyncIterator[str], min_chars: int = VOICE_SENTENCE_MIN_CHARS,
+                           max_chars: int = VOICE_SENTENCE_MAX_CHARS) -> AsyncIterator[str]:
+    """Re-yields a stream of text chunks as whole sentences."""
+    splitter = SentenceSplitter(min_chars, max_chars)
+    async for text in chunks:
+        for sentence in splitter.feed(text):
+            yield sentence
+    rest = splitter.flush()
+    if rest:
+        yield rest
@@ -1,52 +1,319 @@
+import os
+import time
+import sqlite3
+import threading
+import logging
 from datetime import datetime, timedelta
 
+logger = logging.getLogger(__name__)
+
+# Where quota counters and live sessions are kept:
+#   memory - per-process dicts (single worker, resets on restart)
+#   sqlite - shared SQLite file in WAL mode (multiple workers on one host)
+#   redis  - Redis at REDIS_URL (multiple hosts)
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "sqlite")
+# Set explicitly, the backend must work: falling back would quietly make quotas per-worker
+SESSION_BACKEND_REQUIRED = "SESSION_BACKEND" in os.environ
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "sessions.db")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# A session with no heartbeat for this long is treated as crashed and reaped
+SESSION_STALE_SECONDS = int(os.getenv("SESSION_STALE_SECONDS", "300"))
+# Daily counters older than this are deleted
+SESSION_COUNT_RETENTION_DAYS = int(os.getenv("SESSION_COUNT_RETENTION_DAYS", "7"))
+# How often the app reaps stale sessions
+SESSION_REAP_INTERVAL_SECONDS = int(os.getenv("SESSION_REAP_INTERVAL_SECONDS", "60"))
+
+UNLIMITED = 2 ** 62
+
+
+class MemoryBackend:
+    """Process-local backend. Correct only with a single worker."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.daily_counts = {}  # date_str -> count
+        self.sessions = {}  # session_id -> (started_at, heartbeat_at)
+
+    def try_increment(self, day, limit):
+        with self._lock:
+            count = self.daily_counts.get(day, 0)
+            if count >= limit:
+                return False
+            self.daily_counts[day] = count + 1
+            return True
+
+    def get_count(self, day):
+        with self._lock:
+            return self.daily_counts.get(day, 0)
+
+    def expire_days(self, oldest_day):
+        with self._lock:
+            for day in [d for d in self.daily_counts if d < oldest_day]:
+                del self.daily_counts[day]
+
+    def add_session(self, session_id, now):
+        with self._lock:
+            self.sessions[session_id] = (now, now)
+
+    def heartbeat(self, session_id, now):
+        with self._lock:
+            if session_id in self.sessions:
+                self.sessions[session_id] = (self.sessions[session_id][0], now)
+
+    def remove_session(self, session_id):
+        with self._lock:
+            self.sessions.pop(session_id, None)
+
+    def reap_sessions(self, stale_before):
+        with self._lock:
+            stale = [s for s, (_, heartbeat_at) in self.sessions.items() if heartbeat_at < stale_before]
+            for session_id in stale:
+                del self.sessions[session_id]
+            return len(stale)
+
+    def active_count(self):
+        with self._lock:
+            return len(self.sessions)
+
+
+class SQLiteBackend:
+    """
+    SQLite file shared by every worker on the host. WAL mode lets readers
+    run alongside the single writer, and the quota check-and-increment is
+    one conditional UPSERT, so it stays atomic across processes.
+    """
+
+    def __init__(self, path=SESSION_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS daily_counts (day TEXT PRIMARY KEY, count INTEGER NOT NULL)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "session_id TEXT PRIMARY KEY, started_at REAL NOT NULL, heartbeat_at REAL NOT NULL, pid INTEGER)"
+            )
+
+    def _connect(self):
+        # One connection per thread; sqlite3 connections can't be shared across threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            self._local.conn = conn
+        return conn
+
+    def try_increment(self, day, limit):
+        conn = self._connect()
+        cursor = conn.execute(
+            "INSERT INTO daily_counts (day, count) VALUES (?, 1) "
+            "ON CONFLICT(day) DO UPDATE SET count = count + 1 WHERE count < ?",
+            (day, limit),
+        )
+        return cursor.rowcount == 1
+
+    def get_count(self, day):
+        row = self._connect().execute("SELECT count FROM daily_counts WHERE day = ?", (day,)).fetchone()
+        return row[0] if row else 0
+
+    def expire_days(self, oldest_day):
+        self._connect().execute("DELETE FROM daily_counts WHERE day < ?", (oldest_day,))
+
+    def add_session(self, session_id, now):
+        self._connect().execute(
+            "INSERT OR REPLACE INTO sessions (session_id, started_at, heartbeat_at, pid) VALUES (?, ?, ?, ?)",
+            (session_id, now, now, os.getpid()),
+        )
+
+    def heartbeat(self, session_id, now):
+        self._connect().execute("UPDATE sessions SET heartbeat_at = ? WHERE session_id = ?", (now, session_id))
+
+    def remove_session(self, session_id):
+        self._connect().execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def reap_sessions(self, stale_before):
+        return self._connect().execute("DELETE FROM sessions WHERE heartbeat_at < ?", (stale_before,)).rowcount
+
+    def active_count(self):
+        return self._connect().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+
+class RedisBackend:
+    """
+    Redis backend for workers spread over several hosts. Day counters are
+    keys that expire on their own; live sessions are a sorted set scored by
+    heartbeat time.
+    """
+
+    # Increment the day counter only while it is below the limit
+    _INCREMENT_SCRIPT = """
+    local count = tonumber(redis.call('GET', KEYS[1]) or '0')
+    if count >= tonumber(ARGV[1]) then
+        return 0
+    end
+    redis.call('INCR', KEYS[1])
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+    return 1
+    """
+
+    def __init__(self, client=None, prefix="insightify:sessions"):
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(REDIS_URL)
+        self.redis = client
+        # from_url() and register_script() don't connect; fail here, not on
+        # the first live session, if the server can't be reached
+        self.redis.ping()
+        self.prefix = prefix
+        self._increment = self.redis.register_script(self._INCREMENT_SCRIPT)
+
+    def _day_key(self, day):
+        return f"{self.prefix}:count:{day}"
+
+    @property
+    def _sessions_key(self):
+        return f"{self.prefix}:active"
+
+    def try_increment(self, day, limit):
+        ttl = (SESSION_COUNT_RETENTION_DAYS + 1) * 86400
+        return bool(self._increment(keys=[self._day_key(day)], args=[limit, ttl]))
+
+    def get_count(self, day):
+        return int(self.redis.get(self._day_key(day)) or 0)
+
+    def expire_days(self, oldest_day):
+        pass  # day keys carry their own TTL
+
+    def add_session(self, session_id, now):
+        self.redis.zadd(self._sessions_key, {session_id: now})
+
+    def heartbeat(self, session_id, now):
+        self.redis.zadd(self._sessions_key, {session_id: now}, xx=True)
+
+    def remove_session(self, session_id):
+        self.redis.zrem(self._sessions_key, session_id)
+
+    def reap_sessions(self, stale_before):
+        return self.redis.zremrangebyscore(self._sessions_key, "-inf", f"({stale_before}")
+
+    def active_count(self):
+        return self.redis.zcard(self._sessions_key)
+
+
+def create_backend(name=SESSION_BACKEND):
+    if name == "memory":
+        return MemoryBackend()
+    if name == "redis":
+        return RedisBackend()
+    if name == "sqlite":
+        return SQLiteBackend()
+    raise ValueError(f"Unknown SESSION_BACKEND: {name}")
+
+
 class SessionManager:
-    def __init__(self, is_paid=False):
+    def __init__(self, is_paid=False, backend=None, stale_seconds=SESSION_STALE_SECONDS):
         self.is_paid = is_paid
         self.max_sessions = 50 if is_paid else 5
-        self.sessions = {} # session_id -> start_time
-        self.daily_counts = {} # date_str -> count
-        self.active_sessions = set()
+        self.stale_seconds = stale_seconds
+        # Why the configured backend couldn't be used, if it couldn't (see /readyz)
+        self.backend_error = None
+        if backend is None:
+            try:
+                backend = create_backend()
+            except Exception as e:
+                if SESSION_BACKEND_REQUIRED:
+                    raise RuntimeError(f"SESSION_BACKEND={SESSION_BACKEND} is unavailable: {e}") from e
+                logger.error("Session backend %r unavailable (%s); quotas are per-worker until it is fixed",
+                             SESSION_BACKEND, e)
+                self.backend_error = str(e)
+                backend = MemoryBackend()
+        self.backend = backend
 
     def _get_today_str(self):
         return datetime.now().strftime("%Y-%m-%d")
 
     def can_start_session(self):
         today = self._get_today_str()
-        count = self.daily_counts.get(today, 0)
-        
+        count = self.backend.get_count(today)
+
         if count >= self.max_sessions:
             return False, "Daily session limit reached"
-        
+
+        return True, "OK"
+
+    def try_start_session(self, session_id):
+        """
+        Atomically checks the daily limit and records the session start.
+        Safe with several workers sharing the backend.
+        """
+        if not self.backend.try_increment(self._get_today_str(), self.max_sessions):
+            return False, "Daily session limit reached"
+        self.backend.add_session(str(session_id), time.time())
         return True, "OK"
 
     def start_session(self, session_id):
-        today = self._get_today_str()
-        self.active_sessions.add(session_id)
-        self.sessions[session_id] = datetime.now()
-        
-        # Increment daily count
-        current_count = self.daily_counts.get(today, 0)
-        self.daily_counts[today] = current_count + 1
+        # Increment daily count (the caller already checked can_start_session)
+        self.backend.try_increment(self._get_today_str(), UNLIMITED)
+        self.backend.add_session(str(session_id), time.time())
+
+    def heartbeat(self, session_id):
+        self.backend.heartbeat(str(session_id), time.time())
 
     def end_session(self, session_id):
-        if session_id in self.active_sessions:
-            self.active_sessions.remove(session_id)
-        if session_id in self.sessions:
-            del self.sessions[session_id]
+        self.backend.remove_session(str(session_id))
+
+    def reap_stale_sessions(self):
+        """Drops sessions whose connection died without end_session, and old day counters."""
+        reaped = self.backend.reap_sessions(time.time() - self.stale_seconds)
+        oldest_day = (datetime.now() - timedelta(days=SESSION_COUNT_RETENTION_DAYS)).strftime("%Y-%m-%d")
+        self.backend.expire_days(oldest_day)
+        if reaped:
+            logger.info("Reaped %d stale session(s)", reaped)
+        return reaped
+
+    def backend_status(self):
+        return {
+            "backend": type(self.backend).__name__,
+            "shared": not isinstance(self.backend, MemoryBackend),
+            "error": self.backend_error,
+        }
 
     def get_status(self):
         today = self._get_today_str()
-        used = self.daily_counts.get(today, 0)
+        used = self.backend.get_count(today)
         remaining = max(0, self.max_sessions - used)
-        
+
         # Reset time is usually next midnight
         now = datetime.now()
         tomorrow = now + timedelta(days=1)
         reset_time = datetime(year=tomorrow.year, month=tomorrow.month, day=tomorrow.day)
-        
+
         return {
             "sessions_used": used,
             "sessions_remaining": remaining,
+            "active_sessions": self.backend.active_count(),
             "resets_at": reset_time.strftime("%H:%M:%S")
         }
+
+
+_session_manager = None
+_session_manager_lock = threading.Lock()
+
+def get_session_manager() -> SessionManager:
+    """
+    The worker's SessionManager, created on first use. Opening the backend
+    touches sessions.db or Redis, so it is kept out of import time.
+    """
+    global _session_manager
+    if _session_manager is None:
+        with _session_manager_lock:
+            if _session_manager is None:
+                # Set is_paid=True if you've enabled billing on your Google Cloud project
+                _session_manager = SessionManager(is_paid=False)
+    return _session_manager
+
+def set_session_manager(manager: SessionManager):
+    """Replaces the shared SessionManager (e.g. with one over a MemoryBackend)."""
+    global _session_manager
+    _session_manager = manager
@@ -0,0 +1,51 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls: while a call for a key is in
+    flight, later callers with the same key wait for its result instead of
+    starting their own. Every waiter gets the same result (or exception).
+
+    The shared call runs as its own task, so a waiter that disconnects or is
+    cancelled doesn't cancel the work the others are waiting on. Nothing is
+    kept once the call finishes; this is not a cache.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight = {}  # key -> asyncio.Task
+        self.calls = 0
+        self.executed = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        self.calls += 1
+        task = self._inflight.get(key)
+        if task is None:
+            self.executed += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done, key=key: self._finished(key, done))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _finished(self, key: Hashable, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            self.errors += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._inflight),
+            "calls": self.calls,
+            "executed": self.executed,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+        }
@@ -0,0 +1,25 @@
+import unittest
+
+from aggregates import classify_question
+
+
+class ClassifyQuestionTest(unittest.TestCase):
+    def test_statistical_questions(self):
+        self.assertEqual(classify_question("What are the top complaints?"), "complaints")
+        self.assertEqual(classify_question("What's the rating distribution?"), "ratings")
+        self.assertEqual(classify_question("What is the average rating?"), "ratings")
+        self.assertEqual(classify_question("Show the trend over the last 2 weeks"), "trend")
+        self.assertEqual(classify_question("How are ratings trending this month?"), "trend")
+
+    def test_scoped_questions_go_to_the_model(self):
+        # The aggregates can't filter by topic or platform
+        self.assertIsNone(classify_question("average rating of reviews mentioning crashes"))
+        self.assertIsNone(classify_question("top complaints on android"))
+        self.assertIsNone(classify_question("What are the main complaints about login?"))
+
+    def test_open_questions_go_to_the_model(self):
+        self.assertIsNone(classify_question("Why do users hate the new dashboard?"))
+
+
+if __name__ == "__main__":
+    unittest.main()
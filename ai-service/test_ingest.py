@@ -0,0 +1,93 @@
+import os
+import tempfile
+import unittest
+
+from fake_firestore import FakeFirestore
+from ingest import ReviewIngester
+
+
+class RecordingIndex:
+    """Stands in for the vector index; workers=0 embeds through embed()."""
+
+    model_name = "test"
+
+    def __init__(self):
+        self.written = {}
+
+    def embed(self, documents):
+        return [[float(len(document))] for document in documents]
+
+    def upsert_embedded(self, ids, embeddings, documents, metadatas):
+        self.written.update(zip(ids, documents))
+        return len(ids)
+
+
+def add_review(db, review_id, date, **fields):
+    db.collection("reviews").document(review_id).set(
+        {"appId": "app", "score": 4, "text": f"Review {review_id} about sync", "date": date, **fields})
+
+
+class ReviewIngesterTest(unittest.TestCase):
+    def setUp(self):
+        self.db = FakeFirestore()
+        self.index = RecordingIndex()
+        self.directory = tempfile.TemporaryDirectory()
+        self.checkpoint = os.path.join(self.directory.name, "checkpoint.json")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def ingester(self, **kwargs):
+        return ReviewIngester(self.db, self.index, checkpoint_path=self.checkpoint, page_size=2, workers=0,
+                              **kwargs)
+
+    def test_ingests_every_review_in_pages(self):
+        for day in range(1, 6):
+            add_review(self.db, f"r{day}", f"2024-01-0{day}")
+
+        stats = self.ingester().run()
+
+        self.assertEqual(stats["state"], "done")
+        self.assertEqual(stats["written"], 5)
+        self.assertEqual(stats["pages"], 3)
+        self.assertEqual(set(self.index.written), {"r1", "r2", "r3", "r4", "r5"})
+        self.assertEqual(stats["checkpoint"]["id"], "r5")
+
+    def test_next_run_picks_up_only_newer_reviews(self):
+        add_review(self.db, "r1", "2024-01-01")
+        add_review(self.db, "r2", "2024-01-02")
+        self.ingester().run()
+
+        self.index.written.clear()
+        add_review(self.db, "r3", "2024-01-02")  # same date as the checkpoint, later id
+        add_review(self.db, "r4", "2024-01-03")
+        stats = self.ingester().run()
+
+        self.assertEqual(set(self.index.written), {"r3", "r4"})
+        self.assertEqual(stats["checkpoint"]["total"], 4)
+
+    def test_skips_reviews_without_text(self):
+        add_review(self.db, "r1", "2024-01-01")
+        add_review(self.db, "r2", "2024-01-02", text="")
+
+        stats = self.ingester().run()
+
+        self.assertEqual(stats["written"], 1)
+        self.assertEqual(stats["skipped"], 1)
+
+    def test_fails_when_no_review_has_the_cursor_field(self):
+        add_review(self.db, "r1", "2024-01-01")
+        ingester = self.ingester(updated_field="updatedAt")
+
+        with self.assertRaises(RuntimeError):
+            ingester.run()
+
+        self.assertEqual(ingester.stats()["state"], "failed")
+        self.assertIn("updatedAt", ingester.stats()["error"])
+
+    def test_empty_collection_is_done(self):
+        self.assertEqual(self.ingester().run()["state"], "done")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import asyncio
+import unittest
+
+from fake_genai import FakeBehavior, FakeClient
+from gemini_live import GeminiLiveClient, LIVE_MODEL, LIVE_CONFIG
+from live_pool import LiveSessionPool, pool_key
+
+
+def fake_client():
+    return FakeClient(behavior=FakeBehavior(latency=0, jitter=0, live_connect_latency=0, chunk_interval=0))
+
+
+class LiveSessionPoolTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.pool = LiveSessionPool(fake_client(), size=2)
+        self.pool.register(LIVE_MODEL, LIVE_CONFIG)
+        self.acquired = []
+        acquire = self.pool.acquire
+
+        async def recording_acquire(model, config):
+            pooled = await acquire(model, config)
+            self.acquired.append(pooled)
+            return pooled
+
+        self.pool.acquire = recording_acquire
+
+    async def asyncTearDown(self):
+        await self.pool.aclose()
+
+    async def test_cancelled_session_is_not_reused(self):
+        client = GeminiLiveClient(client=self.pool.client, pool=self.pool)
+        client.api_key = "test"
+        frames_sent = asyncio.Event()
+
+        async def mic():
+            for _ in range(30):
+                yield b"\x00" * 640
+            frames_sent.set()
+            await asyncio.Event().wait()  # the caller hangs up mid-stream
+
+        task = asyncio.create_task(client.connect(mic(), asyncio.Queue()))
+        await asyncio.wait_for(frames_sent.wait(), timeout=5)
+        await asyncio.sleep(0)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+
+        [pooled] = self.acquired
+        self.assertTrue(pooled.used)
+        self.assertEqual(pooled.session.audio_in, 30)
+        self.assertEqual(self.pool.stats()["returned"], 0)
+        self.assertEqual(self.pool.stats()["retired"], 1)
+        self.assertFalse(self.pool._idle[pool_key(LIVE_MODEL, LIVE_CONFIG)])
+
+    async def test_used_session_is_closed_even_if_released_as_reusable(self):
+        pooled = await self.pool.acquire(LIVE_MODEL, LIVE_CONFIG)
+        pooled.used = True
+        await self.pool.release(pooled, reusable=True)
+        self.assertEqual(self.pool.stats()["returned"], 0)
+        self.assertEqual(self.pool.stats()["retired"], 1)
+
+    async def test_pool_fills_only_after_first_use(self):
+        await self.pool._refill_once()
+        self.assertEqual(self.pool.stats()["connects"], 0)
+
+        pooled = await self.pool.acquire(LIVE_MODEL, LIVE_CONFIG)
+        await self.pool.release(pooled)
+        await self.pool._refill_once()
+        self.assertEqual(self.pool.stats()["warm"], {pool_key(LIVE_MODEL, LIVE_CONFIG): 2})
+
+    async def test_pool_stops_refilling_without_traffic(self):
+        self.pool.keep_warm = 0
+        pooled = await self.pool.acquire(LIVE_MODEL, LIVE_CONFIG)
+        await self.pool.release(pooled)
+        await self.pool._refill_once()
+        self.assertEqual(self.pool.stats()["connects"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import asyncio
+import unittest
+from contextlib import aclosing
+
+from model_router import ModelRouter, NoHealthyModelError
+
+
+def chunks(fail_at=None):
+    """stream(model) yielding "model:0".."model:2", failing before chunk fail_at[model]."""
+    fail_at = fail_at or {}
+
+    async def stream(model):
+        for index in range(3):
+            if fail_at.get(model) == index:
+                raise RuntimeError("upstream error")
+            await asyncio.sleep(0)
+            yield f"{model}:{index}"
+    return stream
+
+
+class RunStreamTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.router = ModelRouter(["a", "b", "c"])
+
+    async def test_falls_through_before_the_first_chunk(self):
+        items = [item async for item in self.router.run_stream(chunks({"a": 0}))]
+
+        self.assertEqual(items, [("b", "b:0"), ("b", "b:1"), ("b", "b:2")])
+        self.assertEqual(self.router.models["a"].failures, 1)
+        self.assertEqual(self.router.models["b"].successes, 1)
+
+    async def test_does_not_switch_models_once_chunks_are_out(self):
+        items = []
+        with self.assertRaises(NoHealthyModelError):
+            async for item in self.router.run_stream(chunks({"a": 1})):
+                items.append(item)
+
+        self.assertEqual(items, [("a", "a:0")])
+        self.assertEqual(self.router.models["b"].successes + self.router.models["b"].failures, 0)
+
+    async def test_closing_early_is_not_a_failure(self):
+        self.router.models["a"].state = "half_open"
+        async with aclosing(self.router.run_stream(chunks())) as stream:
+            async for _ in stream:
+                break
+
+        self.assertEqual(self.router.models["a"].failures, 0)
+        self.assertFalse(self.router.models["a"].probing)
+
+
+class CandidatesTest(unittest.TestCase):
+    def test_healthy_models_are_ordered_by_latency(self):
+        router = ModelRouter(["a", "b", "c"])
+        router.record_success("a", 900)
+        router.record_success("b", 200)
+
+        self.assertEqual(router.candidates(), ["b", "a", "c"])
+        self.assertEqual(router.candidates(preferred="c"), ["c", "b", "a"])
+
+
+if __name__ == "__main__":
+    unittest.main()
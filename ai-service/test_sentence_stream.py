@@ -0,0 +1,52 @@
+import unittest
+
+from sentence_stream import SentenceSplitter
+
+
+def split(chunks, **kwargs):
+    splitter = SentenceSplitter(**kwargs)
+    sentences = []
+    for chunk in chunks:
+        sentences.extend(splitter.feed(chunk))
+    rest = splitter.flush()
+    return sentences + ([rest] if rest else [])
+
+
+class SentenceSplitterTest(unittest.TestCase):
+    def test_splits_at_sentence_ends(self):
+        self.assertEqual(split(["Crashes went up after 2.1 shipped. Most of them are on login! Should we fix that?"]),
+                         ["Crashes went up after 2.1 shipped.", "Most of them are on login!", "Should we fix that?"])
+
+    def test_waits_for_the_whitespace_after_a_period(self):
+        # "2." could still become "2.1"
+        self.assertEqual(split(["Most complaints mention version 2.", "1 and the new login flow."]),
+                         ["Most complaints mention version 2.1 and the new login flow."])
+
+    def test_abbreviations_do_not_end_a_sentence(self):
+        self.assertEqual(split(["Users ask for e.g. dark mode and export. Dr. Smith agrees with them."]),
+                         ["Users ask for e.g. dark mode and export.", "Dr. Smith agrees with them."])
+
+    def test_no_ends_a_sentence_unless_a_number_follows(self):
+        self.assertEqual(split(["I checked it and the answer is no. You should update first."]),
+                         ["I checked it and the answer is no.", "You should update first."])
+        self.assertEqual(split(["See issue no. 5 in the tracker for details. It explains it."]),
+                         ["See issue no. 5 in the tracker for details.", "It explains it."])
+
+    def test_no_waits_for_the_next_chunk(self):
+        self.assertEqual(split(["I checked it and the answer is no.", " ", "You should update first."]),
+                         ["I checked it and the answer is no.", "You should update first."])
+        self.assertEqual(split(["See issue no.", " ", "5 in the tracker for details. It explains it."]),
+                         ["See issue no. 5 in the tracker for details.", "It explains it."])
+
+    def test_short_sentences_are_held_back(self):
+        self.assertEqual(split(["Yes. Ratings dropped to 3.2 this week."], min_chars=20),
+                         ["Yes. Ratings dropped to 3.2 this week."])
+
+    def test_run_on_text_is_cut(self):
+        sentences = split(["word " * 100], min_chars=20, max_chars=50)
+        self.assertTrue(all(len(sentence) <= 50 for sentence in sentences))
+        self.assertEqual(" ".join(sentences).split(), ["word"] * 100)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import types
+import unittest
+from unittest import mock
+
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+import main
+from admission import create_live_admission
+from session_manager import MemoryBackend, SessionManager, set_session_manager
+
+
+class WsAgentAdmissionTest(unittest.TestCase):
+    """/ws/agent gives back its admission ticket and session on every way out."""
+
+    def setUp(self):
+        self.sessions = SessionManager(backend=MemoryBackend())
+        set_session_manager(self.sessions)
+        for patch in (mock.patch.object(main, "STARTUP_WARMUP", False),
+                      mock.patch.object(main, "live_admission", create_live_admission())):
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.client = TestClient(main.app)
+        self.client.__enter__()
+        self.addCleanup(self.client.__exit__, None, None, None)
+        self.addCleanup(set_session_manager, None)
+
+    def connect(self):
+        with self.assertRaises(WebSocketDisconnect) as closed:
+            with self.client.websocket_connect("/ws/agent") as websocket:
+                websocket.receive_bytes()
+        return closed.exception
+
+    def assertReleased(self):
+        self.assertEqual(main.live_admission.stats()["active"], 0)
+        self.assertEqual(self.sessions.get_status()["active_sessions"], 0)
+
+    def test_missing_api_key_releases_everything(self):
+        with mock.patch.object(main, "get_gemini", mock.AsyncMock(return_value=None)):
+            first = self.connect()
+            second = self.connect()
+
+        self.assertEqual(first.code, 1011)
+        # Not locked out with 1013 (client_concurrency) by the first attempt
+        self.assertEqual(second.code, 1011)
+        self.assertReleased()
+
+    def test_live_client_error_releases_everything(self):
+        gemini = types.SimpleNamespace(client=object())
+        with mock.patch.object(main, "get_gemini", mock.AsyncMock(return_value=gemini)), \
+                mock.patch.object(main, "GeminiLiveClient", side_effect=ValueError("no client")):
+            closed = self.connect()
+
+        self.assertEqual(closed.code, 1011)
+        self.assertReleased()
+        self.assertEqual(self.sessions.get_status()["sessions_used"], 1)
+
+    def test_daily_limit_releases_the_ticket(self):
+        self.sessions.max_sessions = 0
+
+        closed = self.connect()
+
+        self.assertEqual(closed.code, 4000)
+        self.assertReleased()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,151 @@
+import os
+from typing import List, Dict, Any, Optional
+
+# Where the persistent index lives on disk and which embedding model builds it.
+# Changing EMBEDDING_MODEL requires rebuilding the index (delete CHROMA_PATH).
+CHROMA_PATH = os.getenv("CHROMA_PATH", "chroma_db")
+CHROMA_COLLECTION = os.getenv("CHROMA_COLLECTION", "reviews")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "256"))
+# "chroma" (HNSW index, below) or "memmap" (quantized vectors shared by all
+# workers through the page cache, see embedding_store.py)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+
+# Metadata fields copied from a Firestore review document into the index.
+# Chroma only accepts str/int/float/bool metadata values.
+METADATA_FIELDS = ("appId", "score", "userName", "version", "thumbsUp", "date")
+
+
+def review_text(review: Dict[str, Any]) -> str:
+    """Returns the text that gets embedded for a review document."""
+    return (review.get("text") or review.get("content") or "").strip()
+
+
+def review_metadata(review: Dict[str, Any]) -> Dict[str, Any]:
+    """Flattens the filterable fields of a review into Chroma-safe metadata."""
+    metadata = {}
+    for field in METADATA_FIELDS:
+        value = review.get(field)
+        if value is None:
+            continue
+        if hasattr(value, "isoformat"):
+            # Firestore timestamps come back as datetime objects
+            value = value.isoformat()
+        if not isinstance(value, (str, int, float, bool)):
+            value = str(value)
+        metadata[field] = value
+    return metadata
+
+
+def prepare_reviews(reviews: List[Dict[str, Any]]):
+    """Splits review documents into (ids, texts, metadatas), skipping ones without an id or text."""
+    ids, documents, metadatas = [], [], []
+    for review in reviews:
+        text = review_text(review)
+        if not text or not review.get("id"):
+            continue
+        ids.append(str(review["id"]))
+        documents.append(text)
+        metadatas.append(review_metadata(review))
+    return ids, documents, metadatas
+
+
+class ReviewVectorIndex:
+    """
+    Persistent nearest-neighbour index over review text.
+
+    Reviews are embedded once with a sentence-transformers model and stored in
+    a local Chroma collection (HNSW, cosine distance), so a query is a local
+    embedding + ANN lookup with no network round trip.
+    """
+
+    def __init__(self, path: str = CHROMA_PATH, collection_name: str = CHROMA_COLLECTION,
+                 model_name: str = EMBEDDING_MODEL):
+        import chromadb
+        from sentence_transformers import SentenceTransformer
+
+        self.model_name = model_name
+        self.model = SentenceTransformer(model_name)
+        self.client = chromadb.PersistentClient(path=path)
+        self.collection = self.client.get_or_create_collection(
+            name=collection_name,
+            metadata={"hnsw:space": "cosine"},
+        )
+
+    def count(self) -> int:
+        return self.collection.count()
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        vectors = self.model.encode(
+            texts,
+            batch_size=EMBEDDING_BATCH_SIZE,
+            normalize_embeddings=True,
+            show_progress_bar=False,
+        )
+        return vectors.tolist()
+
+    def upsert(self, reviews: List[Dict[str, Any]]) -> int:
+        """
+        Embeds and stores reviews. Each review needs an "id"; reviews without
+        text are skipped. Returns the number of reviews written.
+        """
+        ids, documents, metadatas = prepare_reviews(reviews)
+        if not ids:
+            return 0
+        return self.upsert_embedded(ids, self.embed(documents), documents, metadatas)
+
+    def upsert_embedded(self, ids: List[str], embeddings, documents: List[str],
+                        metadatas: List[Dict[str, Any]]) -> int:
+        """Stores reviews whose embeddings were computed elsewhere (see ingest.py)."""
+        if not ids:
+            return 0
+        if hasattr(embeddings, "tolist"):
+            embeddings = embeddings.tolist()
+        self.collection.upsert(
+            ids=ids,
+            embeddings=embeddings,
+            documents=documents,
+            metadatas=metadatas,
+        )
+        return len(ids)
+
+    def delete(self, ids: List[str]):
+        if ids:
+            self.collection.delete(ids=[str(i) for i in ids])
+
+    def query(self, query: str, top_k: int = 5, app_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Returns the top_k reviews closest to the query, optionally for one app."""
+        if self.count() == 0:
+            return []
+
+        where = {"appId": app_id} if app_id else None
+        result = self.collection.query(
+            query_embeddings=self.embed([query]),
+            n_results=top_k,
+            where=where,
+            include=["documents", "metadatas", "distances"],
+        )
+
+        reviews = []
+        for review_id, text, metadata, distance in zip(
+            result["ids"][0],
+            result["documents"][0],
+            result["metadatas"][0],
+            result["distances"][0],
+        ):
+            review = dict(metadata or {})
+            review["id"] = review_id
+            review["text"] = text
+            review["similarity"] = round(1.0 - distance, 4)
+            reviews.append(review)
+        return reviews
+
+
+def create_vector_index(backend: str = VECTOR_BACKEND):
+    """The configured vector index; both backends share the same interface."""
+    if backend == "memmap":
+        from embedding_store import MemmapVectorIndex
+        return MemmapVectorIndex()
+    if backend != "chroma":
+        raise ValueError(f"Unknown VECTOR_BACKEND {backend!r} (use chroma or memmap)")
+    return ReviewVectorIndex()
@@ -1,51 +1,100 @@
-from fastapi import FastAPI, WebSocket
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from google import genai
 import os
+import uuid
+import logging
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
-from datetime import datetime
+from conversation import Conversation, summary_prompt
+from sentence_stream import stream_sentences
+from logging_setup import setup_logging, stop_logging, new_request_id, session_id_var, request_id_var
 
 load_dotenv()
-app = FastAPI(title="Free Voice Agent - Gemini Text API")
+logger = logging.getLogger("voice_free")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Process-wide logging belongs to the running server, not to importers
+    setup_logging()
+    yield
+    stop_logging()
+
+app = FastAPI(title="Free Voice Agent - Gemini Text API", lifespan=lifespan)
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"])
 
 client = genai.Client(api_key=os.getenv("GOOGLE_API_KEY"), http_options={"api_version": "v1beta"})
 
-def log(message):
-    """Helper to print timestamped logs"""
-    timestamp = datetime.now().strftime("%H:%M:%S.%f")[:-3]
-    print(f"[{timestamp}] {message}")
+MODEL = "models/gemini-2.5-flash"
+INSTRUCTIONS = "You are a Play Store app growth mentor. Be concise (1-2 sentences)."
+
+async def summarize(summary, turns):
+    response = await client.aio.models.generate_content(model=MODEL, contents=summary_prompt(summary, turns))
+    return response.text
+
+async def reply_chunks(prompt):
+    async for chunk in await client.aio.models.generate_content_stream(model=MODEL, contents=prompt):
+        if chunk.text:
+            yield chunk.text
 
 @app.websocket("/ws/voice-agent")
 async def voice_agent(websocket: WebSocket):
     await websocket.accept()
-    log("✅ Client connected to voice agent")
+    session_id_var.set(uuid.uuid4().hex)
+    logger.info("Client connected to voice agent")
+    # Older turns are summarized in the background; the prompt stays the same size
+    conversation = Conversation(summarize)
     
     try:
         while True:
-            log("⏳ Waiting for user speech...")
             data = await websocket.receive_json()
             user_text = data.get("text", "")
+            # {"stream": true}: one {"type": "sentence"} frame per sentence, then {"type": "done"}
+            stream = bool(data.get("stream"))
+            request_id_var.set(new_request_id())
             
             if not user_text:
-                log("⚠️  Empty text received, skipping")
+                logger.debug("Empty text received, skipping")
                 continue
             
-            log(f"📝 Received transcription: '{user_text}'")
-            log("🤖 Sending to Gemini Text API...")
+            logger.info("Message received", extra={"chars": len(user_text), "stream": stream})
+            logger.debug("Transcription: %s", user_text)
             
-            response = client.models.generate_content(
-                model="models/gemini-2.5-flash",
-                contents=f"You are a Play Store app growth mentor. Be concise (1-2 sentences). User: {user_text}"
-            )
-            
-            log(f"✅ Gemini response received: '{response.text[:50]}...'")
-            log("📤 Sending response to client for speech synthesis")
-            
-            await websocket.send_json({"response": response.text})
-            log("✅ Response sent successfully\n")
+            prompt = conversation.build_prompt(INSTRUCTIONS, user_text)
+            try:
+                if stream:
+                    sentences = []
+                    async for sentence in stream_sentences(reply_chunks(prompt)):
+                        if not sentences:
+                            logger.debug("First sentence ready, client can start speaking")
+                        await websocket.send_json({"type": "sentence", "text": sentence, "index": len(sentences)})
+                        sentences.append(sentence)
+                    response_text = " ".join(sentences)
+                    await websocket.send_json({"type": "done", "response": response_text, "sentences": len(sentences)})
+                    logger.info("Reply streamed", extra={"sentences": len(sentences), "chars": len(response_text)})
+                else:
+                    # Async call: the event loop keeps running the background summary meanwhile
+                    response = await client.aio.models.generate_content(model=MODEL, contents=prompt)
+                    response_text = response.text
+                    
+                    await websocket.send_json({"response": response_text})
+                    logger.info("Reply sent", extra={"chars": len(response_text)})
+            except WebSocketDisconnect:
+                raise
+            except Exception:
+                # Streamed sentences may already be out; a terminal error frame
+                # tells the client this reply is over
+                logger.exception("Reply failed")
+                message = "Sorry, I encountered an error. Please try again in a moment."
+                await websocket.send_json({"type": "error", "response": message} if stream else {"response": message})
+                continue
+            logger.debug("Reply: %s", response_text)
+            conversation.add_turn(user_text, response_text)
             
-    except Exception as e:
-        log(f"❌ Error: {e}")
+    except WebSocketDisconnect:
+        pass
+    except Exception:
+        logger.exception("Voice agent error")
     finally:
-        log("👋 Client disconnected")
+        await conversation.aclose()
+        logger.info("Client disconnected", extra={"turns": conversation.turn_count})
@@ -0,0 +1,76 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Any, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+# Start loading heavy clients (Gemini, Firestore, review index) in the
+# background as soon as the app starts. With 0 each one loads on first use.
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "1") == "1"
+
+
+class LazyResource:
+    """
+    A value that is expensive to build (SDK imports, credentials, models).
+
+    The factory runs once, in a worker thread so the event loop keeps
+    serving, either when warm_up() kicks it off in the background or when
+    the first caller awaits get(). Concurrent callers share the one build.
+    If the factory raises, the next get() tries again.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], Any]):
+        self.name = name
+        self.factory = factory
+        self._task = None
+        self.value = None
+        self.ready = False
+        self.error = None
+        self.load_seconds = None
+
+    def warm_up(self):
+        """Starts building in the background (no-op if already started)."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._load())
+            self._task.add_done_callback(self._finished)
+
+    async def get(self):
+        if self.ready:
+            return self.value
+        self.warm_up()
+        return await asyncio.shield(self._task)
+
+    async def _load(self):
+        started = time.perf_counter()
+        value = await asyncio.to_thread(self.factory)
+        self.load_seconds = time.perf_counter() - started
+        self.value = value
+        self.ready = True
+        logger.info("%s ready in %.2fs", self.name, self.load_seconds)
+        return value
+
+    def _finished(self, task: asyncio.Task):
+        if task.cancelled():
+            self._task = None
+            return
+        error = task.exception()
+        if error is not None:
+            self.error = f"{type(error).__name__}: {str(error)[:200]}"
+            self._task = None
+            logger.warning("Failed to initialize %s: %s", self.name, error)
+        else:
+            self.error = None
+
+    def cancel(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "loading": self._task is not None and not self._task.done(),
+            "load_seconds": round(self.load_seconds, 3) if self.load_seconds is not None else None,
+            "error": self.error,
+        }
@@ -69,7 +69,8 @@ const VoiceAgentFree = () => {
             // Send to server
             if (wsRef.current && wsRef.current.readyState === WebSocket.OPEN) {
                 console.log('📤 [WEBSOCKET] Sending transcription to server...');
-                wsRef.current.send(JSON.stringify({ text: transcript }));
+                // stream: the reply arrives sentence by sentence, so speech starts after the first one
+                wsRef.current.send(JSON.stringify({ text: transcript, stream: true }));
                 console.log('✅ [WEBSOCKET] Transcription sent');
             }
         };
@@ -109,6 +110,27 @@ const VoiceAgentFree = () => {
         ws.onmessage = (event) => {
             console.log('📥 [WEBSOCKET] Received response from server');
             const data = JSON.parse(event.data);
+
+            if (data.type === 'sentence') {
+                // Speak each sentence as soon as it arrives; speechSynthesis queues them in order
+                console.log('🤖 [AI SENTENCE]:', data.text);
+                if (data.index === 0) {
+                    setStatusText("Speaking...");
+                    synthRef.current.cancel();
+                }
+                speakText(data.text, true);
+                return;
+            }
+
+            if (data.type === 'error') {
+                // The reply failed, possibly part-way: drop the sentences still queued and say why
+                console.error('❌ [AI ERROR]:', data.response);
+                setStatusText("Listening...");
+                typewriterEffect(data.response);
+                speakText(data.response);
+                return;
+            }
+
             const response = data.response;
             
             console.log('🤖 [AI RESPONSE]:', response);
@@ -117,6 +139,9 @@ const VoiceAgentFree = () => {
             // Typewriter effect for AI response
             typewriterEffect(response);
             
+            // A streamed reply has already been spoken sentence by sentence
+            if (data.type === 'done') return;
+
             console.log('🔊 [SPEECH SYNTHESIS] Starting to speak response...');
             speakText(response);
         };
@@ -178,9 +203,11 @@ const VoiceAgentFree = () => {
         }, 30); // Speed of typing (30ms per character)
     };
 
-    const speakText = (text) => {
+    const speakText = (text, queue = false) => {
         console.log('🔊 [SPEECH SYNTHESIS] Preparing to speak...');
-        synthRef.current.cancel();
+        if (!queue) {
+            synthRef.current.cancel();
+        }
         
         const utterance = new SpeechSynthesisUtterance(text);
         utterance.rate = 1.0;